@@ -427,6 +427,7 @@ class Code( _searchMixin, NBNC ):
         # Track whether the start of a routine has been encountered
         # Reset after each block transition, since routines don't cross blocks
         self._foundFirstRoutineSinceTransition = False
+        self._routinePrevLineStart = False
 
         # Zero out value counts for items counted
         num_detectors = len(self.blockDetectors)
@@ -469,6 +470,7 @@ class Code( _searchMixin, NBNC ):
         '''
         self.searching = False
         self.measuringRoutines = False
+        self._matchTemplateLines = False
         writeOutput = True
 
         if self.VERB_MEASURE == configEntry.verb:
@@ -16,6 +16,9 @@ class Depends( Code ):
     lines that have import/include statements
     '''
 
+    # Results include the file name and folder
+    CacheResults = False
+
     def __init__(self, options):
         super(Depends, self).__init__(options)
 
@@ -16,6 +16,9 @@ class DupeLines( Code ):
     '''
     Identifies duplicate lines in a file based on CRC
     '''
+    # Results include the file name and folder
+    CacheResults = False
+
     def __init__(self, options):
         super(DupeLines, self).__init__(options)
 
@@ -62,6 +62,11 @@ class NBNC( basemodule._BaseModule ):
     BLOCK_START = 0
     BLOCK_END = 1
 
+    # How lines are classified by classify_lines
+    LINE_TRUE_BLANK = 0
+    LINE_FAUX_BLANK = 1
+    LINE_MEASURE = 2
+
     # Python triple quotes are a pain to handle in python
     PYTHON_TRIPLE = '('+chr(34)+chr(34)+chr(34)+'|'+chr(39)+chr(39)+chr(39)+')'
 
@@ -137,6 +142,10 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
         # Flag whether block detection should be used in the file
         self._use_block_detection = True
 
+        # Memo for _strip_blanks_and_strings
+        self._stripSource = None
+        self._stripResult = None
+
     @classmethod
     def _cs_config_options(cls):
         return cls.ConfigOptions_NBNC
@@ -247,15 +256,80 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
         # measure rows for empty files, binaries, etc.
         return True
 
+    def line_class_signature(self):
+        '''
+        Lines are classified the same way by modules of the same class and
+        config options, regardless of the config entry's verb.
+        Classes that override the blank or block detection hooks are not
+        classified in one pass, since classify_lines doesn't call them.
+        '''
+        cls = type(self)
+        if (cls._detect_blank_line is not NBNC._detect_blank_line or
+                cls._detect_block_change is not NBNC._detect_block_change):
+            return None
+        return repr((cls.__name__, self._configOptions))
+
+    def classify_lines(self, linesToSurvey):
+        '''
+        Read and classify lines once for config entries that survey the same
+        file with modules that have the same line_class_signature. Returns
+        ClassifiedLines that are passed to process_file in place of the file,
+        so each entry only does its own measures and analysis of the lines.
+        '''
+        if linesToSurvey is None:
+            return None
+        self._survey_start([])
+        bufferLines = []
+        scanningMultiLine = False
+        for bufferLine in linesToSurvey:
+            bufferLine = utils.safe_string(bufferLine)
+            if self._alternate_line_processing(bufferLine):
+                bufferLines.append((bufferLine, None))
+                continue
+
+            lines = [bufferLine]
+            if self.addLineSep is not None:
+                lines = bufferLine.split(self.addLineSep)
+
+            lineClasses = []
+            for rawLine in lines:
+                line = self._preprocess_line(rawLine)
+                if self.reTrueBlankLine.match(line):
+                    lineClasses.append((line, self.LINE_TRUE_BLANK, False, None, None, None))
+                    continue
+
+                oldActiveBlock = None
+                if len(self.blockDetectors) > 1:
+                    blockChanged, prevBlock = self._next_block(line)
+                    if blockChanged:
+                        scanningMultiLine = False
+                        oldActiveBlock = prevBlock
+
+                onCommentLine, scanningMultiLine = self._detect_line_comment(line, scanningMultiLine)
+                stripLine = self._stripResult if self._stripSource is line else None
+
+                lineClass = self.LINE_FAUX_BLANK if self._is_blank_line(line) else self.LINE_MEASURE
+                lineClasses.append((line, lineClass, onCommentLine, stripLine,
+                        self._activeBlock, oldActiveBlock))
+
+            bufferLines.append((bufferLine, lineClasses))
+        return ClassifiedLines(bufferLines, bool(linesToSurvey))
+
     #-------------------------------------------------------------------------
 
     def _survey_start(self, _unused_params):
 
         # Track our block processing
+        self._use_block_detection = True
         self._activeBlock = 0
         self._activeBlockEndRe = None
         self._activeBlockIsSingleLine = False
 
+        # Last line stripped of blanks and strings, which is done for both
+        # comment detection and measuring the line
+        self._stripSource = None
+        self._stripResult = None
+
         # Keep track of metrics separtely for every possible block detector, so all
         # measures are collected as lists with as many slotws as block detectors
         num_detectors = len(self.blockDetectors)
@@ -287,6 +361,16 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
         if linesToSurvey is None:
             linesToSurvey = []
 
+        if isinstance(linesToSurvey, ClassifiedLines):
+            self._survey_classified_lines(linesToSurvey, analysis)
+        else:
+            self._survey_file_lines(linesToSurvey, analysis)
+
+        # Package results
+        self._survey_end(measurements, analysis)
+
+    def _survey_file_lines(self, linesToSurvey, analysis):
+
         # Track whether inside a multi-line comment - ignore nesting
         scanningMultiLine = False
 
@@ -347,8 +431,47 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
                         "Problem processing line: {} with module: {}\n{}".format(
                         str(sum(self.counts['RawLines'])), self.__class__.__name__, str(e)))
 
-        # Package results
-        self._survey_end(measurements, analysis)
+    def _survey_classified_lines(self, classifiedLines, analysis):
+        '''
+        Same processing as _survey_file_lines, with the preprocessing, block,
+        blank, and comment detection for each line taken from classify_lines
+        '''
+        for bufferLine, lineClasses in classifiedLines.bufferLines:
+            self.counts['RawLines'][self._activeBlock] += 1
+            if self._logLevel: log.file(4, "Raw: {}".format(bufferLine))
+            try:
+                if self._alternate_line_processing(bufferLine):
+                    continue
+
+                for line, lineClass, onCommentLine, stripLine, activeBlock, oldActiveBlock in lineClasses:
+                    self.counts['TotalLines'][self._activeBlock] += 1
+
+                    if lineClass == self.LINE_TRUE_BLANK:
+                        self.counts['TrueBlankLines'][self._activeBlock] += 1
+                        self._log_line(line, "T")
+                        continue
+
+                    self._activeBlock = activeBlock
+                    if oldActiveBlock is not None:
+                        self._block_change_event(line, analysis, oldActiveBlock)
+
+                    if lineClass == self.LINE_FAUX_BLANK:
+                        self.counts['FauxBlankLines'][self._activeBlock] += 1
+                        self._log_line(line, "B")
+                        continue
+
+                    if stripLine is not None:
+                        self._stripSource = line
+                        self._stripResult = stripLine
+                    self._measure_line(line, onCommentLine)
+                    self._analyze_line(line, analysis, onCommentLine)
+
+            except Exception as e:
+                log.stack()
+                if self.stopOnError:
+                    raise utils.FileMeasureError(
+                        "Problem processing line: {} with module: {}\n{}".format(
+                        str(sum(self.counts['RawLines'])), self.__class__.__name__, str(e)))
 
 
     def _survey_end(self, measurements, _unused_analysis):
@@ -399,13 +522,23 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
         If a block change happens, call _block_change_event; the analysis
         argument is to stash any information related to the block change.
         '''
+        blockChanged, oldActiveBlock = self._next_block(line)
+        if blockChanged:
+            self._block_change_event(line, analysis, oldActiveBlock)
+        return blockChanged
+
+    def _next_block(self, line):
+        '''
+        Update the active block for the line, returning whether it changed
+        and the block it changed from
+        '''
         if not self._use_block_detection:
-            return
+            return False, self._activeBlock
         if self.blockIgnoreFile and self.blockIgnoreFile in line:
             self._use_block_detection = False
-            return
+            return False, self._activeBlock
         if self.blockChangeIgnore and self.blockChangeIgnore in line:
-            return
+            return False, self._activeBlock
 
         oldActiveBlock = self._activeBlock
 
@@ -418,7 +551,7 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
                 self._activeBlockIsSingleLine = False
                 self._activeBlock = 0
                 self._activeBlockEndRe = None
-                return self._detect_block_change(line, analysis)
+                return self._next_block(line)
 
             # Otherwise, normal check for end of block
             else:
@@ -453,11 +586,7 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
                         break
                 blockNum += 1
 
-        blockChanged = oldActiveBlock != self._activeBlock
-        if blockChanged:
-            self._block_change_event(line, analysis, oldActiveBlock)
-
-        return blockChanged
+        return oldActiveBlock != self._activeBlock, oldActiveBlock
 
     def _block_change_event(self, line, analysis, oldActiveBlock):
         '''
@@ -513,16 +642,18 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
         '''
         Allows for overriding counting of "blank" line
         '''
-        if (    self.reBlankLine.match(line) or
-                (self.blankXmlLines and self.reBlankXmlLine.match(line)) or
-                (self.reBlankLineAdd and self.reBlankLineAdd.match(line))
-            ):
+        if self._is_blank_line(line):
             self.counts['FauxBlankLines'][self._activeBlock] += 1
             self._log_line(line, "B")
             return True
         else:
             return False
 
+    def _is_blank_line(self, line):
+        return bool(self.reBlankLine.match(line) or
+                (self.blankXmlLines and self.reBlankXmlLine.match(line)) or
+                (self.reBlankLineAdd and self.reBlankLineAdd.match(line)))
+
     def _measure_line(self, line, onCommentLine):
         '''
         Allow for overriding how comment and NBNC lines are captured
@@ -546,7 +677,11 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
         Remove bodies of strings as per reStringLiteral to allow for re
         measurements that won't be messed up by string content
         '''
-        return self.reStringLiteral.sub('', line).strip()
+        if line is self._stripSource:
+            return self._stripResult
+        self._stripSource = line
+        self._stripResult = self.reStringLiteral.sub('', line).strip()
+        return self._stripResult
 
     #-------------------------------------------------------------------------
     #  Prvoide debug output for tuning regular expressions
@@ -571,5 +706,22 @@ self.reStringLiteral = re.compile(r''' (["](?!["]) .+? ["]) | (['](?![']) .+? ['
         return "{}{}: {}".format(prefix, sum(self.counts["RawLines"]), line)
 
 
+class ClassifiedLines( object ):
+    '''
+    Lines of a file with how they were classified by NBNC.classify_lines
+    For each buffer line read from the file, holds a tuple for each line it
+    was split into (or None if the line was skipped) of:
+
+        (line, lineClass, onCommentLine, stripLine, activeBlock, oldActiveBlock)
+
+    oldActiveBlock is only set for the line where the active block changed.
+    '''
+    def __init__(self, bufferLines, hasLines):
+        self.bufferLines = bufferLines
+        self._hasLines = hasLines
 
+    def __bool__(self):
+        return self._hasLines
 
+    def __iter__(self):
+        return (bufferLine for bufferLine, _lineClasses in self.bufferLines)
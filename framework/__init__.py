@@ -10,15 +10,28 @@
                  |     writer.py    Writes output  
              job.py                 Core application loop in main process
     jobworker.py   \                Child processes that call csmodules
-           |       jobout.py        Main process thread that collects output    
+           |       jobout.py        Thread (or process) that collects output    
      basemodule.py                  Base implementation for csmodules
 
     folderwalk.py   Used by job.py to walk folder tree and handle filtering
       filetype.py   Shared code for determining file types
        fileext.py   Extensions to fnmatch file filtering
+      gitindex.py   Reads tracked files from a git index for folderwalk.py
+   ignorerules.py   Compiled .gitignore style rules for folderwalk.py
+       archive.py   Walking and reading zip, tar, and gzip archives as folders
+   resultcache.py   Cache of survey results reused across job runs
+     inventory.py   Inventory of files measured for incremental jobs
+    resultring.py   Shared memory rings for results from worker processes
+   measurerows.py   Compact encoding of measure rows sent from workers
+     costmodel.py   Predicts measure times to schedule work packages for job.py
+        daemon.py   Runs jobs sent by a client with warm config and workers
+        remote.py   Coordinator and agents for workers on other machines
+         merge.py   Merges output from jobs split with -shard
+    checkpoint.py   Checkpoints for resuming interrupted jobs
 
    configstack.py   Interface to and caching of config information 
    configentry.py   Represents one line in a config file 
+configregistry.py   Maps config entries to IDs sent to jobworkers
   configreader.py   Reading and parsing of config files
        modules.py   Loading and caching csmodules for configreader.py
 
@@ -44,7 +57,19 @@
     
         INPUT -- Main thread puts work packages, workers process
         OUTPUT -- Workers put results, output thread grabs them
-        CONTROL -- Used to handle errors, ctrl-c, and ensure clean shut down
+        ERROR -- Workers and output thread report errors, only the Job reads it
+
+    The Job stops workers and the output thread early by setting their
+    stop events, and sends sentinels through INPUT and OUTPUT when done.
+    When jobs are run by the daemon (daemon.py), workers and their queues
+    are kept for the next job if a job completes cleanly.
+
+    Workers can also run as threads, or inline in the main thread, using
+    the same queues (see Job.Workers). Small jobs are measured inline, since
+    starting processes costs more than the measuring, and threads are used
+    automatically on free-threaded Python builds. Remote workers are threads
+    (remote.py) that pass packages from INPUT to agents on other machines,
+    and put the agents' results in OUTPUT and ERROR.
 
                             SurveyorApplication
                          (creates)            \
@@ -52,7 +77,7 @@
                MainProcess-Job  (spawns)->  MainProcess-OutThread 
                    (put)     \              /      (get)
                      |        \            /         |
-                    INPUT     CONTROL QUEUE      OUTPUT        
+                    INPUT      ERROR QUEUE       OUTPUT        
                        \            |            /           
                       (get)         |        (put)
                         ChildProcesses-JobWorker 
@@ -112,7 +137,8 @@ def runtime_ext():
 def runtime_dir():
     '''
     Return the directory that the job is being run from
-    Surveyor does not manipulate CWD, so we assume it is accurate
+    Surveyor does not manipulate CWD (other than the daemon changing to
+    the client's folder for each job), so we assume it is accurate
     '''
     return os.path.abspath(os.getcwd())
 
@@ -0,0 +1,290 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Archive support
+
+    Zip, tar (including compressed tars), and gzip files can be measured
+    as if they were folders, without extracting them to disk. Files in an
+    archive have virtual paths that continue from the archive's path:
+
+        /src/libs/widget-1.2.tar.gz/widget/widget.py
+
+    The folder walk lists archive members into virtual folders, so config
+    file filters are applied to member names as for any other file. When
+    measured, members are streamed out of the archive and decoded as they
+    are read. Archives inside archives are not expanded.
+
+    Each worker process or thread keeps the last few archives it read open,
+    since files in the same archive are usually measured together.
+
+    The walk marks the file stats of members with their archive's path, so
+    only files it listed from archives are opened as members.
+
+    Listing a compressed tar means decompressing all of it, so tars are only
+    listed by the folder walk. The offset of each member's data is passed
+    to workers as the member's inode in its file stats, so workers open
+    members without listing the tar again. Compressed tars can only be read
+    forward, so the Job sends the members of an archive in each package in
+    archive order (see archive_order).
+'''
+
+import io
+import os
+import time
+import gzip
+import struct
+import tarfile
+import zipfile
+import threading
+import collections
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from . import utils
+
+
+ARCHIVE_ZIP = 'zip'
+ARCHIVE_TAR = 'tar'
+ARCHIVE_GZIP = 'gzip'
+
+# Longest extensions first, so '.tar.gz' is a tar, not a gzip
+ArchiveExtensions = (
+    ('.tar.gz', ARCHIVE_TAR),
+    ('.tar.bz2', ARCHIVE_TAR),
+    ('.tar.xz', ARCHIVE_TAR),
+    ('.tgz', ARCHIVE_TAR),
+    ('.tbz2', ARCHIVE_TAR),
+    ('.txz', ARCHIVE_TAR),
+    ('.tar', ARCHIVE_TAR),
+    ('.zip', ARCHIVE_ZIP),
+    ('.gz', ARCHIVE_GZIP),
+    )
+
+MAX_OPEN_ARCHIVES = 4
+
+# Tar members up to this size are read into memory when opened, since
+# seeking back in a compressed tar (e.g., to reread a file's start)
+# decompresses it again from the beginning
+MAX_BUFFERED_MEMBER_BYTES = 2**24
+MODE_REGULAR_FILE = 0o100000
+
+# Open ArchiveReaders for each thread, most recently used last
+# Archive members are streamed from the archive's file, so readers
+# can't be shared between threads
+_threadArchives = threading.local()
+
+
+def archive_type(fileName):
+    '''
+    Returns the type of archive based on file name, or None
+    '''
+    lowerName = fileName.lower()
+    for archiveExt, archiveType in ArchiveExtensions:
+        if lowerName.endswith(archiveExt) and len(lowerName) > len(archiveExt):
+            return archiveType
+    return None
+
+def is_archive(fileName):
+    return archive_type(fileName) is not None
+
+def split_archive_path(filePath, fileStats):
+    '''
+    Returns (archivePath, memberName) if the walk listed filePath from an
+    archive, otherwise (None, None)
+    Member names use '/' separators
+    '''
+    archivePath = None if fileStats is None else fileStats[utils.FILE_STAT_ARCHIVE]
+    if archivePath is None:
+        return None, None
+    return archivePath, filePath[len(archivePath):].lstrip(os.sep).replace(os.sep, '/')
+
+def open_member(archivePath, memberName, fileStats=None):
+    '''
+    Returns a binary file object that streams the member's contents
+    fileStats for the member from the folder walk are used if provided
+    Raises EnvironmentError if the member cannot be read
+    '''
+    openArchives = getattr(_threadArchives, 'openArchives', None)
+    if openArchives is None:
+        openArchives = collections.OrderedDict()
+        _threadArchives.openArchives = openArchives
+    reader = openArchives.pop(archivePath, None)
+    if reader is None:
+        reader = ArchiveReader(archivePath)
+        while len(openArchives) >= MAX_OPEN_ARCHIVES:
+            _oldPath, oldReader = openArchives.popitem(last=False)
+            oldReader.close()
+    openArchives[archivePath] = reader
+    return reader.open_member(memberName, fileStats)
+
+def open_binary(filePath, fileStats=None):
+    '''
+    Open a file or archive member for binary reading
+    '''
+    archivePath, memberName = split_archive_path(filePath, fileStats)
+    if archivePath is not None:
+        return open_member(archivePath, memberName, fileStats)
+    return open(filePath, 'rb')
+
+def archive_order(fileStats):
+    '''
+    Sort key that places members of the same archive in archive order,
+    after files that are not in archives
+    '''
+    archivePath = fileStats[utils.FILE_STAT_ARCHIVE]
+    if archivePath is None:
+        return ('', 0)
+    return (archivePath, fileStats[utils.FILE_STAT_INODE])
+
+def archive_folders(archivePath):
+    '''
+    Returns dict of folders in the archive, with '/' separated paths
+    relative to the archive as keys, and values of:
+        (list of file names, dict of ArchiveEntry by file name, set of child folder names)
+    '''
+    folders = { '': ([], {}, set([])) }
+    reader = ArchiveReader(archivePath)
+    try:
+        for memberName, memberEntry in reader.members():
+            folder, _sep, fileName = memberName.rpartition('/')
+            if folder not in folders:
+                _add_folder(folders, folder)
+            fileNames, fileEntries, _childFolders = folders[folder]
+            fileNames.append(fileName)
+            fileEntries[fileName] = memberEntry
+    finally:
+        reader.close()
+    log.file(1, "Listed {} folders from archive: {}".format(len(folders), archivePath))
+    return folders
+
+
+class ArchiveEntry( object ):
+    '''
+    Stands in for os.DirEntry for files listed from an archive
+    The inode is the offset of the member in the archive
+    '''
+    def __init__(self, name, size, mtime, offset):
+        self.name = name
+        self._size = size
+        self._mtime = mtime
+        self._offset = offset
+
+    def stat(self):
+        return os.stat_result((MODE_REGULAR_FILE, self._offset, 0, 1, 0, 0,
+                self._size, 0, self._mtime, 0))
+
+
+class ArchiveReader( object ):
+    '''
+    Open archive with members indexed by their member names
+    Member names in the archive that are not simple relative paths (e.g.,
+    './file', or with '..') are normalized
+    Tar members are only indexed when listed, since that reads the whole tar
+    '''
+    def __init__(self, archivePath):
+        self._archivePath = archivePath
+        self._archiveType = archive_type(archivePath)
+        self._archive = None
+        self._members = collections.OrderedDict()
+        self._listed = False
+        try:
+            if self._archiveType == ARCHIVE_ZIP:
+                self._archive = zipfile.ZipFile(archivePath)
+                for zipInfo in self._archive.infolist():
+                    if not zipInfo.is_dir():
+                        self._add_member(zipInfo.filename, zipInfo, zipInfo.file_size,
+                                _zip_mtime(zipInfo), zipInfo.header_offset)
+                self._listed = True
+            elif self._archiveType == ARCHIVE_TAR:
+                self._archive = tarfile.open(archivePath, 'r:*')
+            else:
+                fileName = os.path.basename(archivePath)[:-len('.gz')]
+                self._add_member(fileName, None,
+                        _gzip_size(archivePath), os.path.getmtime(archivePath), 0)
+                self._listed = True
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, ValueError) as e:
+            self.close()
+            raise IOError("Cannot read archive {}: {}".format(archivePath, str(e)))
+
+    def members(self):
+        '''
+        Returns list of (memberName, ArchiveEntry) in archive order
+        '''
+        self._list_members()
+        return [(memberName, memberEntry) for
+                    memberName, (_memberInfo, memberEntry) in self._members.items()]
+
+    def open_member(self, memberName, fileStats=None):
+        '''
+        Tar members with stats from the walk are read from their offset
+        '''
+        if self._archiveType == ARCHIVE_TAR and fileStats is not None:
+            memberInfo = tarfile.TarInfo(memberName)
+            memberInfo.size = fileStats[utils.FILE_STAT_SIZE]
+            memberInfo.offset_data = fileStats[utils.FILE_STAT_INODE]
+        else:
+            self._list_members()
+            try:
+                memberInfo, _memberEntry = self._members[memberName]
+            except KeyError:
+                raise FileNotFoundError("Not in archive {}: {}".format(self._archivePath, memberName))
+        if self._archiveType == ARCHIVE_ZIP:
+            return self._archive.open(memberInfo)
+        elif self._archiveType == ARCHIVE_TAR:
+            memberFile = self._archive.extractfile(memberInfo)
+            if memberInfo.size <= MAX_BUFFERED_MEMBER_BYTES:
+                with memberFile:
+                    return io.BytesIO(memberFile.read())
+            return memberFile
+        else:
+            return gzip.open(self._archivePath, 'rb')
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+    def _list_members(self):
+        if self._listed:
+            return
+        self._listed = True
+        try:
+            for tarInfo in self._archive.getmembers():
+                if tarInfo.isfile():
+                    self._add_member(tarInfo.name, tarInfo, tarInfo.size,
+                            tarInfo.mtime, tarInfo.offset_data)
+        except (tarfile.TarError, EOFError, ValueError) as e:
+            raise IOError("Cannot read archive {}: {}".format(self._archivePath, str(e)))
+
+    def _add_member(self, rawName, memberInfo, size, mtime, offset):
+        memberParts = [part for part in rawName.replace('\\', '/').split('/') if
+                            part and part != '.']
+        if not memberParts or '..' in memberParts:
+            log.file(1, "Skipping archive member: {}".format(rawName))
+            return
+        memberName = '/'.join(memberParts)
+        self._members[memberName] = (memberInfo,
+                ArchiveEntry(memberParts[-1], size, mtime, offset))
+
+#-----------------------------------------------------------------------------
+
+def _add_folder(folders, folder):
+    folders[folder] = ([], {}, set([]))
+    parentFolder, _sep, folderName = folder.rpartition('/')
+    if parentFolder not in folders:
+        _add_folder(folders, parentFolder)
+    folders[parentFolder][2].add(folderName)
+
+def _zip_mtime(zipInfo):
+    # Zip times are local, with no time zone
+    try:
+        return time.mktime(tuple(zipInfo.date_time) + (0, 0, -1))
+    except (OverflowError, ValueError):
+        return 0
+
+def _gzip_size(archivePath):
+    '''
+    Gzip files end with the uncompressed size, modulo 2^32
+    '''
+    with open(archivePath, 'rb') as gzipFile:
+        gzipFile.seek(-4, os.SEEK_END)
+        size, = struct.unpack('<I', gzipFile.read(4))
+    return size
@@ -25,8 +25,11 @@
 
 import re
 import os
+import time
 import filecmp
 import difflib
+import hashlib
+import inspect
 
 from code_surveyor.framework import log  # No relative path to share module globals
 from . import utils
@@ -66,6 +69,10 @@ class _BaseModule( object ):
     POS_CONFIG_PREFIX = "POSITIVE__"
     NEG_CONFIG_PREFIX = "NEGATIVE__"
 
+    # Modules whose survey results include information about the file's
+    # path (vs. just its content) must not have their results reused
+    CacheResults = True
+
     # Files in folders is based on metadate only, so process here
     SameFilesInFolderRanks = [
             ( 10, "1 to 10" ),
@@ -85,6 +92,9 @@ class _BaseModule( object ):
         'IGNORE_SIZE': (
             '''self._sizeThreshold = int(optValue)''',
             'Ignore files greater than the given byte size'),
+        'TIME_BUDGET': (
+            '''self._timeBudget = float(optValue)''',
+            'Stop measuring a file with this entry after the given CPU seconds'),
         'IGNORE_PATHS': (
             '''self._ignorePaths = eval(optValue)''',
             'List of names to ignore they appear anywhere in path (no wildcards)'),
@@ -133,6 +143,15 @@ class _BaseModule( object ):
 
         # Store this each measure call in case derived class wants to use
         self._currentPath = None
+        self._currentFileStats = None
+        self._surveyResults = None
+
+        # Start of the current measure call, kept by each module instance
+        # since workers may be threads
+        self._measureStart = None
+
+        # Options are part of the signature for reusing survey results
+        self._configOptions = list(configOptions)
 
         # Delegate that subclasses can call to add config options
         self._configOptionDict = {}
@@ -161,6 +180,7 @@ class _BaseModule( object ):
         self._forceAll = False
         self._ignorePaths = []
         self._sizeThreshold = 0
+        self._timeBudget = None
         self._metaDataOpts = {}
         self._metaDataOnly = False
         self._measureFilter = None
@@ -202,11 +222,12 @@ class _BaseModule( object ):
         return self.verbEnds.get(verb, None)
 
 
-    def open_file(self, filePath, deltaPath, existingFileHandle=None):
+    def open_file(self, filePath, deltaPath, existingFileHandle=None, fileStats=None):
         '''
         Create and return a file handle, if one matches the given criteria
         Note that fileHandle may actually just be an iterable list.
         If none is returned, only file metadata will be considered.
+        fileStats are provided if the file was stat'd during the folder walk.
         '''
         if self._metaDataOnly:
             return None
@@ -214,34 +235,30 @@ class _BaseModule( object ):
             if name in filePath:
                 return None
         if deltaPath is not None:
-            return self._get_delta_lines(filePath, deltaPath)
+            return self._get_delta_lines(filePath, deltaPath, fileStats)
         else:
-            return self._open_file(filePath, existingFileHandle)
+            return self._open_file(filePath, existingFileHandle, fileStats)
 
 
     def process_file(self, filePath, fileLines,
                         configEntry, numSameFiles,
-                        file_measured_callback):
+                        file_measured_callback, fileStats=None):
         '''
         Inherited modules use the default implementation of process_file
         to handle calling _survey and packaging results, including any
         file metadata
         '''
-        utils.timing_set('FILE_MEASURE_TIME')
+        self._measureStart = time.time()
         log.file(2, "process_file: {} {}".format(self.__class__.__name__, filePath))
         log.file(3, "  config: {}".format(str(configEntry)))
 
-        # Stash path for error handling in derived classes
-        self._currentPath = utils.SurveyorPathParser(filePath)
-
-        # Does the config measure filter need to be overridden?
-        if self._measureFilter is not None:
-            configEntry.new_measure_filter(self._measureFilter)
+        self._start_file(filePath, configEntry, fileStats)
 
         # Measurements (whole file metrics) will be stored in a dictionary
         # Pack measurement data with file metadata
         measurements = {}
         self._pack_metadata_into_measures(configEntry, numSameFiles, measurements)
+        metadataNames = set(measurements.keys())
 
         # Analysis items (per line items) are a list of dictionaries
         analysis = []
@@ -251,20 +268,19 @@ class _BaseModule( object ):
         #
         measureResults = {}
         analysisResults = []
-        if self._survey(fileLines, configEntry, measurements, analysis):
+        surveyMeasures = {}
+        surveyed = self._survey(fileLines, configEntry, measurements, analysis)
+        if surveyed:
 
             # Pack measurements that match our measure filter
-            for measureName, measure in measurements.items():
-                if self.match_measure(measureName, configEntry.measureFilters):
-                    measureResults[measureName] = measure
+            measureResults = self._filter_measures(measurements, configEntry)
+            surveyMeasures = dict([(measureName, measure) for measureName, measure in
+                                    measureResults.items() if measureName not in metadataNames])
 
             # Pack analysis items into a list of dictionaries for return to app
             # Only send analysis items that match filter
             for analysisItem in analysis:
-                analysisRow = {}
-                for itemName, itemValue in analysisItem.items():
-                    if self.match_measure(itemName, configEntry.measureFilters):
-                        analysisRow[itemName] = itemValue
+                analysisRow = self._filter_measures(analysisItem, configEntry)
                 if analysisRow:
                     analysisResults.append(analysisRow)
 
@@ -273,16 +289,90 @@ class _BaseModule( object ):
             if not fileLines and self._deltaFilePath:
                 measureResults[METADATA_DUPE_PATH] = self._deltaFilePath
 
-            # Add timing info
-            if self.match_measure(METADATA_TIMING, configEntry.measureFilters):
-                measureResults[METADATA_TIMING] = "{0:.4f}".format(utils.timing_get('FILE_MEASURE_TIME'))
+            self._add_timing(configEntry, measureResults)
 
-        self._currentPath = None
-        self._deltaFilePath = None
+        # Results that do not depend on the file's path can be cached
+        self._surveyResults = (surveyed, surveyMeasures, analysisResults)
+
+        self._end_file()
 
         # Send data back to the caller (jobworker.Worker in default framework)
         file_measured_callback(filePath, measureResults, analysisResults)
 
+    def process_cached_file(self, filePath, surveyResults,
+                        configEntry, numSameFiles,
+                        file_measured_callback, fileStats=None):
+        '''
+        Provides results from a previous process_file call on the same file
+        content, as returned by survey_results, without surveying the file
+        File metadata is packed for the current file path
+        '''
+        self._measureStart = time.time()
+        log.file(2, "process_cached_file: {} {}".format(self.__class__.__name__, filePath))
+        self._start_file(filePath, configEntry, fileStats)
+
+        surveyed, surveyMeasures, analysisResults = surveyResults
+        measureResults = {}
+        if surveyed:
+            measurements = {}
+            self._pack_metadata_into_measures(configEntry, numSameFiles, measurements)
+            measureResults = self._filter_measures(measurements, configEntry)
+            measureResults.update(surveyMeasures)
+            self._add_timing(configEntry, measureResults)
+
+        self._end_file()
+        file_measured_callback(filePath, measureResults, analysisResults)
+
+    def survey_signature(self, configEntry):
+        '''
+        Returns string identifying everything other than file content that
+        determines the results of surveying a file with configEntry, or None
+        if results for this module cannot be reused for other files
+        '''
+        if not self.CacheResults or self._ignorePaths:
+            return None
+        return self.config_signature(configEntry)
+
+    def config_signature(self, configEntry):
+        '''
+        Returns string identifying the module code and configuration used
+        to measure files with configEntry
+        '''
+        return repr((
+                self.__class__.__name__,
+                _module_version(self.__class__),
+                self._configOptions,
+                configEntry.verb,
+                configEntry.moduleName,
+                configEntry.measureFilter,
+                configEntry.tags,
+                configEntry.options,
+                configEntry.paramsRaw,
+                ))
+
+    def line_class_signature(self):
+        '''
+        Returns string identifying how the module classifies lines, so
+        config entries for the same file whose modules have the same
+        signature can share one pass that reads and classifies its lines
+        (see classify_lines in csmodules/NBNC.py), or None if they can't
+        '''
+        return None
+
+    def time_budget(self):
+        '''
+        CPU seconds allowed for measuring a file with this config entry,
+        or None if there is no limit
+        '''
+        return self._timeBudget
+
+    def survey_results(self):
+        '''
+        Returns the path-independent results of the last process_file call,
+        which can be passed to process_cached_file for the same file content
+        '''
+        return self._surveyResults
+
     def match_measure(self, measureName, measureFilters):
         '''
         Used to both validate config and to filter results
@@ -315,16 +405,42 @@ class _BaseModule( object ):
 
     #-------------------------------------------------------------------------
 
-    def _open_file(self, filePath, existingFile=None):
+    def _start_file(self, filePath, configEntry, fileStats):
+
+        # Stash path for error handling in derived classes
+        self._currentPath = utils.SurveyorPathParser(filePath)
+        self._currentFileStats = fileStats
+
+        # Does the config measure filter need to be overridden?
+        if self._measureFilter is not None:
+            configEntry.new_measure_filter(self._measureFilter)
+
+    def _end_file(self):
+        self._currentPath = None
+        self._currentFileStats = None
+        self._deltaFilePath = None
+
+    def _filter_measures(self, measures, configEntry):
+        filteredMeasures = {}
+        for measureName, measure in measures.items():
+            if self.match_measure(measureName, configEntry.measureFilters):
+                filteredMeasures[measureName] = measure
+        return filteredMeasures
+
+    def _add_timing(self, configEntry, measureResults):
+        if self.match_measure(METADATA_TIMING, configEntry.measureFilters):
+            measureResults[METADATA_TIMING] = "{0:.4f}".format(time.time() - self._measureStart)
+
+    def _open_file(self, filePath, existingFile=None, fileStats=None):
         '''
         Return fileObject if criteria are met
         Delegates reusing existing file handles to avoid overhead of 
         file open when many measures run on the same file. 
         '''
         return open_file_for_survey(filePath, existingFile, self._forceAll,
-                                    self._sizeThreshold)
+                                    self._sizeThreshold, fileStats)
 
-    def _get_delta_lines(self, filePath, deltaFilePath):
+    def _get_delta_lines(self, filePath, deltaFilePath, fileStats=None):
         '''
         Return a line buffer that represents additional lines relative to the
         delta path. We are not doing a full diff, only taking into account new
@@ -335,11 +451,11 @@ class _BaseModule( object ):
         # If no correpsonding file exists in delta, do a normal file open
         if not os.path.exists(deltaFilePath):
             log.file(1, "Delta file doesn't exist for: {}".format(deltaFilePath))
-            deltaLines = self._open_file(filePath)
+            deltaLines = self._open_file(filePath, None, fileStats)
 
         # Only do a diff if there is an identical file name that has been modified
         elif not filecmp.cmp(deltaFilePath, filePath):
-            fileToMeasure = self._open_file(filePath)
+            fileToMeasure = self._open_file(filePath, None, fileStats)
             if fileToMeasure is not None:
                 measureFileLines = fileToMeasure.readlines()
                 fileToMeasure.close()
@@ -384,7 +500,8 @@ class _BaseModule( object ):
                     if len(optValue) > 1:
                         suffix = str(dateCol)
                     measures[METADATA_FILEDATE + suffix] = (
-                            utils.get_file_mod_time_str(self._currentPath.filePath, dateCol))
+                            utils.get_file_mod_time_str(self._currentPath.filePath, dateCol,
+                                    self._currentFileStats))
 
             elif optKey in ('FOLDER'):
                 measures[METADATA_DIRFILES] = numSameFiles
@@ -398,7 +515,8 @@ class _BaseModule( object ):
                 measures[METADATA_ABSPATH] = os.path.abspath(self._currentPath.filePath)
 
             if optKey in ('SIZE', 'DUPE'):
-                measures[METADATA_FILESIZE] = utils.get_file_size(self._currentPath.filePath)
+                measures[METADATA_FILESIZE] = utils.get_file_size(
+                        self._currentPath.filePath, self._currentFileStats)
 
             if optKey in ('FULLNAME', 'DUPE'):
                 measures[METADATA_FULLNAME] = self._currentPath.fileName
@@ -408,6 +526,24 @@ class _BaseModule( object ):
 
 #-----------------------------------------------------------------------------
 
+# Version of each csmodule class, based on the source of the class and its
+# bases, so changes to csmodule code invalidate cached results
+_moduleVersions = {}
+
+def _module_version(moduleClass):
+    try:
+        return _moduleVersions[moduleClass]
+    except KeyError:
+        versionHash = hashlib.sha1()
+        for baseClass in moduleClass.__mro__:
+            try:
+                with open(inspect.getsourcefile(baseClass), 'rb') as sourceFile:
+                    versionHash.update(sourceFile.read())
+            except (TypeError, EnvironmentError):
+                pass
+        _moduleVersions[moduleClass] = versionHash.hexdigest()
+        return _moduleVersions[moduleClass]
+
 def _compare_filters(filter1, filter2):
     match = (filter1 == filter2 or
             _compare_wildcards(filter1, filter2) or
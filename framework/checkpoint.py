@@ -0,0 +1,114 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    JobCheckpoint
+    Checkpoints of a job's progress, so an interrupted job can be resumed
+
+    A checkpoint holds the files that have been measured and written to
+    output, and the application's state for the job at that point: summary
+    and aggregate totals, and the writer's columns and size of each output
+    file. Both are saved in one transaction from the output thread, between
+    files, so they always agree with each other and the output files.
+
+    On resume, output files are cut back to their size at the checkpoint
+    and appended to, and the Job skips files that were completed. The folder
+    tree is walked again, since config files are read as folders are walked,
+    but only files that were not completed are measured.
+
+    Files with errors are not recorded as complete, so they are measured
+    again on resume.
+'''
+
+import os
+import time
+import pickle
+import sqlite3
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from . import utils
+from .uistrings import *
+
+
+CHECKPOINT_FILE_NAME = 'surveyor.checkpoint'
+CHECKPOINT_DB_TIMEOUT = 30.0
+
+# Default time between checkpoints
+DEFAULT_CHECKPOINT_SECONDS = 60
+
+
+class JobCheckpoint( object ):
+    '''
+    The jobKey identifies the job (e.g., its folder and arguments), so
+    a checkpoint is only resumed by the same job
+    '''
+    def __init__(self, checkpointFolder, jobKey, seconds=DEFAULT_CHECKPOINT_SECONDS):
+        self._checkpointPath = os.path.join(checkpointFolder, CHECKPOINT_FILE_NAME)
+        self._jobKey = jobKey
+        self._seconds = seconds
+        self._lastSave = None
+        self._db = None
+
+        # Files completed since the last checkpoint
+        self._completed = []
+
+    def open(self, resume):
+        '''
+        Returns the state saved with the checkpoint if resuming, otherwise
+        a prior checkpoint is discarded and None is returned
+        '''
+        if not resume and os.path.exists(self._checkpointPath):
+            log.msg(1, "Removing prior checkpoint: {}".format(self._checkpointPath))
+            os.remove(self._checkpointPath)
+        elif resume and not os.path.exists(self._checkpointPath):
+            raise utils.InputException(STR_ErrorNoCheckpoint.format(self._checkpointPath))
+        self._db = sqlite3.connect(self._checkpointPath,
+                        timeout=CHECKPOINT_DB_TIMEOUT, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY)')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS job (
+                id INTEGER PRIMARY KEY, jobKey TEXT, state BLOB)''')
+        self._db.commit()
+        self._lastSave = time.time()
+        log.msg(1, "Opened checkpoint: {}".format(self._checkpointPath))
+
+        if not resume:
+            return None
+        row = self._db.execute('SELECT jobKey, state FROM job WHERE id = 0').fetchone()
+        if row is None:
+            raise utils.InputException(STR_ErrorNoCheckpoint.format(self._checkpointPath))
+        jobKey, state = row
+        if jobKey != self._jobKey:
+            raise utils.InputException(STR_ErrorCheckpointJob.format(self._checkpointPath))
+        return pickle.loads(state)
+
+    def completed_files(self):
+        return set(row[0] for row in self._db.execute('SELECT path FROM files'))
+
+    def file_completed(self, filePath):
+        self._completed.append((filePath,))
+
+    def due(self):
+        return time.time() - self._lastSave >= self._seconds
+
+    def save(self, state):
+        '''
+        Called from the output thread once output for completed files
+        has been flushed
+        '''
+        self._db.executemany('INSERT OR IGNORE INTO files VALUES (?)', self._completed)
+        self._db.execute('INSERT OR REPLACE INTO job VALUES (0, ?, ?)', (
+                self._jobKey, pickle.dumps(state, pickle.HIGHEST_PROTOCOL)))
+        self._db.commit()
+        log.msg(1, "Checkpoint saved with {} new files".format(len(self._completed)))
+        self._completed = []
+        self._lastSave = time.time()
+
+    def close(self, jobComplete):
+        '''
+        The checkpoint is removed once the job it is for completes
+        '''
+        if self._db is None:
+            return
+        self._db.close()
+        self._db = None
+        if jobComplete:
+            os.remove(self._checkpointPath)
+            log.msg(1, "Removed checkpoint: {}".format(self._checkpointPath))
@@ -20,6 +20,7 @@ from . import runtime_dir
 from . import runtime_ext
 from . import job
 from . import writer
+from . import checkpoint
 from . import filetype
 from . import basemodule
 from . import configstack
@@ -50,6 +51,8 @@ class SurveyorCmdLine( object ):
     behavior for dupes and aggregate processing.
     Each instantiation equals one measurement run, with the main file scanning
     and processing delegated to the Job
+    When run by the survey daemon, the ConfigStack and workers for the job
+    are provided by the daemon.
     '''
 
     # The following lists have dependencies on csmodule defined names, to provide
@@ -88,7 +91,7 @@ class SurveyorCmdLine( object ):
             'fileType', 'fileName', 'fileAbsPath', 'dir', 'tag', 'nbnc.crc',
             'dupe.nbnc', 'dupe.fileName', 'dupe.firstPath', 'dupe.dir' ])
 
-    def __init__(self):
+    def __init__(self, daemon=None):
         utils.timing_start()
         utils.timing_set('LAST_DISPLAY_TIME')
 
@@ -97,9 +100,11 @@ class SurveyorCmdLine( object ):
         self.set_logging(0)
 
         # Objects we create and delegate to
+        self._daemon = daemon
         self._args = None
         self._job = None
         self._writer = None
+        self._checkpoint = None
         self._out = None
 
         # Options (stay constant for life of a job)
@@ -125,6 +130,13 @@ class SurveyorCmdLine( object ):
         self._progress = False
         self._quiet = False
 
+        self._checkpointSeconds = None
+        self._resume = False
+
+        # With an output process, file callbacks are made in a copy of us
+        # in that process, which passes its state back to our process
+        self._appPid = os.getpid()
+
         self._profiling = False
         self._profileCalls = 16
         self._profileCalledBy = 4
@@ -196,8 +208,10 @@ class SurveyorCmdLine( object ):
     #  Job exceution and error handling
 
     def _execute_job(self):
+        self._check_job_options()
+        writerState = self._open_checkpoint()
         self._setup_job()
-        self._initialize_output()
+        self._initialize_output(writerState)
         self._job.run()
         self._write_aggregates()
 
@@ -228,18 +242,84 @@ class SurveyorCmdLine( object ):
         Creates the ConfigStack and Job objects for this job
         Assummes internal state already set by command line parsing
         '''
-        configStack = configstack.ConfigStack(
-                self._args.configCustom,
-                self._args.configOverrides,
-                self._args.config_option_list()
-                )
+        if self._daemon is not None:
+            configStack = self._daemon.config_stack(
+                    self._args.configCustom,
+                    self._args.configOverrides,
+                    self._args.config_option_list()
+                    )
+            workers = self._daemon.workers(self._jobOpt)
+        else:
+            configStack = configstack.ConfigStack(
+                    self._args.configCustom,
+                    self._args.configOverrides,
+                    self._args.config_option_list()
+                    )
+            workers = None
         self._job = job.Job(
                 configStack,
                 self._jobOpt,
                 self.file_measured_callback,
-                self.status_callback)
-
-    def _initialize_output(self):
+                self.status_callback,
+                workers,
+                self.output_state_callback,
+                self.set_output_state_callback)
+
+    def _check_job_options(self):
+        '''
+        Options that can't be used together are rejected before anything,
+        such as a prior checkpoint, is changed
+        '''
+        if self._jobOpt.outputProcess and (self._checkpointSeconds is not None or
+                self._resume or self._jobOpt.inventoryFolder is not None):
+            raise utils.InputException(STR_ErrorOutProcess)
+
+    def _open_checkpoint(self):
+        '''
+        If checkpointing, the job skips files completed before the checkpoint
+        being resumed, and our state is restored from the checkpoint
+        Returns the writer's state to resume, if any
+        '''
+        if self._resume and self._checkpointSeconds is None:
+            self._checkpointSeconds = checkpoint.DEFAULT_CHECKPOINT_SECONDS
+        if self._checkpointSeconds is None:
+            return None
+        if self._outFileName is None or self._outType == CMDARG_OUTPUT_TYPE_XML:
+            raise utils.InputException(STR_ErrorCheckpointOutput)
+        jobKey = repr((os.path.abspath(os.getcwd()), self._args.jobArgs))
+        jobCheckpoint = checkpoint.JobCheckpoint(
+                self._outFileDir, jobKey, self._checkpointSeconds)
+        checkpointState = jobCheckpoint.open(self._resume)
+        self._checkpoint = jobCheckpoint
+        if checkpointState is None:
+            return None
+        self._jobOpt.completedFiles = self._checkpoint.completed_files()
+        (   self._totals,
+            self._aggregates,
+            self._dupeFileSurveys,
+            self._numFilesMeasured,
+            self._numFilesProcessed,
+            self._numMeasures,
+            writerState
+            ) = checkpointState
+        self.status_callback(STR_Resuming.format(len(self._jobOpt.completedFiles)))
+        return writerState
+
+    def _save_checkpoint(self):
+        '''
+        Called from the output thread between files
+        '''
+        self._checkpoint.save((
+                self._totals,
+                self._aggregates,
+                self._dupeFileSurveys,
+                self._numFilesMeasured,
+                self._numFilesProcessed,
+                self._numMeasures,
+                self._writer.checkpoint_state()
+                ))
+
+    def _initialize_output(self, writerState=None):
         # Do not run display meter if doing heavy debug output
         self._quiet = self._quiet or (
                         log.out() == sys.stdout and log.level() > 2)
@@ -267,13 +347,24 @@ class SurveyorCmdLine( object ):
                 self.ItemColumnOrder)
         if self._writer.using_console():
             self._quiet = True
+        if writerState is not None:
+            self._writer.resume_state(writerState)
 
     def _cleanup(self):
+        jobComplete = (self._job is not None and self._job.complete and
+                self._keyboardInterrupt is None and self._finalException is None)
         if self._writer is not None:
-            self._writer.close_files()
+            if self._checkpoint is not None and not jobComplete:
+                self._writer.suspend_files()
+            else:
+                self._writer.close_files()
+        if self._checkpoint is not None:
+            self._checkpoint.close(jobComplete)
         self._display_profile_info()
         if self._keyboardInterrupt is not None:
             self._print(STR_UserInterrupt)
+        if self._checkpoint is not None and not jobComplete:
+            self._print(STR_CheckpointResume)
         if self._finalException is not None:
             exc = self._finalException
             # Don't use log or print output here to avoid more errors
@@ -294,7 +385,12 @@ class SurveyorCmdLine( object ):
         A list of output and potential errors is provided for each file.
         Called ONCE for each file in the job; if there were multiple
         config entries for the file, outputList will have multiple items.
+        Files without output or errors are only recorded as completed.
         '''
+        if not outputList and not errorList:
+            self._file_completed(filePath, True)
+            return
+
         self._numFilesProcessed += 1
         self._errorList.extend(errorList)
 
@@ -323,6 +419,51 @@ class SurveyorCmdLine( object ):
         self._display_file_progress(filePath, fileTime)
         self._display_feedback()
 
+        self._file_completed(filePath, not errorList)
+
+    def _file_completed(self, filePath, completed):
+        '''
+        Files with errors are not recorded, so they are measured on resume
+        '''
+        if self._checkpoint is not None:
+            if completed:
+                self._checkpoint.file_completed(filePath)
+            if self._checkpoint.due():
+                self._save_checkpoint()
+
+    def output_state_callback(self, finished):
+        '''
+        Called in the output process after each package, for progress, and
+        when output is finished, when files are closed and all of the state
+        kept from file callbacks is returned
+        '''
+        if not finished:
+            return (self._numFilesProcessed, self._numFilesMeasured)
+        self._writer.close_files()
+        return (self._numFilesProcessed,
+                self._numFilesMeasured,
+                self._numMeasures,
+                self._errorList,
+                self._totals,
+                self._aggregates,
+                self._dupeFileSurveys)
+
+    def set_output_state_callback(self, outputState, finished):
+        '''
+        Output process state is received by the Job's output link thread
+        '''
+        if not finished:
+            (self._numFilesProcessed, self._numFilesMeasured) = outputState
+        else:
+            (   self._numFilesProcessed,
+                self._numFilesMeasured,
+                self._numMeasures,
+                self._errorList,
+                self._totals,
+                self._aggregates,
+                self._dupeFileSurveys
+                ) = outputState
+
     def status_callback(self, outputText = None):
         '''
         General callback for updating UI of the application
@@ -666,7 +807,10 @@ class SurveyorCmdLine( object ):
         '''
         Called during run to display total at bottom of shell screen
         '''
-        if self._quiet or self._progress:
+        # The output process doesn't have the Job's counts to display, and
+        # the Job can report status while it is being created
+        if (self._quiet or self._progress or os.getpid() != self._appPid or
+                self._job is None):
             return
         timeSinceLastDisplay = utils.timing_get('LAST_DISPLAY_TIME')
         if timeSinceLastDisplay > MIN_DISPLAY_INTERVAL:
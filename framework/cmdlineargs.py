@@ -11,10 +11,14 @@
 '''
 
 import os
+import re
 import sys
 
 from code_surveyor.framework import log  # No relative path to share module globals
 from . import surveyor_dir
+from . import job
+from . import remote
+from . import checkpoint
 from . import utils
 from .uistrings import *
 
@@ -37,7 +41,10 @@ IGNORE_SIZE_DEFAULT = 5000000
 # Put max limits on things that don't strictly need limits,
 # but which are silly if left unchecked
 MAX_WORKERS = 256
+MAX_WALK_THREADS = 256
 MAX_PATH_DEPTH = 128
+MAX_TIME_BUDGET = 86400
+MAX_CHECKPOINT_SECONDS = 86400
 
 # Default skipping of folders and files with '.' prefix
 DefaultSkip = {
@@ -45,6 +52,25 @@ DefaultSkip = {
     'Files': ['.*'],
     }
 
+# Values for how to run workers, used with -w
+WorkerBackends = [
+    job.BACKEND_AUTO,
+    job.BACKEND_PROCESSES,
+    job.BACKEND_THREADS,
+    job.BACKEND_INLINE,
+    job.BACKEND_REMOTE,
+    ]
+
+# Number of workers and how to run them, e.g., 4, 4:threads, or :inline
+# The type is joined to the number so a path can't be taken for a type
+WORKERS_RE = re.compile(r'^(?=\d|:)(\d*)(?::(\w+))?$')
+
+# Address a coordinator listens on for remote agents, e.g., :7070 or host:7070
+REMOTE_ADDRESS_RE = re.compile(r'^[\w.\-]*:\d+$')
+
+# Shard of the files to measure, e.g., 2/4 for the second of four
+SHARD_RE = re.compile(r'^(\d+)/(\d+)$')
+
 # Used with the -a and -ad options
 MeasureAll = [("MeasureAll", 'measure NBNC file.* *')]
 MeasureCode = [("MeasureCode", 'measure Code * * OPT:MEASURE_EMPTIES')]
@@ -56,17 +82,22 @@ class SurveyorCmdLineArgs( object ):
         self.args = Args(cmdArgs, CMDARG_LEADS)
 
         self._app = surveyorApp
-        self._app._jobOpt.skipFolders = DefaultSkip['Folders']
-        self._app._jobOpt.skipFiles = DefaultSkip['Files']               
+        self._app._jobOpt.skipFolders = list(DefaultSkip['Folders'])
+        self._app._jobOpt.skipFiles = list(DefaultSkip['Files'])             
 
         # Config options to provide back to the application
         self.configCustom = None
         self.configOverrides = []
         self.ignoreSize = 0
 
+        # Checkpoint options are not part of the job's identity, since
+        # the same job is run again with --resume
+        self.jobArgs = []
+        self._checkpointArgPositions = set()
+
         # Config options to provide final state to config options
         self._forceAll = False
-        self._metaDataOptions = DefaultMetadata
+        self._metaDataOptions = dict(DefaultMetadata)
         self._measureFilter = None
         self._inclDeletedLines = False
 
@@ -94,6 +125,12 @@ class SurveyorCmdLineArgs( object ):
                     self._parse_measurement_path()
                     continue
 
+                # Long options are matched on their whole name
+                if self.args.get_current().startswith(CMDARG_LONG_LEADS):
+                    if not self._parse_long_option():
+                        return self._parse_help_options()
+                    continue
+
                 # Our processing is based on matching first character
                 fc = self.args.get_current()[1].lower()
 
@@ -161,9 +198,21 @@ class SurveyorCmdLineArgs( object ):
 
                 # Other options
                 elif fc in CMDARG_NUM_WORKERS:
-                    self._app._jobOpt.numWorkers = self._get_next_int(validRange=range(1,MAX_WORKERS))
+                    self._parse_worker_options()
+                elif fc in CMDARG_INCREMENTAL:
+                    self._app._jobOpt.inventoryFolder = self._get_next_param()
+                elif fc in CMDARG_RESULT_CACHE:
+                    self._app._jobOpt.resultCacheFolder = self._get_next_param()
+                    self._app._jobOpt.resultCacheMaxMb = self._get_next_int(
+                            optional=True, default=self._app._jobOpt.resultCacheMaxMb)
+                elif fc in CMDARG_WALK_THREADS:
+                    self._app._jobOpt.walkThreads = self._get_next_int(validRange=range(1,MAX_WALK_THREADS))
                 elif fc in CMDARG_RECURSION:
                     self._app._jobOpt.recursive = False
+                elif fc in CMDARG_GIT_INDEX:
+                    self._app._jobOpt.useGitIndex = True
+                elif fc in CMDARG_ARCHIVES:
+                    self._app._jobOpt.expandArchives = True
                 elif fc in CMDARG_BREAK_ERROR:
                     self._app._jobOpt.breakOnError = True
                 elif fc in CMDARG_AGGREGATES:
@@ -181,6 +230,9 @@ class SurveyorCmdLineArgs( object ):
             if not self.configOverrides and self.configCustom is None:
                 self.configCustom = CONFIG_FILE_DEFAULT_NAME
 
+            self.jobArgs = [arg for pos, arg in enumerate(self.args.argList)
+                                if pos > 0 and pos not in self._checkpointArgPositions]
+
 
         except Args.ArgsFinishedException as e:
             raise utils.InputException(STR_ErrorParsingEnd.format(str(e)))
@@ -359,6 +411,13 @@ class SurveyorCmdLineArgs( object ):
                 self._app._jobOpt.skipFiles.extend(self._get_next_param().split(CMDLINE_SEPARATOR))
             elif skipOpt in CMDARG_SKIP_SIZE:
                 self.ignoreSize = self._get_next_int()
+            elif skipOpt in CMDARG_SKIP_IGNORE_FILES:
+                self._app._jobOpt.useIgnoreFiles = True
+            elif skipOpt in CMDARG_SKIP_TIME:
+                self._app._jobOpt.fileTimeBudget = self._get_next_int(
+                        validRange=range(1, MAX_TIME_BUDGET))
+            elif skipOpt in CMDARG_SKIP_SHARD:
+                self._app._jobOpt.shard = self._get_next_shard()
 
     def _parse_aggregate_options(self):
         '''
@@ -406,6 +465,58 @@ class SurveyorCmdLineArgs( object ):
         elif fc in CMDARG_METADATA_MAXDEPTH:
             self._metaDataOptions['DIRS'] = self._get_next_int(validRange=range(0, MAX_PATH_DEPTH))
 
+    def _parse_long_option(self):
+        '''
+        Returns False if the option isn't recognized
+        '''
+        optionPos = self.args.argPos
+        longOpt = self.args.get_current()[len(CMDARG_LONG_LEADS):].lower()
+        if longOpt == CMDARG_LONG_CHECKPOINT:
+            self._app._checkpointSeconds = self._get_next_int(optional=True,
+                    default=checkpoint.DEFAULT_CHECKPOINT_SECONDS,
+                    validRange=range(1, MAX_CHECKPOINT_SECONDS))
+        elif longOpt == CMDARG_LONG_RESUME:
+            self._app._resume = True
+        elif longOpt == CMDARG_LONG_OUT_PROCESS:
+            self._app._jobOpt.outputProcess = True
+            return True
+        else:
+            return False
+        self._checkpointArgPositions.update(range(optionPos, self.args.argPos + 1))
+        return True
+
+    def _parse_worker_options(self):
+        '''
+        Number of workers, how to run them, or both, given as num, :type,
+        or num:type
+        Remote workers take an optional host:port to listen on for agents
+        '''
+        optionName = self.args.get_current()
+        if not self.args.is_param_next():
+            raise utils.InputException(STR_ErrorParsingInt.format(optionName))
+        match = WORKERS_RE.match(self.args.get_next())
+        if match is None:
+            raise utils.InputException(STR_ErrorParsingValidValue.format(
+                    self.args.get_next(), optionName))
+        self.args.move_next()
+        numWorkers, backend = match.groups()
+        if numWorkers:
+            numWorkers = int(numWorkers)
+            if numWorkers not in range(1, MAX_WORKERS):
+                raise utils.InputException(STR_ErrorParsingValidValue.format(
+                        numWorkers, optionName))
+            self._app._jobOpt.numWorkers = numWorkers
+        if backend is not None:
+            backend = backend.lower()
+            if backend not in WorkerBackends:
+                raise utils.InputException(STR_ErrorParsingValidValue.format(
+                        backend, optionName))
+            self._app._jobOpt.backend = backend
+            if (backend == job.BACKEND_REMOTE and
+                    self.args.is_param_next() and
+                    REMOTE_ADDRESS_RE.match(self.args.get_next())):
+                self._app._jobOpt.remoteAddress = remote.parse_address(self._get_next_str())
+
     def _parse_debug_options(self):
         '''
         Decode optional level, modes, and output display length
@@ -485,6 +596,19 @@ class SurveyorCmdLineArgs( object ):
         nextStr = self._get_next_param(optional, default)
         return str(nextStr) if nextStr else None
 
+    def _get_next_shard(self):
+        '''
+        Shards are numbered from 1 to the number of shards
+        '''
+        shardStr = self._get_next_str()
+        match = SHARD_RE.match(shardStr)
+        if match is None:
+            raise utils.InputException(STR_ErrorParsingShard.format(shardStr))
+        shardNum, numShards = int(match.group(1)), int(match.group(2))
+        if not 1 <= shardNum <= numShards:
+            raise utils.InputException(STR_ErrorParsingShard.format(shardStr))
+        return shardNum, numShards
+
     def _get_next_int(self, default=None, validRange=None, optional=False):
         '''
         Special case for int params, we only consume if the value is an int
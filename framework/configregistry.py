@@ -0,0 +1,93 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    ConfigRegistry
+    Maps config entries to small integer IDs for sending work to workers
+
+    ConfigEntry objects hold csmodule instances with many compiled regexes,
+    which are expensive to pickle and unpickle. Instead of placing entries
+    in every work item, the Job registers each entry once and sends it to
+    each worker once; work items then refer to entries by ID.
+'''
+
+from code_surveyor.framework import log  # No relative path to share module globals
+
+
+class ConfigRegistry( object ):
+    '''
+    The Job registers entries as the folder walk encounters them, and each
+    worker holds its own copy that is filled as entries are received.
+    IDs are positions in the entry list, so are only valid for the workers
+    the entries were sent to (which may be kept running for many jobs).
+    Entries no longer used are dropped between jobs with retain, and their
+    IDs are given to new entries.
+    '''
+    def __init__(self):
+        self._entries = []
+        self._freeIds = []
+
+        # Lookup of entry IDs by object identity; the ConfigStack caches
+        # entries for the life of the job, and entries are held here, so
+        # identity is stable
+        self._entryIds = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def register(self, configEntrys):
+        '''
+        Returns tuple of IDs for the configEntrys, along with a list of
+        (ID, ConfigEntry) tuples for any entries not seen before
+        '''
+        entryIds = []
+        newEntries = []
+        for configEntry in configEntrys:
+            try:
+                entryId = self._entryIds[id(configEntry)]
+            except KeyError:
+                if self._freeIds:
+                    entryId = self._freeIds.pop()
+                    self._entries[entryId] = configEntry
+                else:
+                    entryId = len(self._entries)
+                    self._entries.append(configEntry)
+                self._entryIds[id(configEntry)] = entryId
+                newEntries.append((entryId, configEntry))
+                log.config(2, "Registered config {}: {}".format(entryId, configEntry))
+            entryIds.append(entryId)
+        return tuple(entryIds), newEntries
+
+    def retain(self, liveEntries):
+        '''
+        Drop entries that are not in liveEntries, returning (ID, None)
+        tuples that drop the entries from copies of the registry
+        '''
+        liveIds = set(id(configEntry) for configEntry in liveEntries)
+        droppedEntries = []
+        for entryId, configEntry in enumerate(self._entries):
+            if configEntry is not None and id(configEntry) not in liveIds:
+                del self._entryIds[id(configEntry)]
+                self._entries[entryId] = None
+                self._freeIds.append(entryId)
+                droppedEntries.append((entryId, None))
+        if droppedEntries:
+            log.config(1, "Dropped {} config entries".format(len(droppedEntries)))
+        return droppedEntries
+
+    def add(self, newEntries):
+        '''
+        Add (ID, ConfigEntry) tuples provided by register or retain in
+        another process
+        '''
+        for entryId, configEntry in newEntries:
+            while len(self._entries) <= entryId:
+                self._entries.append(None)
+            self._entries[entryId] = configEntry
+
+    def get(self, entryId):
+        '''
+        Returns the entry for the ID, or None if it has not been added yet
+        '''
+        try:
+            return self._entries[entryId]
+        except IndexError:
+            return None
@@ -5,6 +5,7 @@
 '''
 
 import os
+import collections
 
 from code_surveyor.framework import log  # No relative path to share module globals
 from . import surveyor_dir
@@ -17,6 +18,10 @@ from . import utils
 from .modules import CodeSurveyorModules
 
 
+# Most recently used folders whose active config is memoized
+MAX_FOLDER_CONFIGS = 4096
+
+
 def config_items_for_file(configEntrys, fileName):
     '''
     Return a list of config items that match the given fileName
@@ -46,23 +51,48 @@ def config_items_for_file(configEntrys, fileName):
 class ConfigStack( object ):
     '''
     Maintains config file information during Surveyor job run
-    The stack stores lists of entries from a config file, indexed using the
-    full path. On startup read in any default config files and then during 
-    tree traversal to load any other config files.
+    On startup read in any default config files and then during tree
+    traversal load any other config files.
+    Config files found during traversal are kept in a trie of folder path
+    components, so the config that applies to a folder is the deepest one
+    on the path to the folder, found in O(depth) of the folder. The active
+    config for recently used folders is memoized.
     '''
+    class ConfigNode( object ):
+        '''
+        Trie node for one folder path component
+        configEntry is (path, fileFilters, configItems) if the folder
+        has a config file
+        '''
+        def __init__(self):
+            self.children = {}
+            self.configEntry = None
+
     def __init__(self, configFileName, configOverrides, defaultConfigOptions=[]):
         log.config(2, "Creating ConfigStack with {}".format(configFileName))
         self._modules = CodeSurveyorModules()
         self._reader = configreader.ConfigReader(self.load_csmodule)
         self._measureRootDir = ''
 
-        # Stack of config files, represented as paths and lists of ConfigEntrys
-        self._configStack = []
+        # Default config files, represented as paths and lists of ConfigEntrys
+        # The last one pushed is the default for the job
+        self._defaultConfigs = []
+
+        # Trie of config files found in folders, and the active config
+        # entry for recently checked folders, by absolute folder path
+        self._configTrie = self.ConfigNode()
+        self._folderConfigs = collections.OrderedDict()
+        self._activeConfig = None
 
         # Cache of config file information
-        # Key is path name, value is list entries that represent the config file
+        # Key is path name, value is the file's size and modified time,
+        # and the list of entries that represent the config file
         self._configFileCache = {}
 
+        # Cache of compiled file filters for each config file
+        # Key is path name, value is FilterDispatch for the entries
+        self._filterDispatchCache = {}
+
         # List of default config option tags passed by the application
         self._defaultConfigOptions = defaultConfigOptions
 
@@ -78,12 +108,7 @@ class ConfigStack( object ):
             # to look for a config file in each folder we visit
             if not os.path.dirname(self._configName) == '':
                 raise utils.ConfigError(uistrings.STR_ErrorConfigFileNameHasPath)
-            # Load the default config file to use for this job
-            # First try in the root of the job folder; then in the surveyor folder
-            if not self._push_file(runtime_dir()):
-                 if not self._push_file(surveyor_dir()):
-                    log.msg(1, "{} not present in default locations".format(
-                            self._configName))
+            self._load_defaults()
 
     def load_csmodule(self, configEntry):
         '''
@@ -101,6 +126,41 @@ class ConfigStack( object ):
             raise utils.ConfigError(uistrings.STR_ErrorFindingModule.format(
                     configEntry.moduleName))
 
+    def refresh(self):
+        '''
+        Prepare for another job when the ConfigStack is kept between jobs
+        Config files are found again by the next job's folder walk, but
+        entries (and their csmodules) from config files that have not
+        changed are reused, so workers that already have them do not
+        need them sent again. Changes to included config files are not
+        checked for.
+        '''
+        for configFilePath, (fileSignature, _configEntrys) in list(self._configFileCache.items()):
+            if _file_signature(configFilePath) != fileSignature:
+                log.config(1, "Config CHANGED: {}".format(configFilePath))
+                del self._configFileCache[configFilePath]
+                self._filterDispatchCache.pop(configFilePath, None)
+        self._configTrie = self.ConfigNode()
+        self._folderConfigs.clear()
+        self._activeConfig = None
+        self._measureRootDir = ''
+        if self._configName:
+            self._defaultConfigs = []
+            self._load_defaults()
+
+    def config_entries(self):
+        '''
+        Returns the ConfigEntrys cached for config files and overrides,
+        which may be used by the next job
+        '''
+        configEntrys = []
+        for _fileSignature, fileEntrys in self._configFileCache.values():
+            configEntrys.extend(fileEntrys)
+        for _path, _fileFilters, configItems in self._defaultConfigs:
+            for itemEntrys in configItems.values():
+                configEntrys.extend(itemEntrys)
+        return configEntrys
+
     def set_measure_root(self, measureRootDir):
         '''
         Called before each folder tree is measured to allow path to tbe used
@@ -108,27 +168,49 @@ class ConfigStack( object ):
         '''
         self._measureRootDir = measureRootDir
 
-    def get_configuration(self, folder):
+    def get_configuration(self, folder, folderFileNames=None):
         '''
-        Returns two collections:
-         1) A set of all file filters active for folder
-         2) A dict by file filter with list of ConfigEntry objects for folder
+        Returns the active configuration for folder:
+         1) FilterDispatch of the active file filters, which matches file
+            names to the list of ConfigEntry objects for the file
+         2) Path of the active config file
 
         The active configuration is the contents of the config file
         closest to the leaf directory passed in as you look back up the
         parent subdirectory tree, ending with the default job config.
+        Folders are expected to be visited top down, so config files in
+        parent folders have been loaded.
+        If provided, folderFileNames is the listing of files in the folder,
+        which is used to check for a config file instead of the file system.
         '''
-        self._pop_to_active(folder)
-        self._push_file(folder)
+        folder = os.path.abspath(folder)
+        activeConfig = self._folderConfigs.get(folder)
+        if activeConfig is None:
+            self._load_folder(folder, folderFileNames)
+            activeConfig = self._resolve_folder(folder)
+            while len(self._folderConfigs) >= MAX_FOLDER_CONFIGS:
+                self._folderConfigs.popitem(last=False)
+            self._folderConfigs[folder] = activeConfig
+        else:
+            self._folderConfigs.move_to_end(folder)
+        self._activeConfig = activeConfig
+
+        path, fileFilters, activeConfigItems = activeConfig
 
-        path, fileFilters, activeConfigItems = self._active_entry()
+        # Compile filters once for each config file
+        filterDispatch = self._filterDispatchCache.get(path)
+        if filterDispatch is None:
+            filterDispatch = fileext.FilterDispatch(sorted(fileFilters), activeConfigItems)
+            self._filterDispatchCache[path] = filterDispatch
 
         log.config(4, "Config: {} -- {} possible entries".format(path, len(activeConfigItems)))
-        return fileFilters, activeConfigItems, path
+        return filterDispatch, path
 
     def active_path(self):
         '''Returns the fully qualified path of the active config file'''
-        return self._active_entry()[0]
+        if self._activeConfig is None:
+            return self._default_entry()[0]
+        return self._activeConfig[0]
 
     #-------------------------------------------------------------------------
 
@@ -140,81 +222,96 @@ class ConfigStack( object ):
         for configName, configStr in configOverrides:
             configEntry = configentry.ConfigEntry(line=configStr)
             self.load_csmodule(configEntry)
-            self._push_entries(configName, [configEntry])
+            self._defaultConfigs.append(self._make_entry(configName, [configEntry]))
 
-    def _active_entry(self):
-        activeConfig = None
-        try:
-            activeConfig = self._configStack[self._active_entry_index()]
-        except Exception:
+    def _default_entry(self):
+        if not self._defaultConfigs:
             # If no default config files are available and there is
             # not a config file in the measureRoot we raise an error
             raise utils.ConfigError(uistrings.STR_ErrorNoDefaultConfig.format(
                     self._configName, os.path.abspath(self._measureRootDir),
                     runtime_dir(), surveyor_dir()))
+        return self._defaultConfigs[-1]
+
+    def _load_defaults(self):
+        '''
+        Load the default config file to use for this job
+        First try in the root of the job folder; then in the surveyor folder
+        '''
+        if not self._push_default_file(runtime_dir()):
+             if not self._push_default_file(surveyor_dir()):
+                log.msg(1, "{} not present in default locations".format(
+                        self._configName))
+
+    def _push_default_file(self, dirName):
+        '''
+        Returns true if a config file was found in dirName and used as default
+        '''
+        configEntry = self._read_file(dirName)
+        if configEntry is None:
+            return False
+        self._defaultConfigs.append(configEntry)
+        return True
+
+    def _load_folder(self, folder, folderFileNames):
+        '''
+        Add any config file in the folder to the trie
+        '''
+        if not self._configName:
+            return
+        configEntry = self._read_file(folder, folderFileNames)
+        if configEntry is not None:
+            node = self._configTrie
+            for pathPart in folder.split(os.sep):
+                node = node.children.setdefault(pathPart, self.ConfigNode())
+            node.configEntry = configEntry
+            # Folders below this one may have been resolved by a prior root
+            subFolder = folder.rstrip(os.sep) + os.sep
+            for resolvedFolder in list(self._folderConfigs.keys()):
+                if resolvedFolder.startswith(subFolder):
+                    del self._folderConfigs[resolvedFolder]
+
+    def _resolve_folder(self, folder):
+        '''
+        Return the config entry of the deepest config file on the folder path
+        '''
+        activeConfig = None
+        node = self._configTrie
+        for pathPart in folder.split(os.sep):
+            node = node.children.get(pathPart)
+            if node is None:
+                break
+            if node.configEntry is not None:
+                activeConfig = node.configEntry
+        if activeConfig is None:
+            activeConfig = self._default_entry()
         return activeConfig
 
-    def _push_file(self, dirName):
+    def _read_file(self, dirName, dirFileNames=None):
         '''
-        Returns true if a config file was found in dirName and pushed on stack
+        Returns config entry for the config file in dirName, or None
         '''
-        success = False
         configFilePath = os.path.abspath(os.path.join(dirName, self._configName))
 
         if not configFilePath in self._configFileCache:
-            if os.path.isfile(configFilePath):
-                self._configFileCache[configFilePath] = self._reader.read_file(configFilePath)
-
-        if configFilePath in self._configFileCache:
-            self._push_entries(configFilePath, self._configFileCache[configFilePath])
-            log.config(1, "Config PUSH {}: {}".format(
-                    len(self._configFileCache[configFilePath]), configFilePath))
-            if len(self._configFileCache[configFilePath]) == 0:
-                log.config(1, "EMPTY CONFIG: {}".format(configFilePath))
-            success = True;
-        return success
-
-    def _pop_to_active(self, dirToCheck):
-        '''
-        Removes config entries back up the folder chain, until we get to the
-        active one.
-        '''
-        configIndex = self._active_entry_index()
-
-        # DO NOT EVER pop the first position, as it should be a default file
-        while configIndex > 0:
-            # Get active config path and remove file name
-            configDir, _configItems, _configPath = self._configStack[configIndex]
-            configDir = os.path.dirname(configDir)
-            currentDir = os.path.abspath(dirToCheck)
-
-            # Is the config file equal to or "above" current position in path?
-            # Special case the current folder '.' below because commonprefix
-            # returns it, while dirname returns blank for empty path
-            currentDirUnderConfigDir = False
-            sharedPath = os.path.commonprefix([currentDir, configDir])
-            if not sharedPath == '':
-                currentDir = os.path.relpath(currentDir, sharedPath)
-                configDir = os.path.relpath(configDir, sharedPath)
-                while True:
-                    if configDir == currentDir:
-                        currentDirUnderConfigDir = True
-                        break;
-                    if '.' == currentDir:
-                        break
-                    currentDir = os.path.dirname(currentDir)
-                    if not currentDir:
-                        currentDir = '.'
-
-            # If the current config file does not cover the currentDir, pop it
-            if currentDirUnderConfigDir:
-                break
+            if dirFileNames is not None:
+                configFileExists = self._configName in dirFileNames
             else:
-                log.config(1, "Config POP: {}".format(self.active_path()))
-                del self._configStack[configIndex]
-                configIndex -= 1
+                configFileExists = os.path.isfile(configFilePath)
+            if configFileExists:
+                fileSignature = _file_signature(configFilePath)
+                self._configFileCache[configFilePath] = (
+                        fileSignature, self._reader.read_file(configFilePath))
 
-    def _push_entries(self, path, configEntryList):
+        if not configFilePath in self._configFileCache:
+            return None
+        _fileSignature, configEntrys = self._configFileCache[configFilePath]
+        log.config(1, "Config LOAD {}: {}".format(len(configEntrys), configFilePath))
+        if len(configEntrys) == 0:
+            log.config(1, "EMPTY CONFIG: {}".format(configFilePath))
+        return self._make_entry(configFilePath, configEntrys)
+
+    def _make_entry(self, path, configEntryList):
 
         # Create list of items based on file filters
         fileFilters = set([])
@@ -226,8 +323,17 @@ class ConfigStack( object ):
                 configObjs.append(configEntry)
                 configItems[fileFilter] = configObjs
 
-        self._configStack.append((path, fileFilters, configItems))
+        return (path, fileFilters, configItems)
+
+#-----------------------------------------------------------------------------
 
-    def _active_entry_index(self):
-        # The item at the top of the stack is the active one
-        return (len(self._configStack) - 1)
+def _file_signature(filePath):
+    '''
+    Size and modified time used to check if a config file has changed,
+    or None if the file is no longer there
+    '''
+    try:
+        fileStat = os.stat(filePath)
+    except EnvironmentError:
+        return None
+    return (fileStat.st_size, fileStat.st_mtime_ns)
@@ -0,0 +1,192 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Cost model scheduling of work packages
+
+    The time to measure a file varies widely with its size and the config
+    entries used to measure it, so sending files to workers in walk order
+    can leave one worker measuring a huge file discovered late while the
+    others sit idle. CostModel predicts the seconds to measure each file,
+    and CostScheduler holds files waiting to be sent so the most expensive
+    ones are sent first (longest processing time first scheduling).
+
+    Predictions are made for each class of file, which is the file
+    extension plus the module and verb of each config entry. Each class
+    has a least squares fit of measure time to file size, learned from
+    the time workers report for each file. Until a class has enough
+    history, defaults by verb are used, scaled by how far off the
+    defaults have been for other classes.
+
+    If a history path is provided, the fits are saved between jobs.
+'''
+
+import os
+import heapq
+import pickle
+import itertools
+import threading
+
+from code_surveyor.framework import log  # No relative path to share module globals
+
+
+COST_HISTORY_FILE_NAME = 'surveyor.costs'
+
+# Default prediction for file classes that have no history
+DEFAULT_ENTRY_SECONDS = 0.0005
+DEFAULT_SECONDS_PER_BYTE = 1e-6
+DefaultVerbSecondsPerByte = {
+    'measure': 1e-6,
+    'routines': 2e-6,
+    'search': 5e-7,
+    }
+
+# Files in a class needed before the class's own fit is used
+MIN_FIT_FILES = 8
+
+
+class CostModel( object ):
+    '''
+    Called from the main thread for predictions and from the output
+    thread to record times, so access is serialized with a lock
+    '''
+    def __init__(self, historyFolder=None):
+        self._historyPath = None
+        if historyFolder is not None:
+            self._historyPath = os.path.join(historyFolder, COST_HISTORY_FILE_NAME)
+        self._lock = threading.Lock()
+
+        # Key is file class, value is [n, sumSize, sumSeconds, sumSize^2, sumSize*Seconds]
+        self._classFits = {}
+
+        # Totals used to scale default predictions
+        self._defaultSeconds = 0.0
+        self._measuredSeconds = 0.0
+
+        # Cache of config entry keys, by id of the list of config entries
+        # (the lists come from the config file caches, so they are long lived)
+        self._entryKeys = {}
+        self._load()
+
+    def file_class(self, fileName, configEntrys):
+        '''
+        Returns hashable description of the file for predictions
+        '''
+        try:
+            _configEntrys, entryKey = self._entryKeys[id(configEntrys)]
+        except KeyError:
+            entryKey = tuple([(str(configEntry.moduleName), str(configEntry.verb)) for
+                                configEntry in configEntrys])
+            self._entryKeys[id(configEntrys)] = (configEntrys, entryKey)
+        _root, fileExt = os.path.splitext(fileName)
+        return (fileExt.lower(), entryKey)
+
+    def predict(self, fileClass, fileSize):
+        '''
+        Returns predicted seconds to measure a file
+        '''
+        with self._lock:
+            classFit = self._classFits.get(fileClass)
+            if classFit is not None and classFit[0] >= MIN_FIT_FILES:
+                return _fit_predict(classFit, fileSize)
+            scale = 1.0
+            if self._defaultSeconds > 0 and self._measuredSeconds > 0:
+                scale = self._measuredSeconds / self._defaultSeconds
+        return _default_predict(fileClass, fileSize) * scale
+
+    def record(self, fileClass, fileSize, seconds):
+        '''
+        Add the measured time for a file to the history for its class
+        '''
+        with self._lock:
+            classFit = self._classFits.setdefault(fileClass, [0, 0.0, 0.0, 0.0, 0.0])
+            classFit[0] += 1
+            classFit[1] += fileSize
+            classFit[2] += seconds
+            classFit[3] += float(fileSize) * fileSize
+            classFit[4] += fileSize * seconds
+            self._defaultSeconds += _default_predict(fileClass, fileSize)
+            self._measuredSeconds += seconds
+
+    def save(self):
+        if self._historyPath is None:
+            return
+        try:
+            with self._lock:
+                history = (self._classFits, self._defaultSeconds, self._measuredSeconds)
+                with open(self._historyPath, 'wb') as historyFile:
+                    pickle.dump(history, historyFile, pickle.HIGHEST_PROTOCOL)
+            log.msg(1, "Saved cost history for {} file classes".format(len(self._classFits)))
+        except (EnvironmentError, pickle.PicklingError) as e:
+            log.msg(1, "Cannot save cost history: {}".format(str(e)))
+
+    def _load(self):
+        if self._historyPath is None or not os.path.isfile(self._historyPath):
+            return
+        try:
+            with open(self._historyPath, 'rb') as historyFile:
+                self._classFits, self._defaultSeconds, self._measuredSeconds = pickle.load(historyFile)
+            log.msg(1, "Loaded cost history for {} file classes".format(len(self._classFits)))
+        except (EnvironmentError, pickle.UnpicklingError, ValueError, EOFError) as e:
+            log.msg(1, "Cannot load cost history: {}".format(str(e)))
+
+
+class CostScheduler( object ):
+    '''
+    Holds work items waiting to be sent to workers, and provides packages
+    of the most expensive items first
+    Packages are cut at a target predicted time, so expensive files are
+    sent on their own while cheap files are grouped.
+    '''
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+
+    def add(self, workItem, fileSize, cost):
+        # Walk order breaks ties, so equal cost files stay in order
+        heapq.heappush(self._heap, (-cost, next(self._order), workItem, fileSize))
+
+    def size_items(self):
+        return len(self._heap)
+
+    def next_package(self, packageSeconds, maxItems, maxBytes):
+        '''
+        Returns list of (workItem, fileSize) with the most expensive items
+        '''
+        package = []
+        packageCost = 0.0
+        packageBytes = 0
+        while self._heap:
+            negCost, _order, workItem, fileSize = heapq.heappop(self._heap)
+            package.append((workItem, fileSize))
+            packageCost -= negCost
+            packageBytes += fileSize
+            if (packageCost >= packageSeconds or
+                    len(package) >= maxItems or
+                    packageBytes >= maxBytes):
+                break
+        return package
+
+#-----------------------------------------------------------------------------
+
+def _default_predict(fileClass, fileSize):
+    _fileExt, entryKey = fileClass
+    seconds = 0.0
+    for _moduleName, verb in entryKey:
+        seconds += (DEFAULT_ENTRY_SECONDS +
+                fileSize * DefaultVerbSecondsPerByte.get(verb, DEFAULT_SECONDS_PER_BYTE))
+    return seconds
+
+def _fit_predict(classFit, fileSize):
+    '''
+    Least squares fit of seconds = a + b * size, falling back to the
+    class average rate if sizes don't vary or the fit isn't sensible
+    '''
+    n, sumSize, sumSeconds, sumSizeSq, sumSizeSeconds = classFit
+    denominator = n * sumSizeSq - sumSize * sumSize
+    if denominator > 0:
+        slope = (n * sumSizeSeconds - sumSize * sumSeconds) / denominator
+        intercept = (sumSeconds - slope * sumSize) / n
+        if slope >= 0 and intercept >= 0:
+            return intercept + slope * fileSize
+    meanSeconds = sumSeconds / n
+    meanSize = sumSize / n
+    return meanSeconds * (fileSize + 1.0) / (meanSize + 1.0)
@@ -0,0 +1,321 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Survey daemon
+
+    Starting a Surveyor job loads csmodules, reads and compiles config
+    files, and starts worker processes, which can take longer than
+    measuring a small folder tree. The daemon keeps this state warm between
+    jobs: a ConfigStack for each set of config options (refreshed for each
+    job, so changed config files are read again), and a group of running
+    workers that keep the config entries sent to them.
+
+    Jobs are received one at a time on a local (Unix domain) socket from
+    a thin client, which forwards its command line arguments and current
+    folder. Each message is one line of JSON:
+
+        client:  {"args": [...], "cwd": folder, "width": printWidth}
+        daemon:  {"out": text}       Console output, repeated
+        daemon:  {"result": bool}    True if the job succeeded, last message
+
+    The daemon runs csmodules and config files named by its clients, so
+    only the daemon's user may connect: the socket is created with no access
+    for others, by default in a folder only the user can open. A daemon
+    won't replace the socket of another daemon that is still answering.
+
+    The job is run by the daemon in the client's folder, so output files
+    are written there. The daemon's number of workers is used for all jobs,
+    and jobs run with debug tracing, profiling, or remote workers start
+    their own workers.
+'''
+
+import os
+import json
+import stat
+import socket
+import tempfile
+import threading
+import contextlib
+import collections
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from . import cmdlineapp
+from . import configstack
+from . import job
+from . import utils
+from .uistrings import *
+
+
+SOCKET_ENV_VAR = 'SURVEYOR_SOCKET'
+SOCKET_FOLDER_NAME = 'surveyor-{}'
+SOCKET_FILE_NAME = 'surveyor.sock'
+SOCKET_FOLDER_MODE = 0o700
+SOCKET_UMASK = 0o077
+SOCKET_BACKLOG = 4
+SOCKET_READ_SIZE = 65536
+
+# Console output is sent to the client when flushed, or when this much is held
+CLIENT_SEND_SIZE = 4096
+
+# ConfigStacks kept for different config options, least recently used dropped
+MAX_CONFIG_STACKS = 8
+
+
+def default_socket_path():
+    socketPath = os.environ.get(SOCKET_ENV_VAR)
+    if socketPath is None:
+        socketPath = os.path.join(_default_socket_folder(), SOCKET_FILE_NAME)
+    return socketPath
+
+def run_client(socketPath, cmdArgs, outputStream, printWidth=None):
+    '''
+    Send a job to the daemon and write its console output to outputStream
+    Returns True if the job succeeded
+    '''
+    _check_unix_sockets()
+    clientSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            clientSocket.connect(socketPath)
+        except EnvironmentError as e:
+            raise utils.SurveyorException(
+                    STR_ErrorDaemonConnect.format(socketPath, str(e)))
+        _send_message(clientSocket, {
+                'args': cmdArgs, 'cwd': os.getcwd(), 'width': printWidth})
+        for message in _read_messages(clientSocket):
+            if 'out' in message:
+                outputStream.write(message['out'])
+                outputStream.flush()
+            elif 'result' in message:
+                return message['result']
+        raise utils.SurveyorException(STR_ErrorDaemonDisconnect)
+    finally:
+        clientSocket.close()
+
+
+class SurveyorDaemon( object ):
+    '''
+    Accepts jobs from clients and runs them with warm state
+    The daemon provides ConfigStacks and workers to SurveyorCmdLine for
+    each job, and replaces the workers if a job leaves them unusable
+    '''
+    def __init__(self, surveyorPath, socketPath, numWorkers):
+        _check_unix_sockets()
+        self._surveyorPath = surveyorPath
+        self._socketPath = socketPath
+        self._numWorkers = numWorkers
+        self._configStacks = collections.OrderedDict()
+        self._workers = None
+        self._serverSocket = None
+        self._clientSocket = None
+
+    def serve(self):
+        '''
+        Run jobs from clients until interrupted
+        '''
+        self._prepare_socket_path()
+        self._serverSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        os.register_at_fork(after_in_child=self._close_sockets_in_child)
+        try:
+            # Create the socket without access for others, instead of
+            # changing its mode after it can already be connected to
+            oldUmask = os.umask(SOCKET_UMASK)
+            try:
+                self._serverSocket.bind(self._socketPath)
+            finally:
+                os.umask(oldUmask)
+            self._serverSocket.listen(SOCKET_BACKLOG)
+            log.msg(1, "Daemon listening on: {}".format(self._socketPath))
+            while True:
+                self._clientSocket, _address = self._serverSocket.accept()
+                try:
+                    self._run_client_job(self._clientSocket)
+                finally:
+                    self._clientSocket.close()
+                    self._clientSocket = None
+        finally:
+            self._serverSocket.close()
+            if os.path.exists(self._socketPath):
+                os.remove(self._socketPath)
+            if self._workers is not None:
+                self._workers.shutdown()
+
+    def _close_sockets_in_child(self):
+        '''
+        Workers are forked while a job runs; if they held our sockets, workers
+        orphaned by a killed daemon would keep its socket answering
+        '''
+        for daemonSocket in (self._serverSocket, self._clientSocket):
+            if daemonSocket is not None:
+                daemonSocket.close()
+
+    def _prepare_socket_path(self):
+        '''
+        Make the default socket folder private to our user, and remove a
+        socket left by a daemon that is no longer running
+        '''
+        socketFolder = os.path.dirname(os.path.abspath(self._socketPath))
+        if socketFolder == _default_socket_folder():
+            if not os.path.isdir(socketFolder):
+                os.mkdir(socketFolder, SOCKET_FOLDER_MODE)
+            folderStat = os.lstat(socketFolder)
+            if (not stat.S_ISDIR(folderStat.st_mode) or
+                    folderStat.st_uid != os.getuid() or
+                    stat.S_IMODE(folderStat.st_mode) & SOCKET_UMASK):
+                raise utils.SurveyorException(
+                        STR_ErrorDaemonSocketFolder.format(socketFolder))
+        if os.path.exists(self._socketPath):
+            if _socket_answers(self._socketPath):
+                raise utils.SurveyorException(
+                        STR_ErrorDaemonRunning.format(self._socketPath))
+            os.remove(self._socketPath)
+
+    #-------------------------------------------------------------------------
+    #   Warm state provided to SurveyorCmdLine
+
+    def config_stack(self, configFileName, configOverrides, defaultConfigOptions):
+        '''
+        Returns a ConfigStack for the options, reusing one from a prior job
+        Default config files are found from the current folder, so it is
+        part of the key
+        '''
+        stackKey = repr((os.getcwd(), configFileName, configOverrides, defaultConfigOptions))
+        configStack = self._configStacks.pop(stackKey, None)
+        if configStack is None:
+            log.msg(1, "Daemon creating ConfigStack")
+            configStack = configstack.ConfigStack(
+                    configFileName, configOverrides, defaultConfigOptions)
+            while len(self._configStacks) >= MAX_CONFIG_STACKS:
+                self._configStacks.popitem(last=False)
+        else:
+            log.msg(1, "Daemon reusing ConfigStack")
+            configStack.refresh()
+        self._configStacks[stackKey] = configStack
+        return configStack
+
+    def workers(self, jobOptions):
+        '''
+        Returns the warm workers for a job, or None if the job should
+        create its own
+        '''
+        if jobOptions.profileName is not None or log.level() > 0:
+            return None
+        if jobOptions.backend == job.BACKEND_REMOTE:
+            return None
+        if self._workers is not None and not self._workers.reusable():
+            log.msg(1, "Daemon replacing workers")
+            self._workers.shutdown()
+            self._workers = None
+        if self._workers is None:
+            self._workers = job.Job.Workers((log.get_context(), None), self._numWorkers)
+        else:
+            # Entries of ConfigStacks that were dropped, or of changed config
+            # files, won't be used again
+            liveEntries = []
+            for configStack in self._configStacks.values():
+                liveEntries.extend(configStack.config_entries())
+            self._workers.prune_configs(liveEntries)
+        return self._workers
+
+    #-------------------------------------------------------------------------
+
+    def _run_client_job(self, clientSocket):
+        try:
+            request = next(_read_messages(clientSocket))
+        except (StopIteration, ValueError, EnvironmentError) as e:
+            log.msg(1, "Daemon bad request: {}".format(str(e)))
+            return
+        clientStream = self.ClientStream(clientSocket)
+        success = False
+        try:
+            os.chdir(request['cwd'])
+            with contextlib.redirect_stdout(clientStream):
+                success = cmdlineapp.SurveyorCmdLine(daemon=self).run(
+                        [self._surveyorPath] + request['args'], clientStream,
+                        request.get('width'))
+        except Exception as e:
+            clientStream.write(STR_Error + str(e) + "\n")
+        finally:
+            clientStream.flush()
+            clientStream.send_message({'result': success})
+
+    class ClientStream( object ):
+        '''
+        Stands in for stdout while running a client's job
+        Written to from the job's main and output threads; if the client
+        goes away the job is run to completion, with console output dropped
+        '''
+        def __init__(self, clientSocket):
+            self._clientSocket = clientSocket
+            self._lock = threading.Lock()
+            self._buffer = []
+            self._bufferSize = 0
+            self._connected = True
+
+        def write(self, text):
+            with self._lock:
+                self._buffer.append(text)
+                self._bufferSize += len(text)
+                if self._bufferSize >= CLIENT_SEND_SIZE:
+                    self._send_buffer()
+            return len(text)
+
+        def flush(self):
+            with self._lock:
+                self._send_buffer()
+
+        def send_message(self, message):
+            with self._lock:
+                self._send(message)
+
+        def _send_buffer(self):
+            if self._buffer:
+                self._send({'out': ''.join(self._buffer)})
+                self._buffer = []
+                self._bufferSize = 0
+
+        def _send(self, message):
+            if self._connected:
+                try:
+                    _send_message(self._clientSocket, message)
+                except EnvironmentError as e:
+                    log.msg(1, "Daemon client disconnected: {}".format(str(e)))
+                    self._connected = False
+
+#-----------------------------------------------------------------------------
+
+def _default_socket_folder():
+    return os.path.join(tempfile.gettempdir(), SOCKET_FOLDER_NAME.format(os.getuid()))
+
+def _socket_answers(socketPath):
+    '''
+    True if a daemon is accepting connections on the socket
+    '''
+    probeSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probeSocket.connect(socketPath)
+        return True
+    except EnvironmentError:
+        return False
+    finally:
+        probeSocket.close()
+
+def _check_unix_sockets():
+    if not hasattr(socket, 'AF_UNIX'):
+        raise utils.SurveyorException(STR_ErrorDaemonNoSockets)
+
+def _send_message(sock, message):
+    sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+def _read_messages(sock):
+    '''
+    Generator of messages read from the socket until it is closed
+    '''
+    received = b''
+    while True:
+        data = sock.recv(SOCKET_READ_SIZE)
+        if not data:
+            return
+        received += data
+        while b'\n' in received:
+            line, received = received.split(b'\n', 1)
+            yield json.loads(line.decode('utf-8'))
@@ -15,6 +15,11 @@
     is called frequently during initial folderwalk in main process.
     This can massively slow down a job because the folderwalk can't fill
     the job queue fast enough.
+
+    FilterDispatch compiles a set of filters once for matching many file
+    names, which is how the folder walk matches config and command-line
+    filters: simple '*.ext' filters go in a hash table by extension, and
+    the remaining filters are combined into one regex.
 '''
 
 import os
@@ -74,6 +79,144 @@ def file_matches_filters(fileName, fileFilters):
             return fileFilter
     return None
 
+
+class FilterDispatch( object ):
+    '''
+    Compiled set of file filters
+    Each remaining filter is an optional lookahead with a named group in
+    the combined regex, so one regex match finds every filter that matches.
+    Custom regexes that can't be combined (backreferences, global flags)
+    are matched individually.
+    If filterEntries is provided (dict by file filter with list of config
+    entries) match_entries returns the config entries for all matching
+    filters, which are cached for each combination of matching filters.
+    '''
+    def __init__(self, fileFilters, filterEntries=None):
+        self.fileFilters = list(fileFilters)
+        self._filterEntries = filterEntries if filterEntries is not None else {}
+
+        # Dict of '.ext' to filter for simple '*.ext' filters
+        self._extFilters = {}
+        # List of (filter, group name) in the combined regex
+        self._regexFilters = []
+        self._filtersRe = None
+        self._unmatchedFilters = []
+        self._entriesCache = {}
+
+        regexFilters = []
+        for fileFilter in self.fileFilters:
+            filterExt = _simple_ext(fileFilter)
+            if filterExt is not None:
+                self._extFilters.setdefault(filterExt, fileFilter)
+            elif _can_combine(fileFilter):
+                regexFilters.append(fileFilter)
+            else:
+                self._unmatchedFilters.append(fileFilter)
+
+        if regexFilters:
+            groups = []
+            for filterNum, fileFilter in enumerate(regexFilters):
+                groupName = 'f{}'.format(filterNum)
+                self._regexFilters.append((fileFilter, groupName))
+                groups.append('(?:(?=(?P<{}>{})))?'.format(groupName, _filter_regex(fileFilter)))
+            try:
+                self._filtersRe = re.compile(''.join(groups), RE_OPTIONS)
+            except re.error:
+                log.file(1, "Filters matched individually: {}".format(regexFilters))
+                self._regexFilters = []
+                self._unmatchedFilters.extend(regexFilters)
+
+    def match(self, fileName):
+        '''
+        Returns the first matching filter, or None
+        Simple extension filters are matched first
+        '''
+        matchingFilters = self._matching_filters(fileName)
+        return matchingFilters[0] if matchingFilters else None
+
+    def match_entries(self, fileName):
+        '''
+        Returns the first matching filter and a sorted list of the
+        entries for all matching filters, or (None, None)
+        '''
+        matchingFilters = self._matching_filters(fileName)
+        if not matchingFilters:
+            return None, None
+        try:
+            return self._entriesCache[matchingFilters]
+        except KeyError:
+            entries = []
+            for fileFilter in matchingFilters:
+                entries.extend(self._filterEntries.get(fileFilter, []))
+            entries.sort(key=lambda entrySort: str(entrySort))
+            log.config(3, entries)
+            filterEntries = (matchingFilters[0], entries)
+            self._entriesCache[matchingFilters] = filterEntries
+            return filterEntries
+
+    def _matching_filters(self, fileName):
+        matchingFilters = ()
+        if self._extFilters:
+            extPos = fileName.rfind('.')
+            if extPos >= 0:
+                fileExt = fileName[extPos:]
+                if RE_OPTIONS & re.IGNORECASE:
+                    fileExt = fileExt.lower()
+                extFilter = self._extFilters.get(fileExt)
+                if extFilter is not None:
+                    matchingFilters = (extFilter,)
+        if self._filtersRe is not None:
+            filtersMatch = self._filtersRe.match(fileName)
+            matchingFilters += tuple([fileFilter for fileFilter, groupName in self._regexFilters if
+                                        filtersMatch.group(groupName) is not None])
+        if self._unmatchedFilters:
+            matchingFilters += tuple([fileFilter for fileFilter in self._unmatchedFilters if
+                                        file_ext_match(fileName, fileFilter)])
+        return matchingFilters
+
+
+def _simple_ext(fileFilter):
+    '''
+    Returns '.ext' for a '*.ext' filter that can be matched by looking up
+    the text after the last '.' in a file name, or None
+    '''
+    if not fileFilter.startswith('*.'):
+        return None
+    filterExt = fileFilter[1:]
+    if '.' in filterExt[1:] or any([c in filterExt for c in '*?[']):
+        return None
+    if RE_OPTIONS & re.IGNORECASE:
+        filterExt = filterExt.lower()
+    return filterExt
+
+def _can_combine(fileFilter):
+    '''
+    Custom regexes with backreferences or global flags change meaning or
+    won't compile inside the combined regex
+    '''
+    if fileFilter.startswith(CUSTOM_FILE_REGEX):
+        return not re.search(r'\\\d|\(\?P=|\(\?[aiLmsux]+\)', fileFilter)
+    return True
+
+def _filter_regex(fileFilter):
+    '''
+    Returns regex string with the same meaning as file_ext_match
+    '''
+    if not fileFilter:
+        return ''
+    if fileFilter.startswith(EXCLUDE_FILE_EXT):
+        negativeFilters = fileFilter.replace(EXCLUDE_FILE_EXT, '').split(EX_DELIM_CHAR)
+        return '(?!{})'.format('|'.join(
+                ['(?:{})'.format(_match_regex(negFilter)) for negFilter in negativeFilters]))
+    return _match_regex(fileFilter)
+
+def _match_regex(fileFilter):
+    if BLANK_FILE_EXT == fileFilter:
+        return r'[^.]*\Z'
+    if fileFilter.startswith(CUSTOM_FILE_REGEX):
+        return fileFilter.replace(CUSTOM_FILE_REGEX, '')
+    return fnmatch.translate(fileFilter)
+
 def _file_match(fileName, fileFilter):
     '''
     Performs the match check of filename to filter
@@ -95,9 +238,9 @@ def _file_match(fileName, fileFilter):
                 filterRe = re.compile(fnmatch.translate(fileFilter), RE_OPTIONS)
             _FilterCache[fileFilter] = filterRe
 
-        filterMatch = filterRe.match(fileName)
+        filterMatch = filterRe.match(fileName) is not None
 
-        if log.level() > 3 and filterMatch is None:
+        if log.level() > 3 and not filterMatch:
             log.file(4, "FilterExtFilter: %s, no match:  %s" % (filterRe.pattern[:10], fileName))
 
-        return filterMatch is not None
+    return filterMatch
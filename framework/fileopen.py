@@ -10,11 +10,13 @@
     FILE_START_UTF8_CHECK size.
 '''
 
+import io
 import os
 
 from code_surveyor.framework import log  # No relative path to share module globals
 from . import utils
 from . import filetype
+from . import archive
 
 # How much of the file to read to test UTF8 decoding
 FILE_START_UTF8_CHECK = 2 ** 18
@@ -33,13 +35,14 @@ NonCodeFileStart = (
     )
 
 
-def open_file_for_survey(filePath, existingFile, forceAll, sizeThreshold):
+def open_file_for_survey(filePath, existingFile, forceAll, sizeThreshold, fileStats=None):
     '''
     Includes logic for handling different file encodings and 
     options for skipping files based on different detections
     of content in the file.
     existingFile is used as optimization to prevent reopening
     a file multiple times.
+    fileStats from the folder walk are used if provided.
     '''
     # Check extensions first, since already have data
     if not forceAll and filetype.is_noncode_ext(filePath):
@@ -48,7 +51,7 @@ def open_file_for_survey(filePath, existingFile, forceAll, sizeThreshold):
         
     # Then check for size threshold; faster than opening file
     if sizeThreshold > 0:
-        fileSize = utils.get_file_size(filePath)
+        fileSize = utils.get_file_size(filePath, fileStats)
         if sizeThreshold < fileSize:
             log.file(1, "Skipping, size {}: {}".format(fileSize, filePath))
             return
@@ -58,10 +61,10 @@ def open_file_for_survey(filePath, existingFile, forceAll, sizeThreshold):
         existingFile.seek(0)   
         rv = existingFile
     else:
-        rv = _open_file( filePath, forceAll )
+        rv = _open_file( filePath, forceAll, fileStats )
     return rv
 
-def _open_file(filePath, forceAll):
+def _open_file(filePath, forceAll, fileStats=None):
     """
     Manage the file opening with correct encoding based on any errors in 
     decoding utf-8 default and through inspection of file start.
@@ -70,7 +73,7 @@ def _open_file(filePath, forceAll):
     """
 
     # Use buffering to reduce the cost of open on larger files
-    fileObj = open(filePath, 'r', buffering=FILE_BUFFERING, encoding='utf_8')
+    fileObj = _open_path(filePath, False, fileStats)
 
     # Grab the first bytes of the file
     start = None
@@ -81,7 +84,7 @@ def _open_file(filePath, forceAll):
         except UnicodeDecodeError as e:
             fileObj.close()
             log.file(1, "UTF-8 error, using binary: {}".format(filePath))
-            fileObj = open(filePath, 'rb', buffering=FILE_BUFFERING)
+            fileObj = _open_path(filePath, True, fileStats)
             start = _get_file_start(fileObj, FILE_START_CHECK)
 
     except Exception as e2:
@@ -108,6 +111,20 @@ def _open_file(filePath, forceAll):
 
     return fileObj
 
+def _open_path(filePath, binary, fileStats=None):
+    '''
+    Files in archives are streamed from the archive member
+    '''
+    archivePath, memberName = archive.split_archive_path(filePath, fileStats)
+    if archivePath is not None:
+        memberFile = archive.open_member(archivePath, memberName, fileStats)
+        if binary:
+            return memberFile
+        return io.TextIOWrapper(memberFile, encoding='utf_8')
+    if binary:
+        return open(filePath, 'rb', buffering=FILE_BUFFERING)
+    return open(filePath, 'r', buffering=FILE_BUFFERING, encoding='utf_8')
+
 def _get_file_start(fileObj, maxWin):
     fileObj.seek(0)
     fileStart = utils.safe_string(fileObj.read(maxWin))
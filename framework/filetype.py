@@ -17,7 +17,7 @@ from . import utils
 
 # Compressed file Extentsions
 CompressedFileExtensions = set([
-    'zip', 'tgz' 'tar', 'gz', 'rar', '7z',
+    'zip', 'tgz', 'tar', 'gz', 'rar', '7z',
     ])
 def is_compressed_ext(filePath):
     rv = False
@@ -6,10 +6,21 @@
 
 import os
 import fnmatch
+import hashlib
+import threading
+import concurrent.futures
 
 from code_surveyor.framework import log  # No relative path to share module globals
-from . import configstack
+from . import archive
 from . import fileext
+from . import gitindex
+from . import ignorerules
+from . import utils
+
+# When folders are listed in parallel, limit how many folders can be
+# listed ahead of the main thread, to bound memory on large trees
+SCANS_AHEAD_PER_THREAD = 64
+
 
 class FolderWalker( object ):
     '''
@@ -17,50 +28,121 @@ class FolderWalker( object ):
     A callback is used to allow us to update caller on progress on
     a per-folder basis.
     Errors are not caught here
+    If walkThreads is more than one, folder listing is done ahead of the walk
+    by a pool of threads, which helps keep workers busy on slow file systems.
+    Config file resolution and callbacks are always done on the calling thread
+    in the same order as a single-threaded walk.
+    If expandArchives is set, archive files are walked as folders of
+    their members instead of being measured as files.
+    If shard is set to (shardNum, numShards), only files whose path hash
+    falls in that shard are kept, so a job can be split across machines.
     '''
     def __init__(self, deltaPath, configStack,
                 expandSubdirs, includeFolders, skipFolders, fileFilters, skipFiles,
-                add_files_callback):
+                add_files_callback, walkThreads=0, useGitIndex=False, useIgnoreFiles=False,
+                expandArchives=False, shard=None):
         self._add_files_to_job = add_files_callback
         self._deltaPath = deltaPath
         self._configStack = configStack
         self._expandSubdirs = expandSubdirs
         self._includeFolders = includeFolders
         self._skipFolders = skipFolders
-        self._fileExtFilters = fileFilters
-        self._skipFiles = skipFiles
+        self._useIgnoreFiles = useIgnoreFiles
+        self._expandArchives = expandArchives
+        self._shard = shard
+
+        # Command-line file filters are compiled once; config file filters
+        # are compiled by the configStack for each config file
+        self._fileExtFilters = None
+        if fileFilters:
+            self._fileExtFilters = fileext.FilterDispatch(fileFilters)
+        self._skipFiles = None
+        if skipFiles:
+            self._skipFiles = fileext.FilterDispatch(skipFiles)
+
+        # Folders listed from a git index for the current root, if used
+        self._useGitIndex = useGitIndex
+        self._indexRoot = None
+        self._indexFolders = None
+
+        # Thread pool for listing folders ahead of the walk
+        # Not needed when folders are listed from the git index
+        self._scanPool = None
+        self._scansAhead = 0
+        self._maxScansAhead = walkThreads * SCANS_AHEAD_PER_THREAD
+        self._scanLock = threading.Lock()
+        self._rootScans = {}
+        if walkThreads > 1 and not useGitIndex:
+            self._scanPool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=walkThreads, thread_name_prefix='FolderScan')
+            log.file(1, "Listing folders with {} threads".format(walkThreads))
+
+    def prefetch(self, pathsToMeasure):
+        '''
+        Start listing all of the root paths to measure, so multiple
+        roots are walked concurrently
+        '''
+        if self._scanPool is not None:
+            for pathToMeasure in pathsToMeasure:
+                if pathToMeasure not in self._rootScans:
+                    self._rootScans[pathToMeasure] = self._submit_scan(
+                            pathToMeasure, self._root_ignore_matcher())
 
-        # Cache both the set of possible file filters for a config file, and config
-        # entries for config file extensions. This avoids much redundant looping to
-        # match config items to files
-        self._configFilterCache = {}
-        self._configEntryCache = {}
+    def close(self):
+        '''
+        Stop any folder listing that is still in progress
+        '''
+        if self._scanPool is not None:
+            self._scanPool.shutdown(wait=True, cancel_futures=True)
+            self._scanPool = None
+            self._rootScans = {}
 
     def walk(self, pathToMeasure):
         '''
         Walk folders while filtering sending updates via callback
         May be asked to terminate in our callback
+        Folders are listed with os.scandir in a topdown walk, so file stats
+        can be taken from the folder listing and passed on with the files
         '''
         self._configStack.set_measure_root(pathToMeasure)
+        self._load_git_index(pathToMeasure)
 
-        for folderName, childFolders, fileNames in os.walk(pathToMeasure, topdown=True):
+        # Stack of folders still to visit, with children pushed in reverse
+        # sorted order to give the same visit order as a topdown os.walk
+        rootScan = self._rootScans.pop(pathToMeasure, None)
+        if rootScan is None:
+            rootScan = self.FolderScan(pathToMeasure, self._root_ignore_matcher())
+        foldersToWalk = [rootScan]
+        while foldersToWalk:
+            folderScan = foldersToWalk.pop()
+            folderName = folderScan.folderName
             log.file(2, "Scanning: {}".format(folderName))
 
+            fileNames, fileEntries, childScans = self._get_scan_results(folderScan)
+            if self._shard is not None:
+                fileNames = self._get_shard_files(folderName[len(pathToMeasure):], fileNames)
+
             numUnfilteredFiles = len(fileNames)
             filesAndConfigs = []
 
             if fileNames and self._valid_folder(folderName):
 
                 # Get the current set of active config filters
-                fileFilters, activeConfigs, configPath = self._configStack.get_configuration(folderName)
+                # Config files are not read from archives
+                configFileNames = fileEntries if folderScan.archivePath is None else ()
+                filterDispatch, _configPath = self._configStack.get_configuration(
+                        folderName, configFileNames)
 
                 # Filter out files by options and config items
-                filesToProcess = self._get_files_to_process(folderName, fileNames, fileFilters, configPath)
+                filesToProcess = self._get_files_to_process(fileNames, filterDispatch)
 
-                # Create list of tuples with fileName and configEntrys for each file
-                for fileName, fileFilter in filesToProcess:
-                    configEntrys = self._get_configs_for_file(fileName, fileFilter, activeConfigs, configPath)
-                    filesAndConfigs.append((fileName, configEntrys))
+                # Create list of tuples with fileName, configEntrys, and stats for each file
+                for fileName, configEntrys in filesToProcess:
+                    fileStats = self._get_file_stats(folderName, fileName,
+                            fileEntries[fileName], folderScan.archivePath)
+                    if fileStats is None:
+                        continue
+                    filesAndConfigs.append((fileName, configEntrys, fileStats))
 
             # For delta measure create a fully qualified delta path name
             # Note when we split on path to measure, it will start with seperator
@@ -78,10 +160,269 @@ class FolderWalker( object ):
             if not continueProcessing or not self._expandSubdirs:
                 break
 
-            # Remove any folders, and sort remaining to ensure consistent walk
-            # order across file systems (for our testing if nothing else)
+            foldersToWalk.extend(reversed(childScans))
+
+    def small_walk(self, pathsToMeasure, maxFiles, maxBytes):
+        '''
+        Returns True if the paths to measure have no more than maxFiles
+        files and maxBytes bytes, which is checked with a walk that stops as
+        soon as either is exceeded. Folders are listed and filtered as they
+        are for the walk, but config files are not read, so this
+        overestimates the job size.
+        Folders are listed on this thread, so listings aren't left in the
+        thread pool when the walk stops early.
+        '''
+        numFiles = 0
+        numBytes = 0
+        scanPool, self._scanPool = self._scanPool, None
+        try:
+            for pathToMeasure in pathsToMeasure:
+                self._load_git_index(pathToMeasure)
+                foldersToWalk = [self.FolderScan(pathToMeasure, self._root_ignore_matcher())]
+                while foldersToWalk:
+                    folderScan = foldersToWalk.pop()
+                    folderName = folderScan.folderName
+                    fileNames, fileEntries, childScans = self._get_scan_results(folderScan)
+                    if self._shard is not None:
+                        fileNames = self._get_shard_files(
+                                folderName[len(pathToMeasure):], fileNames)
+                    if fileNames and self._valid_folder(folderName):
+                        for fileName in fileNames:
+                            if not (self._fileExtFilters is None or
+                                    self._fileExtFilters.match(fileName)):
+                                continue
+                            if (self._skipFiles is not None and
+                                    self._skipFiles.match(fileName) is not None):
+                                continue
+                            fileStats = self._get_file_stats(folderName, fileName,
+                                    fileEntries[fileName], folderScan.archivePath)
+                            if fileStats is None:
+                                continue
+                            numFiles += 1
+                            numBytes += fileStats[utils.FILE_STAT_SIZE]
+                            if numFiles > maxFiles or numBytes > maxBytes:
+                                return False
+                    if not self._expandSubdirs:
+                        break
+                    foldersToWalk.extend(childScans)
+        finally:
+            self._scanPool = scanPool
+        return True
+
+    #-------------------------------------------------------------------------
+
+    class FolderScan( object ):
+        '''
+        Folder waiting to be walked, with the future for its listing if
+        it is being listed ahead of the walk, and the ignore rules that
+        apply to it from parent folders
+        For folders in an archive, archivePath is the archive file and
+        archiveFolders is its listing, which is loaded when the archive
+        itself is listed
+        '''
+        def __init__(self, folderName, ignoreMatcher, future=None,
+                        archivePath=None, archiveFolders=None):
+            self.folderName = folderName
+            self.ignoreMatcher = ignoreMatcher
+            self.future = future
+            self.archivePath = archivePath
+            self.archiveFolders = archiveFolders
+
+    def _submit_scan(self, folderName, ignoreMatcher, archivePath=None, archiveFolders=None):
+        '''
+        Returns FolderScan, which is listed in the thread pool if there is room
+        to list ahead; otherwise it will be listed when the walk reaches it
+        '''
+        future = None
+        if self._scanPool is not None:
+            with self._scanLock:
+                if self._scansAhead < self._maxScansAhead:
+                    self._scansAhead += 1
+                    try:
+                        future = self._scanPool.submit(self._scan_folder,
+                                folderName, ignoreMatcher, archivePath, archiveFolders)
+                    except RuntimeError:
+                        # Pool has been shut down
+                        self._scansAhead -= 1
+        return self.FolderScan(folderName, ignoreMatcher, future, archivePath, archiveFolders)
+
+    def _get_scan_results(self, folderScan):
+        '''
+        Wait for folder listing done ahead, or list it now
+        '''
+        if folderScan.future is None:
+            scanResults = self._scan_folder(folderScan.folderName, folderScan.ignoreMatcher,
+                                folderScan.archivePath, folderScan.archiveFolders)
+        else:
+            scanResults = folderScan.future.result()
+            with self._scanLock:
+                self._scansAhead -= 1
+        return scanResults
+
+    def _scan_folder(self, folderName, ignoreMatcher, archivePath=None, archiveFolders=None):
+        '''
+        Returns list of file names, dict of DirEntry objects for files by name,
+        and list of FolderScans for child folders in walk order
+        Files and folders that match ignore rules are removed
+        May be called on thread pool threads
+        '''
+        childArchives = []
+        if archivePath is not None:
+            if archiveFolders is None:
+                archiveFolders = self._list_archive(archivePath)
+            childFolders, fileNames, fileEntries = self._list_archive_folder(
+                    folderName, archivePath, archiveFolders)
+        else:
+            if self._indexFolders is not None:
+                childFolders, fileNames, fileEntries = self._list_index_folder(folderName)
+            else:
+                childFolders, fileNames, fileEntries = self._list_folder(folderName)
+
+            if ignoreMatcher is not None:
+                ignoreMatcher = ignoreMatcher.load_folder(folderName, fileNames)
+                fileNames = ignoreMatcher.filter_names(folderName, fileNames, False)
+                childFolders = ignoreMatcher.filter_names(folderName, childFolders, True)
+
+            # Archives are walked as folders instead of measured as files
+            if self._expandArchives and self._expandSubdirs:
+                childArchives = [fileName for fileName in fileNames if
+                                    archive.is_archive(fileName) and not
+                                    (self._skipFiles is not None and self._skipFiles.match(fileName))]
+                if childArchives:
+                    fileNames = [fileName for fileName in fileNames if fileName not in childArchives]
+
+        # Remove any folders, and sort remaining to ensure consistent walk
+        # order across file systems (for our testing if nothing else)
+        childScans = []
+        if self._expandSubdirs:
             self._remove_skip_dirs(folderName, childFolders)
-            childFolders.sort()
+            for childFolder in sorted(childFolders + childArchives):
+                childPath = os.path.join(folderName, childFolder)
+                if archivePath is not None:
+                    childScans.append(self._submit_scan(
+                            childPath, None, archivePath, archiveFolders))
+                elif childFolder in childArchives:
+                    childScans.append(self._submit_scan(childPath, None, childPath))
+                else:
+                    childMatcher = None
+                    if ignoreMatcher is not None:
+                        childMatcher = ignoreMatcher.child(childFolder)
+                    childScans.append(self._submit_scan(childPath, childMatcher))
+
+        return fileNames, fileEntries, childScans
+
+    def _list_folder(self, folderName):
+        '''
+        Returns list of child folder names, list of file names, and dict
+        of DirEntry objects for files by name
+        Like os.walk, links to folders are not followed and folders that
+        cannot be listed are skipped
+        '''
+        childFolders = []
+        fileNames = []
+        fileEntries = {}
+        try:
+            with os.scandir(folderName) as dirEntries:
+                for dirEntry in dirEntries:
+                    try:
+                        isFolder = dirEntry.is_dir()
+                    except OSError:
+                        isFolder = False
+                    if isFolder:
+                        if not dirEntry.is_symlink():
+                            childFolders.append(dirEntry.name)
+                    else:
+                        fileNames.append(dirEntry.name)
+                        fileEntries[dirEntry.name] = dirEntry
+        except OSError as e:
+            log.msg(1, "Cannot scan folder {}: {}".format(folderName, str(e)))
+
+        # When listing ahead, also stat files while on the pool thread; the
+        # DirEntry caches the stat for the walk. Errors are left for the walk.
+        if self._scanPool is not None:
+            for fileName, dirEntry in fileEntries.items():
+                if not (self._skipFiles is not None and self._skipFiles.match(fileName)):
+                    try:
+                        dirEntry.stat()
+                    except OSError:
+                        pass
+
+        return childFolders, fileNames, fileEntries
+
+    def _root_ignore_matcher(self):
+        if self._useIgnoreFiles:
+            return ignorerules.IgnoreMatcher()
+        return None
+
+    def _load_git_index(self, pathToMeasure):
+        '''
+        If using the git index, load tracked folders and files for the root
+        Roots that aren't in a git checkout (or have an index format that
+        isn't supported) are walked normally
+        '''
+        self._indexRoot = None
+        self._indexFolders = None
+        if self._useGitIndex:
+            indexPath, relFolder = gitindex.find_index(pathToMeasure)
+            if indexPath is None:
+                log.msg(1, "No git index, walking folders: {}".format(pathToMeasure))
+            else:
+                try:
+                    self._indexFolders = gitindex.index_folders(indexPath, relFolder)
+                    self._indexRoot = pathToMeasure
+                except (utils.JobException, EnvironmentError) as e:
+                    log.msg(1, "Cannot use git index, walking folders: {}".format(str(e)))
+
+    def _list_index_folder(self, folderName):
+        '''
+        List a folder from the git index, in the same form as _list_folder
+        '''
+        relFolder = folderName[len(self._indexRoot):].lstrip(os.sep)
+        if os.altsep:
+            relFolder = relFolder.lstrip(os.altsep)
+        fileNames, childFolders = self._indexFolders.get(
+                relFolder.replace(os.sep, '/'), ([], set([])))
+        fileEntries = {}
+        for fileName in fileNames:
+            fileEntries[fileName] = gitindex.IndexEntry(
+                    fileName, os.path.join(folderName, fileName))
+        return list(childFolders), list(fileNames), fileEntries
+
+    def _list_archive(self, archivePath):
+        '''
+        Returns folders listed from an archive, or an empty listing if the
+        archive cannot be read
+        '''
+        try:
+            return archive.archive_folders(archivePath)
+        except EnvironmentError as e:
+            log.msg(1, "Cannot list archive {}: {}".format(archivePath, str(e)))
+            return {}
+
+    def _list_archive_folder(self, folderName, archivePath, archiveFolders):
+        '''
+        List a folder in an archive, in the same form as _list_folder
+        '''
+        relFolder = folderName[len(archivePath):].lstrip(os.sep)
+        fileNames, fileEntries, childFolders = archiveFolders.get(
+                relFolder.replace(os.sep, '/'), ([], {}, set([])))
+        return list(childFolders), list(fileNames), fileEntries
+
+    def _get_file_stats(self, folderName, fileName, dirEntry, archivePath=None):
+        '''
+        Returns file stats tuple, or None if file cannot be accessed
+        Files listed from an archive are marked with its path
+        '''
+        try:
+            return utils.get_file_stats(os.path.join(folderName, fileName),
+                    dirEntry, archivePath)
+        except Exception as e:
+            # Don't fail the job on files that cannot be accessed, such as
+            # some cases of invalid Windows file names
+            log.msg(1, "Skipping file that cannot be accessed: {} -- {}".format(
+                    os.path.join(folderName, fileName), str(e)))
+            log.stack()
+            return None
 
     def _valid_folder(self, folderName):
         '''
@@ -114,75 +455,62 @@ class FolderWalker( object ):
 
         return validFolder
 
-    def _get_files_to_process(self, folderName, fileNames, fileFilters, configPath):
+    def _get_files_to_process(self, fileNames, filterDispatch):
         '''
         Filter the list of files based on command line options and active
         config file filters
+        Returns list of (fileName, configEntrys) for files to process
         '''
-        # if fileFilters is empty it means an empty config file, so skip all files
-        if not fileFilters:
+        # if there are no filters it means an empty config file, so skip all files
+        if not filterDispatch.fileFilters:
             return []
 
-        # Optimize the most common matching of extensions by creating cache of
-        # simple '*.xxx' extensions from config filters for each config file
-        filterExts = []
-        try:
-            filterExts = self._configFilterCache[configPath]
-        except KeyError:
-            filterSplits = [os.path.splitext(fileFilter) for fileFilter in fileFilters if
-                                os.path.splitext(fileFilter)[0] == '*']
-            filterExts = [ext for _root, ext in filterSplits]
-            self._configFilterCache[configPath] = filterExts
-
-        # Select files based on matching filters
+        # Select files based on matching filters, getting config entries for
+        # the file in the same lookup
         filesToProcess = []
         for fileName in fileNames:
 
             # Filter file list by command-line postive filter, if provided
-            if fileext.file_matches_filters(fileName, self._fileExtFilters):
-
-                # Optimize most common case of direct match of file extension, then
-                # fall back to doing a full filter match on config file filter
-                _root, fileExt = os.path.splitext(fileName)
-                fileFilter = None
-                if fileExt in filterExts:
-                    fileFilter = '*' + fileExt
-                else:
-                    fileFilter = fileext.file_matches_filters(fileName, fileFilters)
+            if self._fileExtFilters is None or self._fileExtFilters.match(fileName):
+                fileFilter, configEntrys = filterDispatch.match_entries(fileName)
                 if fileFilter is not None:
-                    filesToProcess.append((fileName, fileFilter))
+                    filesToProcess.append((fileName, configEntrys))
 
         # Remove files that should be skipped
-        if self._skipFiles:
-            filesToProcess = [(fileName, fileFilter) for fileName, fileFilter in filesToProcess if
-                                not fileext.file_matches_filters(fileName, self._skipFiles)]
+        if self._skipFiles is not None:
+            filesToProcess = [(fileName, configEntrys) for fileName, configEntrys in filesToProcess if
+                                self._skipFiles.match(fileName) is None]
 
         # Debug tracing of files that were not measured
         if log.level():
-            filesSkipped = set(fileNames) - set([f for f, _filter in filesToProcess])
+            filesSkipped = set(fileNames) - set([f for f, _entrys in filesToProcess])
             if filesSkipped:
                 log.file(2, "SkippingFiles: %s" % filesSkipped)
 
         return filesToProcess
 
-    def _get_configs_for_file(self, fileName, fileFilter, activeConfigs, configPath):
+    def _get_shard_files(self, relFolder, fileNames):
         '''
-        Return only the needed config items for the given file
-        Use a cache based on file filter to optimize for the single config file case.
+        Keep the files in our shard, based on a hash of the path relative to
+        the path being measured, so each machine gets the same partition
+        Files outside the shard are not counted in this job
         '''
-        configEntrys = None
-        keyName = str(configPath) + str(fileFilter)
-        try:
-            configEntrys = self._configEntryCache[keyName]
-        except KeyError:
-            configEntrys = configstack.config_items_for_file(activeConfigs, fileName)
-            self._configEntryCache[keyName] = configEntrys
-        return configEntrys
+        shardNum, numShards = self._shard
+        relFolder = relFolder.replace(os.sep, '/').strip('/')
+        shardFiles = []
+        for fileName in fileNames:
+            relPath = relFolder + '/' + fileName if relFolder else fileName
+            # Not a security use, which FIPS builds of OpenSSL require for md5
+            pathHash = hashlib.md5(relPath.encode('utf-8', 'surrogateescape'),
+                    usedforsecurity=False).digest()
+            if int.from_bytes(pathHash[:8], 'big') % numShards == shardNum - 1:
+                shardFiles.append(fileName)
+        return shardFiles
 
     def _remove_skip_dirs(self, root, dirs):
         '''
         Decide what children dirs should be skipped
-        Filter out dirs in place (vs a copy), so os.walk will skip
+        Filter out dirs in place (vs a copy), so the walk will skip
         '''
         dirsToRemove = []
         for folderPattern in self._skipFolders:
@@ -0,0 +1,209 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Git index support
+
+    Reads the list of tracked files directly from a repository's .git/index,
+    so a checkout can be enumerated with one sequential file read instead of
+    a walk of the folder tree (which includes untracked build output).
+
+    Stats recorded in the index are only as current as the last time git
+    refreshed it, and files edited since then would be measured (and
+    replayed from an inventory) with stale sizes and times. So files listed
+    from the index are stat'd like files from a folder listing.
+
+    Indexes with extensions that must be understood to read the entries
+    (such as a split index) aren't supported, and their roots are walked.
+'''
+
+import os
+import struct
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from . import utils
+
+
+INDEX_SIGNATURE = b'DIRC'
+INDEX_HEADER = struct.Struct('>4sII')
+
+# ctime s/ns, mtime s/ns, dev, ino, mode, uid, gid, size, sha1, flags
+INDEX_ENTRY = struct.Struct('>IIIIIIIIII20sH')
+
+ENTRY_NAME_MASK = 0x0fff
+ENTRY_STAGE_MASK = 0x3000
+ENTRY_EXTENDED = 0x4000
+ENTRY_SKIP_WORKTREE = 0x4000
+MODE_TYPE_MASK = 0o170000
+MODE_REGULAR_FILE = 0o100000
+
+# Extensions follow the entries, each a 4-byte signature and 4-byte length;
+# those whose signature doesn't start with 'A'-'Z' change how entries are read
+INDEX_EXTENSION = struct.Struct('>4sI')
+INDEX_HASH_BYTES = (20, 32)
+
+
+def find_index(folder):
+    '''
+    Returns path to the index for the git checkout that contains folder,
+    along with folder's path relative to the top of the checkout using '/'
+    separators, or (None, None) if folder is not in a checkout
+    '''
+    folder = os.path.abspath(folder)
+    topFolder = folder
+    while True:
+        gitPath = os.path.join(topFolder, '.git')
+        gitDir = None
+        if os.path.isdir(gitPath):
+            gitDir = gitPath
+        elif os.path.isfile(gitPath):
+            # Worktrees and submodules have a file pointing to the git dir
+            with open(gitPath, 'r') as gitFile:
+                gitLine = gitFile.readline().strip()
+            if gitLine.startswith('gitdir:'):
+                gitDir = os.path.join(topFolder, gitLine[len('gitdir:'):].strip())
+        if gitDir is not None:
+            indexPath = os.path.join(gitDir, 'index')
+            if not os.path.isfile(indexPath):
+                return None, None
+            relFolder = os.path.relpath(folder, topFolder)
+            relFolder = '' if relFolder == '.' else relFolder.replace(os.sep, '/')
+            return indexPath, relFolder
+        parentFolder = os.path.dirname(topFolder)
+        if parentFolder == topFolder:
+            return None, None
+        topFolder = parentFolder
+
+
+def read_index(indexPath):
+    '''
+    Returns list of paths for regular files tracked in the index
+    Paths use '/' separators and are relative to the top of the checkout
+    Raises utils.JobException if the index format is not supported
+    '''
+    with open(indexPath, 'rb') as indexFile:
+        indexData = indexFile.read()
+
+    signature, version, numEntries = INDEX_HEADER.unpack_from(indexData, 0)
+    if signature != INDEX_SIGNATURE or version not in (2, 3, 4):
+        raise utils.JobException("Unsupported git index: {}".format(indexPath))
+
+    trackedFiles = []
+    pos = INDEX_HEADER.size
+    prevPath = b''
+    prevTrackedPath = None
+    for _entryNum in range(numEntries):
+        entryStart = pos
+        (   _ctimeSec, _ctimeNsec, _mtimeSec, _mtimeNsec, _dev, _inode,
+            mode, _uid, _gid, _size, _sha1, flags
+            ) = INDEX_ENTRY.unpack_from(indexData, pos)
+        pos += INDEX_ENTRY.size
+
+        skipWorktree = False
+        if version >= 3 and flags & ENTRY_EXTENDED:
+            extendedFlags, = struct.unpack_from('>H', indexData, pos)
+            skipWorktree = bool(extendedFlags & ENTRY_SKIP_WORKTREE)
+            pos += 2
+
+        # Version 4 compresses paths relative to the previous entry
+        if version == 4:
+            stripLen, pos = _read_varint(indexData, pos)
+            nameEnd = indexData.index(b'\0', pos)
+            path = prevPath[:len(prevPath) - stripLen] + indexData[pos:nameEnd]
+            pos = nameEnd + 1
+        else:
+            nameLen = flags & ENTRY_NAME_MASK
+            if nameLen < ENTRY_NAME_MASK:
+                nameEnd = pos + nameLen
+            else:
+                nameEnd = indexData.index(b'\0', pos)
+            path = indexData[pos:nameEnd]
+            # Entries are padded with 1-8 nul bytes to a multiple of 8
+            entryLen = nameEnd - entryStart
+            pos = entryStart + (entryLen + 8) // 8 * 8
+        prevPath = path
+
+        if (mode & MODE_TYPE_MASK) != MODE_REGULAR_FILE or skipWorktree:
+            continue
+        # Conflicted files have an entry for each merge stage, sorted together
+        if flags & ENTRY_STAGE_MASK and path == prevTrackedPath:
+            continue
+        prevTrackedPath = path
+        trackedFiles.append(path.decode('utf-8', 'surrogateescape'))
+
+    _check_extensions(indexData, pos, indexPath)
+
+    log.file(1, "Read {} tracked files from: {}".format(len(trackedFiles), indexPath))
+    return trackedFiles
+
+
+class IndexEntry( object ):
+    '''
+    Stands in for os.DirEntry for files listed from the index
+    Like DirEntry, the file's stat is cached on first use
+    '''
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+def index_folders(indexPath, relFolder):
+    '''
+    Returns dict of folders under relFolder from the index, with '/' separated
+    paths relative to relFolder as keys, and values of:
+        (list of file names, set of child folder names)
+    '''
+    prefix = relFolder + '/' if relFolder else ''
+    folders = { '': ([], set([])) }
+    for path in read_index(indexPath):
+        if not path.startswith(prefix):
+            continue
+        path = path[len(prefix):]
+        folder, _sep, fileName = path.rpartition('/')
+        if folder not in folders:
+            _add_folder(folders, folder)
+        folders[folder][0].append(fileName)
+    return folders
+
+#-----------------------------------------------------------------------------
+
+def _add_folder(folders, folder):
+    folders[folder] = ([], set([]))
+    parentFolder, _sep, folderName = folder.rpartition('/')
+    if parentFolder not in folders:
+        _add_folder(folders, parentFolder)
+    folders[parentFolder][1].add(folderName)
+
+def _check_extensions(indexData, pos, indexPath):
+    '''
+    Walk the extensions after the entries, up to the trailing hash, raising
+    utils.JobException for any that aren't optional, such as the 'link'
+    extension of a split index, which keeps most entries in another file
+    '''
+    dataEnd = len(indexData) - min(INDEX_HASH_BYTES)
+    while pos + INDEX_EXTENSION.size <= dataEnd:
+        signature, extensionLen = INDEX_EXTENSION.unpack_from(indexData, pos)
+        pos += INDEX_EXTENSION.size + extensionLen
+        if pos > dataEnd:
+            # Not an extension; the rest is the hash
+            break
+        if not b'A' <= signature[:1] <= b'Z':
+            raise utils.JobException("Unsupported git index extension {}: {}".format(
+                    signature.decode('ascii', 'replace'), indexPath))
+
+def _read_varint(data, pos):
+    '''
+    Decode git's offset varint used in version 4 index paths
+    '''
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7f
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7f)
+    return value, pos
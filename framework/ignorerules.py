@@ -0,0 +1,205 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Ignore rules
+
+    Support for .gitignore style files, which are loaded as the folder walk
+    descends. Rules from each ignore file apply to the folder the file is in
+    and everything below it, with rules from deeper files and later lines
+    taking precedence, as with git:
+
+        # comment             Blank lines and comments are skipped
+        name                  Matches files or folders at any depth
+        name/                 Matches only folders
+        dir/name, /name       Patterns with a '/' are relative to the file
+        *, ?, [a-z]           Wildcards, which do not match '/'
+        **/name, dir/**       Match across any number of folders
+        !pattern              Re-include something a previous rule ignored
+
+    Each ignore file is compiled once, and the folder walk keeps an
+    IgnoreMatcher for each folder that chains the files that apply to it.
+    Ignored folders are removed from the walk before they are listed.
+'''
+
+import os
+import re
+
+from code_surveyor.framework import log  # No relative path to share module globals
+
+
+# Ignore files are applied in this order, so later ones take precedence
+IGNORE_FILE_NAMES = ['.gitignore', '.surveyorignore']
+
+
+class IgnoreFile( object ):
+    '''
+    Compiled rules from one ignore file
+    A combined regex of all the rules quickly rules out paths the file
+    does not apply to; otherwise rules are checked last to first.
+    '''
+    def __init__(self, filePath):
+        self.filePath = filePath
+        self._rules = []
+        with open(filePath, 'r', encoding='utf-8', errors='replace') as ignoreFile:
+            for line in ignoreFile:
+                rule = _compile_rule(line)
+                if rule is not None:
+                    self._rules.append(rule)
+        self._anyRule = None
+        if self._rules:
+            self._anyRule = re.compile('|'.join(
+                    ['(?:{})'.format(ruleRe.pattern) for ruleRe, _negate, _dirOnly in self._rules]))
+        log.file(1, "Ignore file, {} rules: {}".format(len(self._rules), filePath))
+
+    def match(self, relPath, isFolder):
+        '''
+        Returns True if relPath is ignored, False if it is re-included,
+        or None if no rules in this file apply
+        '''
+        if self._anyRule is None or not self._anyRule.match(relPath):
+            return None
+        for ruleRe, negate, dirOnly in reversed(self._rules):
+            if dirOnly and not isFolder:
+                continue
+            if ruleRe.match(relPath):
+                return not negate
+        return None
+
+
+class IgnoreMatcher( object ):
+    '''
+    Matcher for names in one folder. Holds the ignore files that apply to
+    the folder, each with the folder's path relative to the ignore file.
+    Matchers are immutable, so they can be shared with folder listing threads.
+    '''
+    def __init__(self, ignoreLevels=()):
+        self._ignoreLevels = tuple(ignoreLevels)
+
+    def load_folder(self, folderName, fileNames):
+        '''
+        Returns matcher for the folder that includes any ignore files in it
+        '''
+        newLevels = []
+        for ignoreName in IGNORE_FILE_NAMES:
+            if ignoreName in fileNames:
+                try:
+                    newLevels.append((IgnoreFile(os.path.join(folderName, ignoreName)), ''))
+                except EnvironmentError as e:
+                    log.msg(1, "Cannot read ignore file: {}".format(str(e)))
+        if not newLevels:
+            return self
+        return IgnoreMatcher(self._ignoreLevels + tuple(newLevels))
+
+    def child(self, childFolder):
+        '''
+        Returns matcher for a child folder, before its own ignore files are loaded
+        '''
+        if not self._ignoreLevels:
+            return self
+        return IgnoreMatcher([(ignoreFile, prefix + childFolder + '/') for
+                                ignoreFile, prefix in self._ignoreLevels])
+
+    def is_ignored(self, name, isFolder):
+        for ignoreFile, prefix in reversed(self._ignoreLevels):
+            ignored = ignoreFile.match(prefix + name, isFolder)
+            if ignored is not None:
+                return ignored
+        return False
+
+    def filter_names(self, folderName, names, isFolder):
+        '''
+        Returns list of names that are not ignored
+        '''
+        if not self._ignoreLevels:
+            return names
+        keptNames = []
+        for name in names:
+            if self.is_ignored(name, isFolder):
+                log.file(1, "Ignoring: {}".format(os.path.join(folderName, name)))
+            else:
+                keptNames.append(name)
+        return keptNames
+
+#-----------------------------------------------------------------------------
+
+def _compile_rule(line):
+    '''
+    Returns (regex, negate, dirOnly) for an ignore file line, or None
+    Regexes match paths relative to the ignore file's folder, using '/'
+    '''
+    line = line.rstrip('\n').rstrip('\r')
+    # Trailing spaces are ignored unless escaped
+    while line.endswith(' ') and not line.endswith('\\ '):
+        line = line[:-1]
+    if not line or line.startswith('#'):
+        return None
+
+    negate = False
+    if line.startswith('!'):
+        negate = True
+        line = line[1:]
+    elif line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+
+    dirOnly = False
+    if line.endswith('/'):
+        dirOnly = True
+        line = line.rstrip('/')
+
+    # Patterns with a slash anywhere but the end are anchored to the folder
+    anchored = '/' in line
+    line = line.lstrip('/')
+    if not line:
+        return None
+
+    regexStr = ('' if anchored else '(?:.*/)?') + _translate(line) + '$'
+    try:
+        return (re.compile(regexStr), negate, dirOnly)
+    except re.error:
+        log.msg(1, "Invalid ignore pattern: {}".format(line))
+        return None
+
+def _translate(pattern):
+    '''
+    Translate ignore pattern wildcards into regex
+    '''
+    regexStr = ''
+    pos = 0
+    patternLen = len(pattern)
+    while pos < patternLen:
+        char = pattern[pos]
+        if pattern.startswith('**', pos):
+            atStart = pos == 0 or pattern[pos - 1] == '/'
+            if atStart and pattern.startswith('**/', pos):
+                regexStr += '(?:.*/)?'
+                pos += 3
+                continue
+            if atStart and pos + 2 == patternLen:
+                regexStr += '.*'
+                pos += 2
+                continue
+            regexStr += '[^/]*'
+            pos += 2
+        elif char == '*':
+            regexStr += '[^/]*'
+            pos += 1
+        elif char == '?':
+            regexStr += '[^/]'
+            pos += 1
+        elif char == '[':
+            classEnd = pattern.find(']', pos + 2)
+            if classEnd < 0:
+                regexStr += re.escape(char)
+                pos += 1
+            else:
+                charClass = pattern[pos + 1:classEnd].replace('\\', '\\\\')
+                if charClass.startswith('!'):
+                    charClass = '^' + charClass[1:]
+                regexStr += '[' + charClass + ']'
+                pos = classEnd + 1
+        elif char == '\\' and pos + 1 < patternLen:
+            regexStr += re.escape(pattern[pos + 1])
+            pos += 2
+        else:
+            regexStr += re.escape(char)
+            pos += 1
+    return regexStr
@@ -0,0 +1,165 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    FileInventory
+    Persistent inventory of measured files for incremental jobs
+
+    For each root path measured, the inventory keeps the size, mtime, and
+    inode of each file from the last run, along with a signature of the config
+    entries used and the output that was produced. On the next run, files
+    whose stats and config have not changed are not sent to workers; their
+    prior output is replayed to the output thread instead.
+
+    Stats are taken when a file is walked, and a file can be edited after
+    that without changing its size or mtime, if the edit falls in the same
+    mtime tick. As with git's "racily clean" index entries, files with an
+    mtime close to or after the start of the run that recorded them are
+    measured again instead of replayed.
+
+    The Job looks up and registers files from the main thread, while output
+    is recorded from the output thread, so access is serialized with a lock.
+'''
+
+import os
+import time
+import pickle
+import sqlite3
+import threading
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from . import utils
+
+
+INVENTORY_FILE_NAME = 'surveyor.inventory'
+INVENTORY_DB_TIMEOUT = 30.0
+
+# Commit recorded output to the inventory after this many files
+COMMIT_FILES = 1024
+
+# Files modified within this many seconds before the run that recorded them
+# may have changed after they were measured (covers coarse mtime resolution)
+RACY_MTIME_SECONDS = 2.0
+
+
+class FileInventory( object ):
+    '''
+    Only files measured without errors are recorded, so files with errors
+    are measured again on the next run.
+    Files from a root that were not seen in a completed job are removed.
+    '''
+    def __init__(self, inventoryFolder):
+        self._inventoryPath = os.path.join(inventoryFolder, INVENTORY_FILE_NAME)
+        self._lock = threading.Lock()
+        self._db = None
+        self._runId = int(time.time() * 1000)
+        self._rootsSeen = set([])
+        self._uncommitted = 0
+
+        # Files sent to workers, waiting for output to be recorded
+        # Key is file path, value is (root, fileStats, signature)
+        self._pending = {}
+
+        self.filesReplayed = 0
+
+    def open(self):
+        folder = os.path.dirname(self._inventoryPath)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        self._db = sqlite3.connect(self._inventoryPath,
+                        timeout=INVENTORY_DB_TIMEOUT, check_same_thread=False)
+        self._db.execute('''CREATE TABLE IF NOT EXISTS files (
+                root TEXT, path TEXT, size INTEGER, mtime REAL, inode INTEGER,
+                signature TEXT, output BLOB, runId INTEGER,
+                PRIMARY KEY (root, path))''')
+        self._db.commit()
+        log.msg(1, "Opened file inventory: {}".format(self._inventoryPath))
+
+    def close(self, jobComplete):
+        '''
+        If the job completed, files sent to workers that didn't return
+        output had nothing to measure, and files not seen are gone
+        '''
+        if self._db is None:
+            return
+        with self._lock:
+            if jobComplete:
+                for filePath, (root, fileStats, signature) in self._pending.items():
+                    self._record(root, filePath, fileStats, signature, [])
+                for root in self._rootsSeen:
+                    self._db.execute('DELETE FROM files WHERE root = ? AND runId != ?',
+                            (root, self._runId))
+            self._pending = {}
+            self._db.commit()
+            self._db.close()
+            self._db = None
+        log.msg(1, "Closed file inventory, {} files replayed".format(self.filesReplayed))
+
+    def start_root(self, root):
+        '''
+        Called before each root path is walked
+        '''
+        with self._lock:
+            self._rootsSeen.add(os.path.abspath(root))
+
+    def get_output(self, root, filePath, fileStats, signature):
+        '''
+        Returns the prior outputList for the file if it is unchanged,
+        otherwise None
+        '''
+        root = os.path.abspath(root)
+        with self._lock:
+            row = self._db.execute(
+                    'SELECT size, mtime, inode, signature, output, runId FROM files WHERE root = ? AND path = ?',
+                    (root, filePath)).fetchone()
+            if row is None:
+                return None
+            size, mtime, inode, priorSignature, output, runId = row
+            if (size != fileStats[utils.FILE_STAT_SIZE] or
+                    mtime != fileStats[utils.FILE_STAT_MTIME] or
+                    inode != fileStats[utils.FILE_STAT_INODE] or
+                    priorSignature != signature):
+                return None
+            if mtime >= runId / 1000.0 - RACY_MTIME_SECONDS:
+                log.file(2, "Inventory racily clean: {}".format(filePath))
+                return None
+            self._db.execute('UPDATE files SET runId = ? WHERE root = ? AND path = ?',
+                    (self._runId, root, filePath))
+            self._count_change()
+        self.filesReplayed += 1
+        log.file(2, "Inventory unchanged: {}".format(filePath))
+        return pickle.loads(output)
+
+    def add_pending(self, root, filePath, fileStats, signature):
+        '''
+        Register a file sent to workers, so its output can be recorded
+        '''
+        with self._lock:
+            self._pending[filePath] = (os.path.abspath(root), fileStats, signature)
+
+    def file_measured(self, filePath, outputList, errorList):
+        '''
+        Called from the output thread with output for each file
+        '''
+        with self._lock:
+            pendingFile = self._pending.pop(filePath, None)
+            if pendingFile is not None and not errorList and self._db is not None:
+                root, fileStats, signature = pendingFile
+                self._record(root, filePath, fileStats, signature, outputList)
+
+    #-------------------------------------------------------------------------
+
+    def _record(self, root, filePath, fileStats, signature, outputList):
+        self._db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                root, filePath,
+                fileStats[utils.FILE_STAT_SIZE],
+                fileStats[utils.FILE_STAT_MTIME],
+                fileStats[utils.FILE_STAT_INODE],
+                signature,
+                pickle.dumps(outputList, pickle.HIGHEST_PROTOCOL),
+                self._runId))
+        self._count_change()
+
+    def _count_change(self):
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_FILES:
+            self._db.commit()
+            self._uncommitted = 0
@@ -4,17 +4,34 @@
 
     Executes a measurement job against a folder tree, using jobworker processes
     to read files and delegate measurement tasks to Surveyor modules.
+
+    Workers can also be threads, or files can be measured inline on the main
+    thread. By default small jobs are measured inline, since starting worker
+    processes takes longer than measuring a few files, and threads are used
+    on Python builds without the GIL. Workers can also be agents on other
+    machines, with the Job as their coordinator (see remote.py).
 '''
 
 import os
-import time
+import sys
+import hashlib
+import functools
+import threading
 import multiprocessing
-from queue import Empty, Full
+from queue import Queue, Empty, Full
 
 from code_surveyor.framework import log  # No relative path to share module globals
 from . import jobworker
 from . import jobout
 from . import folderwalk
+from . import archive
+from . import configregistry
+from . import resultcache
+from . import inventory
+from . import costmodel
+from . import remote
+from . import resultring
+from . import uistrings
 from . import utils
 
 # Prefixing files/folders to ignore with '.' is almost universal now
@@ -25,25 +42,69 @@ DEFAULT_FILES_TO_SKIP = ['.?*']
 # running under the command shell process 
 DEFAULT_NUM_WORKERS = max(1, multiprocessing.cpu_count()-1)
 
+# How workers are run
+BACKEND_AUTO = 'auto'
+BACKEND_PROCESSES = 'processes'
+BACKEND_THREADS = 'threads'
+BACKEND_INLINE = 'inline'
+BACKEND_REMOTE = 'remote'
+
+# With the auto backend, jobs with no more than these files and bytes
+# are measured inline; the count stops once either is exceeded
+SMALL_JOB_FILES = 64
+SMALL_JOB_BYTES = 2000000
+
 # Seconds to wait at various points
-MAIN_PROCESSING_SLEEP = 0.2
+# The main thread blocks on output from workers, but wakes at least every
+# MAIN_STATUS_TIMEOUT to update status and check the control queue
+MAIN_STATUS_TIMEOUT = 0.2
 WORKER_EXIT_TIMEOUT = 0.4
 WORKER_EXIT_TRIES = 8
 JOB_EXIT_TIMEOUT = 1.0
-TASK_FULL_TIMEOUT = 0.4
-
-# Max number of files and size in bytes that will be sent to a worker
-# Smaller values result in more multiprocessing overhead, while larger
-# values risk not providing a good distribution of files across cores
-# if file/folder sizes vary widely
-QUEUE_PACKAGE_MAX_ITEMS = 256
-QUEUE_PACKAGE_MAX_BYTES = 256000
+QUEUE_FULL_TIMEOUT = 0.4
+
+# Task and output queues are bounded, so the folder walk waits for workers
+# and workers wait for output to be written, instead of work and results
+# piling up in memory on large trees
+TASK_QUEUE_PACKAGES_PER_WORKER = 4
+OUT_QUEUE_PACKAGES_PER_WORKER = 4
+
+# Work packages are sized to take about a target time for a worker to measure,
+# based on the measure time per file and per byte of recent packages
+# Smaller packages result in more multiprocessing overhead, while larger
+# packages risk not providing a good distribution of files across cores,
+# so the target shrinks when workers are idle and grows while they have
+# packages waiting. Sizes start at PACKAGE_START_ITEMS/BYTES until the first
+# packages are measured.
+PACKAGE_START_SECONDS = 0.25
+PACKAGE_MIN_SECONDS = 0.02
+PACKAGE_MAX_SECONDS = 2.0
+PACKAGE_START_ITEMS = 256
+PACKAGE_START_BYTES = 256000
+PACKAGE_MAX_ITEMS = 16384
+PACKAGE_MIN_BYTES = 4096
+PACKAGE_MAX_BYTES = 64000000
+PACKAGE_SHRINK = 0.5
+PACKAGE_GROW = 1.25
+
+# Weight of each new package in the running average of measure rates
+PACKAGE_RATE_WEIGHT = 0.2
+
+# Output replayed from the inventory is sent in packages of this many files
+REPLAY_PACKAGE_ITEMS = 256
 
 # Number of unfiltered files before sending a work package
 # This prevents a small work package from not being sent if 
 # searching through a large number of files not being measured
 MAX_FILES_BEFORE_SEND = 256
 
+# With more than one worker, files are held by a cost model scheduler and
+# sent most expensive first, in packages of the target predicted time
+# Packages are sent when workers have less than PACKAGES_AHEAD_PER_WORKER
+# waiting, or the scheduler holds more than SCHEDULE_MAX_ITEMS files
+PACKAGES_AHEAD_PER_WORKER = 2
+SCHEDULE_MAX_ITEMS = 16384
+
 
 class Options( object ):
     '''
@@ -58,7 +119,20 @@ class Options( object ):
         self.skipFiles = DEFAULT_FILES_TO_SKIP
         self.recursive = True
         self.numWorkers = DEFAULT_NUM_WORKERS
+        self.backend = BACKEND_AUTO
+        self.remoteAddress = None
+        self.walkThreads = 0
+        self.useGitIndex = False
+        self.useIgnoreFiles = False
+        self.expandArchives = False
+        self.shard = None
+        self.resultCacheFolder = None
+        self.resultCacheMaxMb = resultcache.DEFAULT_CACHE_MAX_MB
+        self.inventoryFolder = None
+        self.completedFiles = None
+        self.outputProcess = False
         self.breakOnError = False
+        self.fileTimeBudget = None
         self.configInfoOnly = False
         self.profileName = None
 
@@ -70,9 +144,13 @@ class Job( object ):
     The out thread gets output from the output work queue and calls
     back to the application (display update and writing to the output
     file occurs on this output thread)
+    A Job normally creates its own workers, but can be given a group of
+    workers that is kept running between jobs, which it leaves running
+    if the job completes cleanly.
     '''
     def __init__(self, configStack, options,
-                    file_measured_callback, status_callback):
+                    file_measured_callback, status_callback, workers=None,
+                    output_state_callback=None, set_output_state_callback=None):
 
         # Options define the life a job and cannot be modified
         self._options = options
@@ -86,27 +164,15 @@ class Job( object ):
         self.numFilteredFiles = 0
         self.numFilesToProcess = 0
 
+        # Set if the job measured all of its files without stopping early
+        self.complete = False
+
         # Exceptions that occurred in workers are collected and displayed
         # Unlike errors, exceptions will not generate rows in output
         self.exceptions = []
 
-        # Queues to communicate with Workers, and the output thread
-        self._taskQueue = multiprocessing.Queue()
-        self._controlQueue = multiprocessing.Queue()
-        self._outQueue = multiprocessing.Queue()
-        self._outThread = jobout.OutThread(
-                self._outQueue, self._controlQueue,
-                self._options.profileName, file_measured_callback)
-
-        # Create max number of workers (they will be started later as needed)
-        assert self._options.numWorkers > 0, "Less than 1 worker requested!"
-        context = (log.get_context(), self._options.profileName)
-        self._workers = self.Workers(
-                self._controlQueue, self._taskQueue, self._outQueue,
-                context, self._options.numWorkers)
-        log.msg(1, "Created {} workers".format(self._workers.num_max()))
-
-        # Create our object for tracking state of folder walking
+        # Create our object for tracking state of folder walking, which is
+        # also used to estimate the job size when choosing how to run workers
         self._pathsToMeasure = options.pathsToMeasure
         self._folderWalker = folderwalk.FolderWalker(
                 options.deltaPath,
@@ -116,7 +182,82 @@ class Job( object ):
                 options.skipFolders,
                 options.fileFilters,
                 options.skipFiles,
-                self.add_folder_files)
+                self.add_folder_files,
+                options.walkThreads,
+                options.useGitIndex,
+                options.useIgnoreFiles,
+                options.expandArchives,
+                options.shard)
+
+        # Create max number of workers (they will be started later as needed)
+        # The Workers own the queues to communicate with worker processes,
+        # which are also used by the output thread
+        # Workers and the output thread have their own stop events, and
+        # report problems to the Job on the error queue
+        self._ownWorkers = workers is None
+        if workers is None:
+            assert self._options.numWorkers > 0, "Less than 1 worker requested!"
+            context = (log.get_context(), self._options.profileName)
+            backend = self._options.backend
+            if backend == BACKEND_AUTO:
+                backend = self._auto_backend()
+            workers = self.Workers(context, self._options.numWorkers, backend,
+                    self._options.remoteAddress)
+        self._workers = workers
+        self._taskQueue = workers.taskQueue
+        self._errorQueue = workers.errorQueue
+        self._outQueue = workers.outQueue
+        log.msg(1, "Created {} workers: {}".format(
+                self._workers.num_max(), self._workers.backend))
+
+        # For incremental jobs, the inventory of files from prior runs
+        # records output as it is received by the out thread
+        self._inventory = None
+        if (self._options.inventoryFolder is not None and
+                self._options.deltaPath is None and not self._options.configInfoOnly):
+            self._inventory = inventory.FileInventory(self._options.inventoryFolder)
+            self._inventory.open()
+            self._app_file_measured = file_measured_callback
+            file_measured_callback = self._file_measured
+        self._configSignatures = {}
+        self._currentRoot = None
+        self._replayPackage = []
+
+        # Package sizes are adjusted from the time workers take to measure
+        # files, so file sizes (and classes) are held until output arrives
+        self._packageSizer = self.PackageSizer()
+        self._pendingFiles = {}
+
+        # Cost model scheduling is only useful with more than one worker,
+        # and otherwise files are measured in walk order for repeatability
+        self._costModel = None
+        self._scheduler = None
+        if self._workers.num_max() > 1 and not self._options.configInfoOnly:
+            historyFolder = self._options.inventoryFolder
+            if historyFolder is None:
+                historyFolder = self._options.resultCacheFolder
+            self._costModel = costmodel.CostModel(historyFolder)
+            self._scheduler = costmodel.CostScheduler()
+
+        # Output is processed by a thread, or its own process, which
+        # passes application state back with the state callbacks
+        if self._use_out_process(output_state_callback):
+            self._outThread = jobout.OutProcess(
+                    self._outQueue, self._errorQueue,
+                    self._options.profileName, file_measured_callback,
+                    self._package_timed, self._workers.resultRings,
+                    output_state_callback, set_output_state_callback)
+        else:
+            self._outThread = jobout.OutThread(
+                    self._outQueue, self._errorQueue,
+                    self._options.profileName, file_measured_callback,
+                    self._package_timed, self._workers.resultRings)
+
+        # Workers open the result cache in their own process
+        self._resultCache = None
+        if self._options.resultCacheFolder is not None:
+            self._resultCache = resultcache.ResultCache(
+                    self._options.resultCacheFolder, self._options.resultCacheMaxMb)
 
         # Utility object for managing work packages; holds the state of the
         # work package that is being prepared for sending to queue
@@ -144,44 +285,96 @@ class Job( object ):
         else:
             self._put_files_in_queue(currentDir, deltaPath, filesAndConfigs)
             self._status_callback()
-        return self._check_command()
+        return self._check_errors()
 
     #-------------------------------------------------------------------------
 
     def run(self):
-        self._outThread.start()
-        self._fill_work_queue()
-        self._wait_process_packages()
-        self._wait_output_finish()
-        self._wait_then_exit()
+        jobComplete = False
+        keepWorkers = False
+        try:
+            # An output process is forked before job settings are put in the
+            # queues, which starts their threads
+            self._outThread.start()
+            self._workers.start_job(os.getcwd(),
+                    self._options.breakOnError, self._resultCache,
+                    self._options.fileTimeBudget)
+            self._fill_work_queue()
+            self._wait_process_packages()
+            outputFinished = self._wait_output_finish()
+            jobComplete = outputFinished and not self.exceptions
+            self.complete = jobComplete
+            if self._ownWorkers or not jobComplete:
+                self._wait_then_exit()
+            else:
+                self._wait_output_exit()
+                keepWorkers = True
+        finally:
+            # An output process is left to finish writing what it has
+            if not jobComplete:
+                self._outThread.stop_and_wait()
+            # Workers we were given may still have work from a job that
+            # did not finish, so they can't be used for another job
+            if not self._ownWorkers and not keepWorkers:
+                self._workers.stop()
+            # Shared memory isn't freed when a process exits, so result rings
+            # are unlinked on every exit path where workers aren't kept
+            if not keepWorkers:
+                self._workers.unlink_rings()
+            if self._inventory is not None:
+                self._inventory.close(jobComplete)
+            if self._costModel is not None and jobComplete:
+                self._costModel.save()
 
     def _fill_work_queue(self):
         log.cc(1, "Starting to fill task queue...")
-        for pathToMeasure in self._pathsToMeasure:
-            if self._check_command():
-                self._folderWalker.walk(pathToMeasure)
-        if self._check_command() and self._workPackage.size_items() > 0:
+        self._folderWalker.prefetch(self._pathsToMeasure)
+        try:
+            for pathToMeasure in self._pathsToMeasure:
+                if self._check_errors():
+                    self._currentRoot = pathToMeasure
+                    if self._inventory is not None:
+                        self._inventory.start_root(pathToMeasure)
+                    self._folderWalker.walk(pathToMeasure)
+        finally:
+            self._folderWalker.close()
+        if self._check_errors() and self._workPackage.size_items() > 0:
             self._send_current_package()
+        if self._check_errors() and self._scheduler is not None:
+            self._send_scheduled_packages()
+        if self._check_errors() and self._replayPackage:
+            self._send_replay_package()
 
     def _wait_process_packages(self):
         log.cc(1, "Task queue complete, waiting for workers to finish...")
-        while self._check_command() and self._task_queue_size() > 0:
-            time.sleep(MAIN_PROCESSING_SLEEP)
+        numReceived = self._outThread.taskPackagesReceived
+        while self._check_errors() and (self._task_queue_size() > 0 or
+                self._scheduler is not None and self._scheduler.size_items() > 0):
+            if self._scheduler is not None:
+                self._send_scheduled_packages()
+            self._outThread.wait_for_package(numReceived, MAIN_STATUS_TIMEOUT)
+            numReceived = self._outThread.taskPackagesReceived
             self._status_callback()
             log.cc(2, "Task queue size: " + str(self._task_queue_size()))
 
     def _wait_output_finish(self):
+        '''
+        Returns whether processing can continue after errors reported while
+        output is finished; exceptions are added to self.exceptions
+        '''
         log.cc(1, "Workers finished, waiting for output to finish...")
-        self._send_output_command('WORK_DONE')
-        while self._check_command() or self._outThread.is_alive():
+        self._put_output_package(jobout.OUTPUT_DONE)
+        while self._outThread.is_alive():
             self._outThread.join(JOB_EXIT_TIMEOUT)
             self._status_callback()
-            self._continueProcessing = not bool(self._controlQueue.empty())
+            self._check_errors()
+        return self._check_errors()
 
     def _wait_then_exit(self):
         log.cc(1, "Waiting to cleanup workers and output thread...")
-        self._send_workers_command('EXIT')
-        self._send_output_command('EXIT')
+        self._workers.stop()
+        self._workers.send_exit()
+        self._outThread.stop()
         for worker in self._workers():
             tries = 0
             while worker.is_alive() and tries < WORKER_EXIT_TRIES:
@@ -189,12 +382,18 @@ class Job( object ):
                 worker.join(WORKER_EXIT_TIMEOUT)
                 log.cc(2, "Worker {} is_alive: {}".format(
                         worker.name, worker.is_alive()))
-                self._check_command()
+                self._check_errors()
                 tries += 1
         self._outThread.join(JOB_EXIT_TIMEOUT)
-        self._close_queues()
+        self._workers.close_queues()
         log.cc(1, "TERMINATING")
 
+    def _wait_output_exit(self):
+        # Workers we were given are left running for the next job
+        log.cc(1, "Leaving workers running, waiting for output thread...")
+        self._outThread.stop()
+        self._outThread.join(JOB_EXIT_TIMEOUT)
+
     #-------------------------------------------------------------------------
     #   Work Package Processing
 
@@ -217,9 +416,49 @@ class Job( object ):
             return self.byteSize
         def items(self):
             return self.itemsToProcess
-        def ready_to_send(self):
-            return (self.size_items() >= QUEUE_PACKAGE_MAX_ITEMS or
-                    self.size_bytes() >= QUEUE_PACKAGE_MAX_BYTES)
+        def ready_to_send(self, maxItems, maxBytes):
+            return (self.size_items() >= maxItems or
+                    self.size_bytes() >= maxBytes)
+
+    class PackageSizer( object ):
+        '''
+        Sizes work packages to take about targetSeconds for a worker, using
+        running averages of measure time per file and per byte. Updated
+        from the output thread, and read by the main thread.
+        '''
+        def __init__(self):
+            self.targetSeconds = PACKAGE_START_SECONDS
+            self.maxItems = PACKAGE_START_ITEMS
+            self.maxBytes = PACKAGE_START_BYTES
+            self._itemSeconds = None
+            self._byteSeconds = None
+        def package_measured(self, numItems, numBytes, seconds,
+                                packagesOutstanding, numWorkers):
+            # Times can round to zero when results come from the result cache
+            seconds = max(seconds, PACKAGE_MIN_SECONDS / PACKAGE_MAX_ITEMS)
+            itemSeconds = seconds / numItems
+            byteSeconds = seconds / max(numBytes, 1)
+            if self._itemSeconds is None:
+                self._itemSeconds = itemSeconds
+                self._byteSeconds = byteSeconds
+            else:
+                self._itemSeconds += PACKAGE_RATE_WEIGHT * (itemSeconds - self._itemSeconds)
+                self._byteSeconds += PACKAGE_RATE_WEIGHT * (byteSeconds - self._byteSeconds)
+
+            # Outstanding packages include those being measured
+            if packagesOutstanding < numWorkers:
+                self.targetSeconds = max(PACKAGE_MIN_SECONDS,
+                        self.targetSeconds * PACKAGE_SHRINK)
+            elif packagesOutstanding >= numWorkers * PACKAGES_AHEAD_PER_WORKER:
+                self.targetSeconds = min(PACKAGE_MAX_SECONDS,
+                        self.targetSeconds * PACKAGE_GROW)
+
+            self.maxItems = min(PACKAGE_MAX_ITEMS,
+                    max(1, int(self.targetSeconds / self._itemSeconds)))
+            self.maxBytes = min(PACKAGE_MAX_BYTES,
+                    max(PACKAGE_MIN_BYTES, int(self.targetSeconds / self._byteSeconds)))
+            log.cc(2, "Package size: {:.3f} sec, {} files, {} bytes ({} outstanding)".format(
+                    self.targetSeconds, self.maxItems, self.maxBytes, packagesOutstanding))
 
     def _task_queue_size(self):
         remainingPackages = ( self._taskPackagesSent - 
@@ -234,61 +473,191 @@ class Job( object ):
         into workPackages and placed into the task queue for jobworkers.
         Packages are broken up if files number or total size exceeds
         thresholds to help evenly distribute load across cores
+        With more than one worker, files are held by the cost scheduler,
+        which decides the packages.
         '''
         if not filesAndConfigs:
             return
 
-        for fileName, configEntrys in filesAndConfigs:
+        for fileName, configEntrys, fileStats in filesAndConfigs:
 
-            # Expensive to check file size here, but worth it for pracelling widely
-            # varying file sizes out to cores for CPU intensive jobs. 
-            # Profiling shows it is not worth caching this
-            try:
-                fileSize = utils.get_file_size(os.path.join(path, fileName))
-            except Exception as e:
-                # It is possible (at least in Windows) for a fileName to exist
-                # in the file system but be invalid for Windows calls. This is
-                # the first place the file is accessed through the file system;
-                # if it blows up don't want the job to fall apart, and this is
-                # an unusual case, so don't bother with a pathway back to the main
-                # application; just swallow it and provide debug
-                log.msg(1, str(e))
-                log.stack()
+            # File size from the folder walk is used for parcelling widely
+            # varying file sizes out to cores for CPU intensive jobs
+            fileSize = fileStats[utils.FILE_STAT_SIZE]
+
+            # Files completed before a checkpoint being resumed are skipped
+            if (self._options.completedFiles is not None and
+                    os.path.join(path, fileName) in self._options.completedFiles):
+                self.numFilesToProcess += 1
                 continue
 
+            # For incremental jobs, replay output for unchanged files
+            if self._inventory is not None:
+                filePath = os.path.join(path, fileName)
+                signature = self._files_signature(configEntrys)
+                priorOutput = self._inventory.get_output(
+                        self._currentRoot, filePath, fileStats, signature)
+                if priorOutput is not None:
+                    self.numFilesToProcess += 1
+                    self._replay_output(filePath, priorOutput)
+                    continue
+                self._inventory.add_pending(self._currentRoot, filePath, fileStats, signature)
+
             log.cc(3, "WorkItem: {}, {}".format(fileSize, fileName))
             self.numFilesToProcess += 1
             workItem = (path,
                         deltaPath,
                         fileName,
-                        configEntrys,
-                        self._options,
-                        len(filesAndConfigs))
-            self._workPackage.add(workItem, fileSize)
-
-            if self._workPackage.ready_to_send() or (
-                    self._filesSinceLastSend > MAX_FILES_BEFORE_SEND):
-                self._send_current_package()
-
-            if not self._check_command():
+                        self._workers.register_configs(configEntrys),
+                        len(filesAndConfigs),
+                        fileStats)
+
+            if self._scheduler is not None:
+                fileClass = self._costModel.file_class(fileName, configEntrys)
+                self._scheduler.add(workItem, fileSize,
+                        self._costModel.predict(fileClass, fileSize))
+                self._pendingFiles[os.path.join(path, fileName)] = (fileClass, fileSize)
+            else:
+                self._pendingFiles[os.path.join(path, fileName)] = (None, fileSize)
+                self._workPackage.add(workItem, fileSize)
+                if self._workPackage.ready_to_send(self._packageSizer.maxItems,
+                        self._packageSizer.maxBytes) or (
+                        self._filesSinceLastSend > MAX_FILES_BEFORE_SEND):
+                    self._send_current_package()
+
+            if not self._check_errors():
                 break
 
+        # Files from the folder are scheduled together
+        if self._scheduler is not None:
+            self._send_scheduled_packages()
+
     def _send_current_package(self):
         '''
         Place package of work on queue, and start a worker
+        If the task queue is full, wait for workers to take packages, which
+        holds up the folder walk
         '''
         self._workers.start_next()
         log.cc(2, "PUT WorkPackage - files: {}, bytes: {}...".format(
                 self._workPackage.size_items(), self._workPackage.size_bytes()))
         log.cc(4, list(self._workPackage.items()))
-        try:
-            self._taskQueue.put(list(self._workPackage.items()), True, TASK_FULL_TIMEOUT)
-        except Full:
-            raise utils.JobException("FATAL ERROR -- FULL TASK QUEUE")
-        else:
-            self._taskPackagesSent += 1
-            self._filesSinceLastSend = 0
-            self._workPackage.reset()
+        packageItems = list(self._workPackage.items())
+        if self._options.expandArchives:
+            # Compressed tars can only be read forward without starting over
+            packageItems.sort(key=lambda workItem: archive.archive_order(workItem[5]))
+
+        # Count the package before it is put, since with inline and thread
+        # workers its output can be received before put_package returns
+        self._taskPackagesSent += 1
+        while True:
+            try:
+                self._workers.put_package(packageItems, QUEUE_FULL_TIMEOUT)
+                break
+            except Full:
+                log.cc(3, "Task queue full")
+                self._status_callback()
+                if not self._check_errors():
+                    self._taskPackagesSent -= 1
+                    self._workPackage.reset()
+                    return
+                if self._workers.num_alive() == 0:
+                    raise utils.JobException("FATAL ERROR -- FULL TASK QUEUE, NO WORKERS")
+        self._filesSinceLastSend = 0
+        self._workPackage.reset()
+
+    def _send_scheduled_packages(self):
+        '''
+        Send the most expensive files held by the scheduler while workers
+        are running low on packages, or if the scheduler is holding too many
+        '''
+        packagesAhead = self._workers.num_max() * PACKAGES_AHEAD_PER_WORKER
+        while self._scheduler.size_items() > 0 and (
+                self._task_queue_size() < packagesAhead or
+                self._scheduler.size_items() > SCHEDULE_MAX_ITEMS):
+            packageSizer = self._packageSizer
+            for workItem, fileSize in self._scheduler.next_package(
+                    packageSizer.targetSeconds, packageSizer.maxItems, packageSizer.maxBytes):
+                self._workPackage.add(workItem, fileSize)
+            self._send_current_package()
+
+    def _package_timed(self, timedFiles):
+        '''
+        Output thread callback with the time workers took to measure each
+        file in a package, which updates package sizes and the cost model
+        '''
+        numItems = 0
+        numBytes = 0
+        seconds = 0.0
+        for filePath, measureTime in timedFiles:
+            pendingFile = self._pendingFiles.pop(filePath, None)
+            if pendingFile is None:
+                continue
+            fileClass, fileSize = pendingFile
+            if fileClass is not None:
+                self._costModel.record(fileClass, fileSize, measureTime)
+            numItems += 1
+            numBytes += fileSize
+            seconds += measureTime
+        if numItems > 0:
+            self._packageSizer.package_measured(numItems, numBytes, seconds,
+                    self._task_queue_size(), self._workers.num_started())
+
+    def _files_signature(self, configEntrys):
+        '''
+        Signature of the config entries used to measure a file, which is
+        used to detect config changes for files in the inventory
+        '''
+        signatures = []
+        for configEntry in configEntrys:
+            try:
+                signature = self._configSignatures[id(configEntry)]
+            except KeyError:
+                try:
+                    signature = configEntry.module.config_signature(configEntry)
+                except AttributeError:
+                    signature = str(configEntry) + str(configEntry.paramsRaw)
+                self._configSignatures[id(configEntry)] = signature
+            signatures.append(signature)
+        return hashlib.sha1("".join(signatures).encode('utf-8')).hexdigest()
+
+    def _replay_output(self, filePath, priorOutput):
+        '''
+        Output for unchanged files is sent to the output thread in packages
+        that are treated like packages from workers
+        '''
+        self._replayPackage.append((filePath, priorOutput, [], None))
+        if len(self._replayPackage) >= REPLAY_PACKAGE_ITEMS:
+            self._send_replay_package()
+
+    def _send_replay_package(self):
+        log.cc(2, "PUT replay package - files: {}".format(len(self._replayPackage)))
+        self._taskPackagesSent += 1
+        if not self._put_output_package(self._replayPackage):
+            self._taskPackagesSent -= 1
+        self._replayPackage = []
+
+    def _put_output_package(self, outputPackage):
+        '''
+        The output queue is bounded, so wait for the output thread to
+        catch up if it is full
+        '''
+        while self._outThread.is_alive():
+            try:
+                self._outQueue.put(outputPackage, True, QUEUE_FULL_TIMEOUT)
+                return True
+            except Full:
+                log.cc(3, "Output queue full")
+                self._status_callback()
+        return False
+
+    def _file_measured(self, filePath, outputList, errorList):
+        '''
+        Output thread callback for incremental jobs, which records output
+        in the inventory before passing on to the application
+        '''
+        self._inventory.file_measured(filePath, outputList, errorList)
+        self._app_file_measured(filePath, outputList, errorList)
 
     def _config_info_display(self, currentDir, filesAndConfigs):
         '''
@@ -296,7 +665,7 @@ class Job( object ):
         what folders would be measured by what configEntries
         '''
         activeConfigs = set([])
-        for fileName, configEntrys in filesAndConfigs:
+        for fileName, configEntrys, _fileStats in filesAndConfigs:
             _root, fileExt = os.path.splitext(fileName)
             # TBD -- this won't work if there are RE or Exclude file types
             for configEntry in configEntrys:
@@ -310,66 +679,67 @@ class Job( object ):
             self._status_callback(displayStr)
 
     #-------------------------------------------------------------------------
-    #   Command Queue management
+    #   Error queue and stopping workers
 
-    def _check_command(self):
+    def _check_errors(self):
         '''
-        Check command queue for any problems posted while running a job
-        Exceptions received from the command queue are unpackaged 
-        and thrown for main to handle
+        Check error queue for any problems posted while running a job
+        Only the Job reads the error queue, so everything in it is ours
+        Exceptions received from workers are collected for main to display
         '''
-        otherCommands = []
         try:
             while self._continueProcessing:
-                (target, command, payload) = self._controlQueue.get_nowait()
-                log.cc(4, "command check: {}, {}".format(target, command))
-                if target == 'JOB':
-                    if 'ERROR' == command:
-                        # Error notifications in the control queue are only used to support
-                        # break on error -- the error info is handled by the output queue. 
-                        log.cc(1, "COMMAND: ERROR for file: {}".format(payload))
-                        if self._options.breakOnError:
-                            self._continueProcessing = False
-                    elif 'EXCEPTION' == command:
-                        # Exceptions are bundled up for display to user
-                        log.cc(1, "COMMAND: EXCEPTION RECEIVED")
-                        if self._options.breakOnError:
-                            self._continueProcessing = False
-                        self.exceptions.append( payload )
-                else:
-                    otherCommands.append((target, command, payload))
+                (errorType, payload) = self._errorQueue.get_nowait()
+                if 'ERROR' == errorType:
+                    # Error notifications in the error queue are only used to support
+                    # break on error -- the error info is handled by the output queue. 
+                    log.cc(1, "ERROR for file: {}".format(payload))
+                    if self._options.breakOnError:
+                        self._continueProcessing = False
+                elif 'EXCEPTION' == errorType:
+                    # Exceptions are bundled up for display to user
+                    log.cc(1, "EXCEPTION RECEIVED")
+                    if self._options.breakOnError:
+                        self._continueProcessing = False
+                    self.exceptions.append( payload )
         except Empty:
-            log.cc(4, "command check: empty")
-        finally:
-            # Put any queue items removed back in the queue
-            for (target, command, payload) in otherCommands:
-                log.cc(4, "command replace: {}, {}".format(target, command))
-                self._controlQueue.put_nowait((target, command, payload))
+            log.cc(4, "error check: empty")
 
         return self._continueProcessing
 
-    def _close_queues(self):
-        # Make sure queues are flushed and closed to avoid errors in queue code
-        queues = [self._taskQueue, self._outQueue, self._controlQueue]
-        for queue in queues:
-            try:
-                while True:
-                    _ = queue.get_nowait()
-                queue.close()
-            except Empty:
-                pass
-
-    def _send_workers_command(self, command, payload=None):
-        for worker in self._workers():
-            if worker.is_alive():
-                self._send_command(worker.name, command, payload)
-
-    def _send_output_command(self, command, payload=None):
-        self._send_command(self._outThread.name, command, payload)
-
-    def _send_command(self, target, command, payload):
-        log.cc(2, "COMMAND:  {}, {} {}".format(target, command, payload))
-        self._controlQueue.put_nowait((target, command, payload))
+    def _use_out_process(self, output_state_callback):
+        '''
+        An output process shares the output queue with worker processes,
+        and inventory output is recorded by the Job
+        '''
+        if not self._options.outputProcess or output_state_callback is None:
+            return False
+        if (self._workers.backend != BACKEND_PROCESSES or self._inventory is not None or
+                not jobout.out_process_available()):
+            log.msg(1, "Output process not used with: {}".format(self._workers.backend))
+            self._status_callback(uistrings.STR_OutProcessNotUsed)
+            return False
+        # Workers kept by the daemon have queue threads running, which
+        # would be copied to a forked process in whatever state they are in
+        if not self._ownWorkers:
+            log.msg(1, "Output process not used with kept workers")
+            self._status_callback(uistrings.STR_OutProcessNotUsedDaemon)
+            return False
+        return True
+
+    def _auto_backend(self):
+        '''
+        Choose how to run workers, based on an estimate of the job size
+        '''
+        if self._options.configInfoOnly or self._folderWalker.small_walk(
+                self._pathsToMeasure, SMALL_JOB_FILES, SMALL_JOB_BYTES):
+            return BACKEND_INLINE
+        # Without the GIL, threads measure in parallel without the
+        # overhead of sending config entries and output between processes
+        gilEnabled = getattr(sys, '_is_gil_enabled', None)
+        if gilEnabled is not None and not gilEnabled():
+            return BACKEND_THREADS
+        return BACKEND_PROCESSES
 
     #-------------------------------------------------------------------------
 
@@ -378,16 +748,58 @@ class Job( object ):
         Subclass for managing group of workers that makes the construction
         of each Worker a bit cleaner and allows for easy lazy job starting
         and tracking of how many workers are active
+        The group owns the queues to its workers and the registry of config
+        entries sent to them, so it can be used for more than one job.
+        Workers are processes, threads, or one inline worker, which measures
+        each package as it is placed in the task queue. Remote workers are
+        links to agents that connect to a coordinator at remoteAddress.
         '''
-        def __init__(self, controlQueue, inQueue, outQueue,
-                        dbgContext, numWorkers):
+        def __init__(self, dbgContext, numWorkers, backend=BACKEND_PROCESSES,
+                        remoteAddress=None):
+            self.backend = backend
+            self._coordinator = None
+            if backend == BACKEND_PROCESSES:
+                makeQueue = multiprocessing.Queue
+                makeEvent = multiprocessing.Event
+                workerClass = jobworker.Worker
+            else:
+                makeQueue = Queue
+                makeEvent = threading.Event
+                workerClass = jobworker.ThreadWorker
+                if backend == BACKEND_INLINE:
+                    workerClass = jobworker.InlineWorker
+                    numWorkers = 1
+                elif backend == BACKEND_REMOTE:
+                    self._coordinator = remote.Coordinator(remoteAddress, dbgContext)
+                    workerClass = functools.partial(remote.AgentLink,
+                            coordinator=self._coordinator)
+            self.taskQueue = makeQueue(numWorkers * TASK_QUEUE_PACKAGES_PER_WORKER)
+            self.errorQueue = makeQueue()
+            self.outQueue = makeQueue(numWorkers * OUT_QUEUE_PACKAGES_PER_WORKER)
+
+            # Config entries are sent to workers once and referenced by ID
+            self._configRegistry = configregistry.ConfigRegistry()
+
+            # Each worker has its own stop event, and its own queue
+            # for receiving config entries and job settings
+            self._stopEvents = [ makeEvent() for _num in range(numWorkers) ]
+            self._configQueues = [ makeQueue() for _num in range(numWorkers) ]
             self._workers = [
-                    jobworker.Worker(inQueue, outQueue, controlQueue,
-                                        dbgContext, str(num+1))
-                    for num in range(numWorkers) ]
+                    workerClass(self.taskQueue, self.outQueue, self.errorQueue,
+                                    stopEvent, configQueue, dbgContext, str(num+1))
+                    for num, (stopEvent, configQueue) in enumerate(
+                            zip(self._stopEvents, self._configQueues)) ]
+            # Worker processes send results through shared memory rings
+            self.resultRings = []
+            if backend == BACKEND_PROCESSES:
+                self.resultRings = resultring.create_rings(numWorkers)
+                for worker, resultRing in zip(self._workers, self.resultRings):
+                    worker.set_result_ring(resultRing)
             self._workerStartIter = self()
             self._workerStartDone = False
             self._startedWorkers = 0
+            self._jobId = 0
+            self._stopped = False
         def __call__(self):
             for worker in self._workers:
                 yield worker
@@ -400,7 +812,107 @@ class Job( object ):
                 except StopIteration:
                     self._workerStartDone = True
                     return False
+        def start_job(self, folder, breakOnError, resultCache, fileTimeBudget=None):
+            '''
+            Workers receive settings for the job before its first package
+            '''
+            self._jobId += 1
+            try:
+                while True:
+                    staleError = self.errorQueue.get_nowait()
+                    log.cc(1, "Dropping error from prior job: {}".format(staleError))
+            except Empty:
+                pass
+            jobSettings = jobworker.JobSettings(
+                    self._jobId, folder, breakOnError, resultCache, fileTimeBudget)
+            for configQueue in self._configQueues:
+                configQueue.put_nowait(jobSettings)
+        def put_package(self, packageItems, timeout):
+            self.taskQueue.put((self._jobId, packageItems), True, timeout)
+            if self.backend == BACKEND_INLINE:
+                self._workers[0].measure_queued()
+        def register_configs(self, configEntrys):
+            '''
+            Return the registry IDs for configEntrys, sending any entries
+            workers have not seen to their config queues before the package
+            that refers to them is placed in the task queue
+            '''
+            configIds, newEntries = self._configRegistry.register(configEntrys)
+            if newEntries:
+                log.cc(2, "PUT {} new config entries".format(len(newEntries)))
+                # Workers that have not started yet will get entries on startup
+                for configQueue in self._configQueues:
+                    configQueue.put_nowait(newEntries)
+            return configIds
+        def prune_configs(self, liveEntries):
+            '''
+            Drop config entries not in liveEntries from the registry and
+            workers, so kept workers don't hold every entry they were sent
+            Only called between jobs; workers read the drops from their
+            config queues when the next job starts, before IDs are reused
+            '''
+            droppedEntries = self._configRegistry.retain(liveEntries)
+            if droppedEntries:
+                log.cc(2, "PUT {} dropped config entries".format(len(droppedEntries)))
+                for configQueue in self._configQueues:
+                    configQueue.put_nowait(droppedEntries)
+        def stop(self):
+            self._stopped = True
+            for stopEvent in self._stopEvents:
+                stopEvent.set()
+        def reusable(self):
+            # Stopped workers, or workers that have exited, can't take another job
+            return not self._stopped and self.num_alive() == self._startedWorkers
+        def send_exit(self):
+            '''
+            Wake workers blocked on the task queue; each takes one sentinel
+            If the queue is full when stopping early, workers have their stop event
+            '''
+            for _num in range(self._startedWorkers):
+                try:
+                    self.taskQueue.put(jobworker.WORKER_EXIT, True, QUEUE_FULL_TIMEOUT)
+                except Full:
+                    break
+            if self.backend == BACKEND_INLINE:
+                self._workers[0].measure_queued()
+        def close_queues(self):
+            # Make sure queues are flushed and closed to avoid errors in queue code
+            if self._coordinator is not None:
+                self._coordinator.close()
+            for queue in [self.taskQueue, self.outQueue, self.errorQueue] + self._configQueues:
+                try:
+                    while True:
+                        _ = queue.get_nowait()
+                except Empty:
+                    pass
+                if self.backend == BACKEND_PROCESSES:
+                    queue.close()
+            self.unlink_rings()
+        def unlink_rings(self):
+            '''
+            Free the shared memory of result rings once workers are done
+            with them; safe to call more than once
+            '''
+            for resultRing in self.resultRings:
+                resultRing.unlink()
+            self.resultRings = []
+        def shutdown(self):
+            '''
+            Stop workers that were kept running between jobs
+            '''
+            self.stop()
+            self.send_exit()
+            for worker in self._workers[:self._startedWorkers]:
+                worker.join(WORKER_EXIT_TIMEOUT * WORKER_EXIT_TRIES)
+                if worker.is_alive() and self.backend == BACKEND_PROCESSES:
+                    worker.terminate()
+            self.close_queues()
+            if self.backend == BACKEND_PROCESSES:
+                for queue in [self.taskQueue, self.outQueue, self.errorQueue] + self._configQueues:
+                    queue.cancel_join_thread()
         def num_max(self):
             return len(self._workers)
         def num_started(self):
             return self._startedWorkers
+        def num_alive(self):
+            return len([worker for worker in self._workers if worker.is_alive()])
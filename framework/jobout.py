@@ -1,19 +1,78 @@
 #---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
 '''
     Surveyor Job Output Thread
+
+    The output thread blocks on the output queue until the Job places the
+    OUTPUT_DONE sentinel in it, after all work packages have been received.
+    The Job waits on the thread's count of received packages, and can stop
+    the thread early with stop(). Errors are sent to the Job on the error queue.
+
+    Worker processes write packages to their result rings when they can,
+    and place the package's RingSlot in the queue (see resultring.py).
+
+    Output can instead be processed in its own process (OutProcess), so
+    writing output and keeping totals don't compete with the folder walk
+    for the main process's GIL.
 '''
 
-import time
 import _thread
 import threading
+import multiprocessing
 from queue import Empty
 
 from code_surveyor.framework import log  # No relative path to share module globals
-from . import utils
+from . import resultring
+
+
+# Output queue sentinel placed by the Job when all output has been received
+OUTPUT_DONE = None
+
+# The output process is forked with a copy of the application, since its
+# callbacks hold the application's open output files; the Job forks it
+# before anything is put in the queues, which starts their feeder threads,
+# so only the main thread is running
+OUT_PROCESS_START_METHOD = 'fork'
+
+# Status from the output process for each package, and when it is done
+OUT_PROCESS_PACKAGE = 'PACKAGE'
+OUT_PROCESS_DONE = 'DONE'
+
+# The output loops check for stop, and the output process link checks that
+# the process is still running, this often while waiting on queues
+OUT_POLL_TIMEOUT = 0.4
+
+
+def out_process_available():
+    return OUT_PROCESS_START_METHOD in multiprocessing.get_all_start_methods()
+
+
+def _consume_package(filesOutput, resultRings, file_measure_callback, errorQueue):
+    '''
+    Pass output for each file in a package to the application
+    Returns the time taken to measure each file that was measured
+    '''
+    if isinstance(filesOutput, resultring.RingSlot):
+        filesOutput = resultRings[filesOutput.ringNum].read(filesOutput)
+    log.cc(2, "GOT {} measures".format(len(filesOutput)))
+
+    # Get a set of output for multiple files with each outputQueue item.
+    # Each file has a set of output and errors to pack up for app,
+    # and the time workers took to measure it (None if not measured)
+    timedFiles = []
+    for filePath, outputList, errorList, measureTime in filesOutput:
 
+        # Synchronus callback to applicaiton
+        # Output writing and screen update occurs in this call
+        # Files with no output are sent so they can be recorded as complete
+        file_measure_callback(filePath, outputList, errorList)
 
-OUTPUT_EMPTY_WAIT = 0.02
-CONTROL_QUEUE_TIMEOUT = 0.1
+        if measureTime is not None:
+            timedFiles.append((filePath, measureTime))
+
+        if errorList:
+            log.file(1, "ERROR measuring: {}".format(filePath))
+            errorQueue.put_nowait(('ERROR', filePath))
+    return timedFiles
 
 
 class OutThread( threading.Thread ):
@@ -21,7 +80,8 @@ class OutThread( threading.Thread ):
     OutThread runs in main process, monitoring the out queue and passing
     on to Surveyor, providing seralization of results from the queue.
     '''
-    def __init__(self, outQueue, controlQueue, profileName, file_measure_callback):
+    def __init__(self, outQueue, errorQueue, profileName, file_measure_callback,
+                    package_timed_callback=None, resultRings=None):
         log.cc(1, "Creating output queue thread")
         threading.Thread.__init__(self, name="Out")
         self._profileName = profileName
@@ -32,14 +92,17 @@ class OutThread( threading.Thread ):
 
         # The main thread owns our queues
         self._outQueue = outQueue
-        self._controlQueue = controlQueue
+        self._errorQueue = errorQueue
+        self._stopEvent = threading.Event()
         self._file_measure_callback = file_measure_callback
+        self._package_timed_callback = package_timed_callback
+        self._resultRings = resultRings
 
         # Total task output packages we've received from all processes
+        # The Job waits on the condition for this to change
         self.taskPackagesReceived = 0
-
-        # Flag to track when receive WORK_DONE from the Job
-        self._workDone = False
+        self._packageReceived = threading.Condition()
+        self._stopped = False
 
     def run(self):
         log.cc(1, "STARTING: Begining to process output queue...")
@@ -57,66 +120,214 @@ class OutThread( threading.Thread ):
         except Exception as e:
             log.msg(1, "EXCEPTION processing output queue: " + str(e))
             log.stack()
-            self._controlQueue.put_nowait(('JOB', 'EXCEPTION', e))
+            self._errorQueue.put_nowait(('EXCEPTION', e))
         finally:
+            with self._packageReceived:
+                self._stopped = True
+                self._packageReceived.notify_all()
             log.cc(1, "TERMINATING")
 
+    def stop(self):
+        '''
+        Stop processing output after the current package
+        '''
+        self._stopEvent.set()
+
+    def stop_and_wait(self):
+        '''
+        When the Job is stopped early the thread is not waited for; it
+        exits once it finishes its package or next polls the output queue
+        '''
+        self.stop()
+
+    def wait_for_package(self, numReceived, timeout):
+        '''
+        Block until more than numReceived packages have been received,
+        the thread stops, or the timeout expires
+        '''
+        with self._packageReceived:
+            self._packageReceived.wait_for(
+                    lambda: self.taskPackagesReceived > numReceived or self._stopped,
+                    timeout)
+
     def _run(self):
-        # Keep processing queue until the job signals it is done and
-        # the queue is empty, or receive an abort command
-        while self._continue_processing():
+        # Keep processing queue until the job sends the done sentinel,
+        # or the Job stops us; the queue is polled so a stopped thread
+        # doesn't stay blocked on it (the daemon's process outlives jobs)
+        while not self._stopEvent.is_set():
             try:
-                if self._workDone and self._outQueue.empty():
-                    break
-                filesOutput = self._outQueue.get_nowait()
-
+                filesOutput = self._outQueue.get(True, OUT_POLL_TIMEOUT)
             except Empty:
-                log.cc(3, "EMPTY OUTPUT")
-                time.sleep(OUTPUT_EMPTY_WAIT)
-            else:
+                continue
+            if filesOutput is OUTPUT_DONE:
+                log.cc(2, "GOT done sentinel")
+                break
+
+            with self._packageReceived:
                 self.taskPackagesReceived += 1
-                log.cc(2, "GOT {} measures".format(len(filesOutput)))
+                self._packageReceived.notify_all()
+            timedFiles = _consume_package(filesOutput, self._resultRings,
+                    self._file_measure_callback, self._errorQueue)
 
-                # Get a set of output for multiple files with each outputQueue item.
-                # Each file has a set of output and errors to pack up for app
-                for filePath, outputList, errorList in filesOutput:
+            if timedFiles and self._package_timed_callback is not None:
+                self._package_timed_callback(timedFiles)
+        else:
+            log.cc(2, "STOP event")
 
-                    # Synchronus callback to applicaiton
-                    # Output writing and screen update occurs in this call
-                    self._file_measure_callback(filePath, outputList, errorList)
 
-                    if errorList:
-                        log.file(1, "ERROR measuring: {}".format(filePath))
-                        self._controlQueue.put_nowait(('JOB', 'ERROR', filePath))
+class OutProcess( threading.Thread ):
+    '''
+    Runs the output loop in its own process, forked with a copy of the
+    application, which consumes output with file_measure_callback as it
+    would in the OutThread. The output and error queues must be process
+    queues.
 
+    In the Job's process this thread stands in for the OutThread. It counts
+    packages and passes their measure times to package_timed_callback, so
+    scheduling stays with the Job. The output process calls
+    output_state_callback(finished) after each package, and when it is done,
+    and the state returned is passed to set_output_state_callback(state,
+    finished) in the Job's process.
+    '''
+    def __init__(self, outQueue, errorQueue, profileName, file_measure_callback,
+                    package_timed_callback, resultRings,
+                    output_state_callback, set_output_state_callback):
+        log.cc(1, "Creating output process")
+        threading.Thread.__init__(self, name="OutLink", daemon=True)
+        context = multiprocessing.get_context(OUT_PROCESS_START_METHOD)
+        self._outQueue = outQueue
+        self._errorQueue = errorQueue
+        self._profileName = profileName
+        self._file_measure_callback = file_measure_callback
+        self._package_timed_callback = package_timed_callback
+        self._resultRings = resultRings
+        self._output_state_callback = output_state_callback
+        self._set_output_state_callback = set_output_state_callback
 
-    def _continue_processing(self):
-        continueProcessing = True
-        otherCommands = []
-        myCommand = None
+        # The process sends status for each package on the status queue,
+        # and the Job's process stops it with the stop event
+        self._statusQueue = context.Queue()
+        self._stopEvent = context.Event()
+
+        # Not a daemon, so on exit the Job's process waits for the output
+        # process to finish writing and close its files
+        self._process = context.Process(target=self._run_process, name="Out")
+
+        self.taskPackagesReceived = 0
+        self._packageReceived = threading.Condition()
+        self._stopped = False
+
+    def start(self):
+        '''
+        Fork from the Job's main thread, before other threads are started,
+        then start our link thread
+        '''
+        self._process.start()
+        threading.Thread.start(self)
+
+    def stop(self):
+        self._stopEvent.set()
+
+    def stop_and_wait(self):
+        '''
+        The output process finishes the package it has and closes its files
+        '''
+        self.stop()
+        if self.is_alive():
+            self.join()
+
+    def wait_for_package(self, numReceived, timeout):
+        with self._packageReceived:
+            self._packageReceived.wait_for(
+                    lambda: self.taskPackagesReceived > numReceived or self._stopped,
+                    timeout)
+
+    def run(self):
+        '''
+        Link thread, which receives status from the output process
+        '''
+        log.cc(1, "STARTING: Linking to output process...")
         try:
             while True:
-                (target, command, payload) = self._controlQueue.get_nowait()
-                log.cc(3, "command - {}, {}".format(target, command))
-                if target == self.name:
-                    myCommand = command
+                try:
+                    status, timedFiles, outputState = self._statusQueue.get(
+                            True, OUT_POLL_TIMEOUT)
+                except Empty:
+                    if not self._process.is_alive():
+                        log.msg(1, "Output process exited without finishing")
+                        break
+                    continue
+                finished = status == OUT_PROCESS_DONE
+                if outputState is not None:
+                    self._set_output_state_callback(outputState, finished)
+                if finished:
+                    log.cc(1, "FINISHED output process")
                     break
-                else:
-                    otherCommands.append((target, command, payload))
-        except Empty:
-            pass
+                with self._packageReceived:
+                    self.taskPackagesReceived += 1
+                    self._packageReceived.notify_all()
+                if timedFiles and self._package_timed_callback is not None:
+                    self._package_timed_callback(timedFiles)
+            self._process.join()
+        except Exception as e:
+            log.msg(1, "EXCEPTION linking to output process: " + str(e))
+            log.stack()
+            self._errorQueue.put_nowait(('EXCEPTION', e))
         finally:
-            if 'EXIT' == myCommand:
-                log.cc(2, "COMMAND: EXIT")
-                continueProcessing = False
+            with self._packageReceived:
+                self._stopped = True
+                self._packageReceived.notify_all()
+            log.cc(1, "TERMINATING")
 
-            elif 'WORK_DONE' == myCommand:
-                log.cc(2, "COMMAND: WORK_DONE")
-                self._workDone = True
+    #-------------------------------------------------------------------------
+    #  Output process
 
-            if otherCommands:
-                log.cc(4, "replacing conmmands - {}".format(otherCommands))
-                utils.put_commands(self._controlQueue, otherCommands,
-                                    CONTROL_QUEUE_TIMEOUT)
+    def _run_process(self):
+        log.cc(1, "STARTING: Output process...")
+        outputState = None
+        try:
+            if self._profileName is not None:
+                import cProfile;
+                cProfile.runctx('self._run()', globals(), {'self': self},
+                        self._profileName + self._process.name)
+            else:
+                self._run()
+            log.cc(1, "FINISHED processing output queue")
+        except KeyboardInterrupt:
+            log.cc(1, "Ctrl-c occurred in OUTPUT PROCESS")
+            self._stopEvent.set()
+        except Exception as e:
+            log.msg(1, "EXCEPTION processing output queue: " + str(e))
+            log.stack()
+            self._errorQueue.put_nowait(('EXCEPTION', e))
+        finally:
+            try:
+                outputState = self._output_state_callback(True)
+            except Exception as e:
+                log.msg(1, "EXCEPTION finishing output: " + str(e))
+                self._errorQueue.put_nowait(('EXCEPTION', e))
+            # The Job's link thread reads status until we exit
+            self._statusQueue.put((OUT_PROCESS_DONE, None, outputState))
+            self._statusQueue.close()
+            self._statusQueue.join_thread()
+            self._errorQueue.close()
+            self._errorQueue.join_thread()
+            log.cc(1, "TERMINATING")
 
-        return continueProcessing
+    def _run(self):
+        # Process the queue until the job sends the done sentinel, or the
+        # Job stops us
+        while not self._stopEvent.is_set():
+            try:
+                filesOutput = self._outQueue.get(True, OUT_POLL_TIMEOUT)
+            except Empty:
+                continue
+            if filesOutput is OUTPUT_DONE:
+                log.cc(2, "GOT done sentinel")
+                break
+            timedFiles = _consume_package(filesOutput, self._resultRings,
+                    self._file_measure_callback, self._errorQueue)
+            self._statusQueue.put((OUT_PROCESS_PACKAGE, timedFiles,
+                    self._output_state_callback(False)))
+        else:
+            log.cc(2, "STOP event")
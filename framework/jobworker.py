@@ -3,7 +3,14 @@
     Surveyor Job Worker Process
 
     A work package from the input queue is a set of work items. These
-    consits of a file name and set of config entries for that file.
+    consits of a file name and the IDs of config entries for that file.
+    Config entries are received once from the worker's config queue and
+    held in a ConfigRegistry for the life of the worker.
+
+    Workers can be kept running for more than one job. Each work package
+    is tagged with its job ID, and settings for each job (such as break
+    on error and the result cache) are received on the config queue
+    before the worker measures the job's first package.
 
     For each workitem, the worker designates the given file as the
     "currentFile". It then goes through all the config entries for
@@ -12,144 +19,308 @@
     call to the appropriate module (the file is opened once and cached).
 
     The output from each measure call is placed in a list associated with
-    that file. When the file processing is done this list is cached as
-    part of "currentOutput". Once all workItems in a workPackage are
-    processed, the currentOutput is posted and we start over again.
+    that file. When the file processing is done this list and the time
+    taken to measure the file are cached as part of "currentOutput". Once
+    all workItems in a workPackage are processed, the currentOutput is
+    posted and we start over again.
+
+    Workers block on the input queue while waiting for work. When there is
+    no more work, the Job places a WORKER_EXIT sentinel in the input queue
+    for each worker that was started. To stop early, the Job sets the
+    worker's stop event, which is checked before each measure call.
+    Exceptions are sent back to the Job on the error queue.
+
+    The same worker logic runs as a process (Worker), as a thread in the
+    main process (ThreadWorker), or inline on the Job's main thread as each
+    package is placed in the queue (InlineWorker).
+
+    When several config entries for a file use modules that classify lines
+    the same way (e.g., "measure" and "routines" entries for Code), the file
+    is read and its lines classified as blank, comment, etc. once, and each
+    entry surveys the classified lines (see NBNC.classify_lines).
+
+    Pathological lines and regexes can take minutes to measure, so the CPU
+    time used for each file, and for each config entry, can be limited
+    (see TimeBudget). A file that runs over is reported as an error.
 '''
 
 import os
+import re
 import time
+import pickle
+import signal
 import traceback
+import threading
+import contextlib
 from multiprocessing import Process
 from errno import EACCES
 from queue import Empty, Full
 
 from code_surveyor.framework import log  # No relative path to share module globals
 from . import uistrings
+from . import configregistry
+from . import resultcache
 from . import utils
 
 
 WORKER_PROC_BASENAME = "Job"
-INPUT_EMPTY_WAIT = 0.1
-CONTROL_QUEUE_TIMEOUT = 0.2
+CONFIG_GET_TIMEOUT = 5.0
 OUT_PUT_TIMEOUT = 0.4
 
+# Input queue sentinel that tells a worker to exit
+WORKER_EXIT = None
+
+# Time budgets use an interval timer that counts the CPU time of the process
+# (not available on all platforms)
+BUDGET_TIMER = getattr(signal, 'ITIMER_PROF', None)
+BUDGET_SIGNAL = getattr(signal, 'SIGPROF', None)
 
-class Worker( Process ):
+# Frames searched for the regex being matched when a budget runs out
+BUDGET_PATTERN_FRAMES = 4
+
+# Larger files are read by each config entry instead of holding their
+# classified lines in memory
+CLASSIFY_MAX_FILE_BYTES = 2 ** 23
+
+
+class JobSettings( object ):
     '''
-    The worker class executes as separate processes spawned by the Job
+    Settings for one job, sent to each worker on its config queue
+    '''
+    def __init__(self, jobId, folder, breakOnError=False, resultCache=None,
+                    fileTimeBudget=None):
+        self.jobId = jobId
+        self.folder = folder
+        self.breakOnError = breakOnError
+        self.resultCache = resultCache
+        self.fileTimeBudget = fileTimeBudget
+
+
+class TimeBudget( object ):
+    '''
+    Limits the CPU time used to measure a file, and by each config entry
+    for the file. A timer signal interrupts the measure call, including
+    a regex match in progress, with utils.MeasureTimeExceeded, which carries
+    the regex if one was being matched.
+    Signals are only handled on the main thread of a process, so budgets
+    are not enforced for thread workers. Inline workers share the Job's
+    process, so CPU used by its other threads also counts.
+    '''
+    def __init__(self):
+        self._fileBudget = None
+        self._fileStart = None
+        self._budget = None
+        self._canInterrupt = None
+
+    def start_job(self, fileBudget):
+        self._fileBudget = fileBudget
+
+    def start_file(self):
+        self._fileStart = time.process_time()
+
+    @contextlib.contextmanager
+    def measuring(self, entryBudget):
+        '''
+        Measure within the smaller of the entry budget and what is left
+        of the file budget
+        '''
+        # Pairs of the seconds left and the budget reported if it runs out
+        budgets = [(entryBudget, entryBudget)]
+        if self._fileBudget is not None:
+            fileRemaining = self._fileBudget - (time.process_time() - self._fileStart)
+            budgets.append((fileRemaining, self._fileBudget))
+        budgets = [budget for budget in budgets if budget[0] is not None]
+        if not budgets or not self._can_interrupt():
+            yield
+            return
+        secondsLeft, self._budget = min(budgets)
+        if secondsLeft <= 0:
+            raise utils.MeasureTimeExceeded(self._budget)
+        signal.setitimer(BUDGET_TIMER, secondsLeft)
+        try:
+            yield
+        finally:
+            signal.setitimer(BUDGET_TIMER, 0)
+
+    def _can_interrupt(self):
+        '''
+        Our signal handler is set the first time a budget is used, in the
+        process and thread that measures
+        '''
+        if self._canInterrupt is None:
+            self._canInterrupt = (BUDGET_TIMER is not None and
+                    threading.current_thread() is threading.main_thread())
+            if self._canInterrupt:
+                signal.signal(BUDGET_SIGNAL, self._budget_exceeded)
+            else:
+                log.cc(1, "Time budgets not enforced in: {}".format(
+                        threading.current_thread().name))
+        return self._canInterrupt
+
+    def _budget_exceeded(self, _signum, frame):
+        raise utils.MeasureTimeExceeded(self._budget, _find_pattern(frame))
+
+
+def _find_pattern(frame):
+    '''
+    Look for the compiled regex being matched in the frames where the
+    signal interrupted the measure, e.g., the search regex a csmodule is
+    looping through
+    '''
+    for _frameNum in range(BUDGET_PATTERN_FRAMES):
+        if frame is None:
+            break
+        for value in frame.f_locals.values():
+            if isinstance(value, re.Pattern):
+                return value.pattern
+        frame = frame.f_back
+    return None
+
+
+class WorkerMixin( object ):
+    '''
+    Worker logic shared by the process, thread, and inline workers
     They take items from the input queue, delegate calls to the measurement
     modules, and package measures for the output queue.
     '''
-    def __init__(self, inputQueue, outputQueue, controlQueue,
-                    context, num, jobName=WORKER_PROC_BASENAME):
+    def __init__(self, inputQueue, outputQueue, errorQueue, stopEvent, configQueue,
+                    context):
         '''
-        Init is called in the parent process
+        Init is called in the Job's process
         '''
-        Process.__init__(self, name=jobName + str(num))
         self._inputQueue = inputQueue
         self._outputQueue = outputQueue
-        self._controlQueue = controlQueue
+        self._errorQueue = errorQueue
+        self._stopEvent = stopEvent
+        self._configQueue = configQueue
+        self._configRegistry = configregistry.ConfigRegistry()
+        self._jobId = None
+        self._breakOnError = False
+        self._resultCache = None
+        self._timeBudget = TimeBudget()
         self._continueProcessing = True
         self._currentOutput = []
+        self._resultRing = None
         self._currentFilePath = None
+        self._currentFileStart = None
         self._currentFileIterator = None
+        self._currentFileHash = None
+        self._currentClassifiedLines = {}
         self._currentFileOutput = []
         self._currentFileErrors = []
         self._dbgContext, self._profileName = context
-        log.cc(2, "Initialized new process: {}".format(self.name))
 
-    def run(self):
+    def set_result_ring(self, resultRing):
         '''
-        Process entry point - set up debug/profile context
+        Worker processes post results through a shared memory ring when
+        they can (see resultring.py); set before the worker is started
         '''
-        try:
-            log.set_context(self._dbgContext)
+        self._resultRing = resultRing
 
-            if self._profileName is not None:
-                import cProfile;
-                cProfile.runctx('self._run()', globals(), {'self': self}, 
-                                    self._profileName + self.name)
-            else:
-                self._run()
+    def _run_profiled(self):
+        if self._profileName is not None:
+            import cProfile;
+            cProfile.runctx('self._run()', globals(), {'self': self}, 
+                                self._profileName + self.name)
+        else:
+            self._run()
 
-        except Exception as e:
-            # Exception is treated as fatal to worker, which will do an orderly shutdown.
-            # Can't pickle tracebacks, so get in-context stack dump to send back
-            log.msg(1, "EXCEPTION, stopping worker: " + str(e))
-            e._stack_trace = "".join(
-                traceback.format_exception(type(e), e, e.__traceback__))
-            self._controlQueue.put_nowait(('JOB', 'EXCEPTION', e))
-        except KeyboardInterrupt:
-            log.cc(1, "Ctrl-c occurred in job worker loop")
-        finally:
-            log.cc(1, "TERMINATING")
-            # Orderly shutdown, clean up queues  
-            # Input and out queues are empty at this point (or is a hard stop),
-            # so cancel_join_thread (don't wait for them to clear)
-            self._inputQueue.close()
-            self._inputQueue.cancel_join_thread()
-            self._outputQueue.close()
-            self._outputQueue.cancel_join_thread()
-            # Join control queue to make sure control items are flushed
-            self._controlQueue.close()
-            self._controlQueue.join_thread()
-            log.cc(2, "TERMINATED")
+    def _report_exception(self, e):
+        '''
+        Exception is treated as fatal to worker, which will do an orderly shutdown.
+        Can't pickle tracebacks, so get in-context stack dump to send back
+        '''
+        log.msg(1, "EXCEPTION, stopping worker: " + str(e))
+        e._stack_trace = "".join(
+            traceback.format_exception(type(e), e, e.__traceback__))
+        self._errorQueue.put_nowait(('EXCEPTION', e))
+        self._continueProcessing = False
+
+    def _close_result_cache(self):
+        if self._resultCache is not None:
+            self._resultCache.close()
+            self._resultCache = None
+
+    def _copy_config_item(self, configItem):
+        '''
+        Items from the config queue are used as received; config entries
+        are already copies of the Job's when received by another process
+        '''
+        return configItem
 
     def _run(self):
         '''
-        Process items from input queue until it's empty and app signals all done
+        Process items from input queue until the Job sends our exit sentinel
         '''
         log.cc(1, "STARTING: Begining to process input queue...")
 
         while self._continueProcessing:
-            try:
-                workPackage = self._inputQueue.get_nowait()
-                log.cc(2, "GOT WorkPackage - files: {}".format(len(workPackage)))
-            except Empty:
-                # The input queue can return empty when it really isn't, or
-                # in mid job and have burned down the empty queue
-                # Sleeping after these helps performance with many cores, vs
-                # just blocking on inputQueue.get
-                log.cc(3, "EMPTY INPUT")
-                time.sleep(INPUT_EMPTY_WAIT)
-            else:
-                for workItem in workPackage:
-                    if not self._measure_file(workItem):
-                        self._continueProcessing = False
-                        break
-                self._post_results()
-            self._check_for_stop()
+            taskItem = self._inputQueue.get()
+            if taskItem is WORKER_EXIT:
+                log.cc(2, "GOT exit sentinel")
+                break
+            self._measure_package(taskItem)
 
-    def _check_for_stop(self):
+    def _measure_package(self, taskItem):
+        jobId, workPackage = taskItem
+        if jobId != self._jobId:
+            self._start_job(jobId)
+        log.cc(2, "GOT WorkPackage - files: {}".format(len(workPackage)))
+        for workItem in workPackage:
+            if not self._measure_file(workItem):
+                self._continueProcessing = False
+                break
+        self._post_results()
+        self._check_for_stop()
+
+    def _start_job(self, jobId):
         '''
-        Command queue will normally be empty unless we are terminating.
-        If there are commands, get all we can until we find our own or empty
-        the queue -- then put back everything we took off. The command queue
-        should never have a lot in it and this guarantees we can't deadlock.
+        Read our config queue until we have the settings for the job
+        The Job sends settings before any packages for the job
         '''
-        otherCommands = []
-        myCommand = None
+        jobSettings = None
+        while jobSettings is None or jobSettings.jobId != jobId:
+            jobSettings = self._read_config_queue()
+        log.cc(1, "STARTING JOB: {}".format(jobId))
+        self._close_result_cache()
+        self._jobId = jobId
+        self._breakOnError = jobSettings.breakOnError
+        self._resultCache = jobSettings.resultCache
+        self._timeBudget.start_job(jobSettings.fileTimeBudget)
+        if self._resultCache is not None:
+            self._resultCache.open()
+        # Paths to measure may be relative to the folder the job was run in
+        # A missing folder is a job error, not a lost connection to the Job
         try:
-            while True:
-                (target, command, payload) = self._controlQueue.get_nowait()
-                log.cc(3, "command - {}, {}".format(target, command))
-                if target == self.name:
-                    myCommand = command
-                    break
-                else:
-                    otherCommands.append((target, command, payload))
+            os.chdir(jobSettings.folder)
+        except OSError as e:
+            raise utils.JobException(uistrings.STR_ErrorJobFolder.format(
+                    jobSettings.folder, str(e)))
+
+    def _read_config_queue(self):
+        '''
+        Wait for the next item from our config queue, which is either a list
+        of new config entries or settings for a job
+        Returns job settings, or None if config entries were read
+        '''
+        try:
+            configItem = self._configQueue.get(True, CONFIG_GET_TIMEOUT)
         except Empty:
-            pass
-        finally:
-            if 'EXIT' == myCommand:
-                log.cc(2, "COMMAND: EXIT")
-                self._continueProcessing = False
-            if otherCommands:
-                log.cc(4, "replacing conmmands - {}".format(otherCommands))
-                utils.put_commands(self._controlQueue, otherCommands, 
-                                    CONTROL_QUEUE_TIMEOUT)
+            raise utils.JobException("FATAL EXCEPTION - Config queue empty")
+        configItem = self._copy_config_item(configItem)
+        if isinstance(configItem, JobSettings):
+            return configItem
+        log.cc(2, "GOT {} config entries".format(len(configItem)))
+        self._configRegistry.add(configItem)
+        return None
 
+    def _check_for_stop(self):
+        '''
+        The stop event is only set if the Job is terminating
+        '''
+        if self._continueProcessing and self._stopEvent.is_set():
+            log.cc(2, "STOP event")
+            self._continueProcessing = False
         return self._continueProcessing
 
     #-------------------------------------------------------------------------
@@ -174,11 +345,14 @@ class Worker( Process ):
         (   path,
             deltaPath,
             fileName,
-            configItems,
-            options,
-            numFilesInFolder
+            configIds,
+            numFilesInFolder,
+            fileStats
             ) = workItem
 
+        self._currentFileStart = time.time()
+        self._timeBudget.start_file()
+        configItems = self._get_config_entries(configIds)
         self._currentFilePath = os.path.join(path, fileName)
         log.file(3, "Processing: {}".format(self._currentFilePath))
 
@@ -189,28 +363,60 @@ class Worker( Process ):
         module = None
         continueProcessing = True
         try:
-            for configItem in configItems:
+            lineClassKeys = self._get_line_class_keys(configItems, deltaFilePath, fileStats)
+            for configItem, lineClassKey in zip(configItems, lineClassKeys):
                 if not self._check_for_stop():
                     break
                 module = configItem.module
-                self._open_file(module, deltaFilePath)
-
-                #
-                # Synchronus delegation to the measure module defined in the config file
-                #
-                module.process_file(
-                        self._currentFilePath,
-                        self._currentFileIterator,
-                        configItem,
-                        numFilesInFolder,
-                        self.file_measured_callback)
 
+                # Reuse results from the cache if file content and config match
+                cacheKey = self._get_cache_key(module, configItem, deltaFilePath, fileStats)
+                if cacheKey is not None:
+                    surveyResults = self._resultCache.get(cacheKey)
+                    if surveyResults is not None:
+                        module.process_cached_file(
+                                self._currentFilePath,
+                                surveyResults,
+                                configItem,
+                                numFilesInFolder,
+                                self.file_measured_callback,
+                                fileStats=fileStats)
+                        continue
+
+                with self._timeBudget.measuring(self._get_time_budget(module)):
+                    fileLines = self._get_file_lines(
+                            module, lineClassKey, deltaFilePath, fileStats)
+
+                    #
+                    # Synchronus delegation to the measure module defined in the config file
+                    #
+                    module.process_file(
+                            self._currentFilePath,
+                            fileLines,
+                            configItem,
+                            numFilesInFolder,
+                            self.file_measured_callback,
+                            fileStats=fileStats)
+
+                if cacheKey is not None:
+                    self._resultCache.put(cacheKey, module.survey_results())
+
+        except utils.MeasureTimeExceeded as e:
+            log.file(1, "Time budget exceeded: {} {}".format(self._currentFilePath, e.pattern))
+            if e.pattern is not None:
+                budgetDetail = uistrings.STR_ErrorMeasureTimeBudgetRegex.format(e.pattern)
+            else:
+                budgetDetail = uistrings.STR_ErrorMeasureTimeBudgetEntry.format(str(configItem))
+            self._currentFileErrors.append(
+                    uistrings.STR_ErrorMeasureTimeBudget.format(
+                            self._currentFilePath, e.budget, budgetDetail))
+            continueProcessing = not self._breakOnError
         except utils.FileMeasureError as e:
             log.stack(2)
             self._currentFileErrors.append(
                     uistrings.STR_ErrorMeasuringFile.format(
                             self._currentFilePath, str(e)))
-            continueProcessing = not options.breakOnError
+            continueProcessing = not self._breakOnError
         except EnvironmentError as e:
             log.stack(2)
             if e.errno == EACCES:
@@ -221,7 +427,7 @@ class Worker( Process ):
                 self._currentFileErrors.append(
                         uistrings.STR_ErrorOpeningMeasureFile_Except.format(
                                 self._currentFilePath, str(e)))
-            continueProcessing = not options.breakOnError
+            continueProcessing = not self._breakOnError
         except Exception as e:
             # Treat exceptions from measuring the file as file errors 
             exc = str(type(e)) + " " + str(e)
@@ -236,13 +442,113 @@ class Worker( Process ):
             self._file_complete()
         return continueProcessing
 
-    def _open_file(self, module, deltaFilePath):
+    def _get_config_entries(self, configIds):
+        '''
+        Look up config entries for a work item, reading any entries we
+        don't have yet from the config queue. The Job puts new entries in our
+        config queue before the package that uses them, so they will arrive.
+        '''
+        configItems = []
+        for configId in configIds:
+            configItem = self._configRegistry.get(configId)
+            while configItem is None:
+                if self._read_config_queue() is not None:
+                    raise utils.JobException(
+                            "FATAL EXCEPTION - Config entry {} not received".format(configId))
+                configItem = self._configRegistry.get(configId)
+            configItems.append(configItem)
+        return configItems
+
+    def _get_time_budget(self, module):
+        '''
+        Custom csmodules may not support time budgets for config entries
+        '''
+        try:
+            return module.time_budget()
+        except AttributeError:
+            return None
+
+    def _get_cache_key(self, module, configItem, deltaFilePath, fileStats):
+        '''
+        Returns key for the current file and config in the result cache, or
+        None if results can't be cached. The file is hashed once for all
+        config entries.
+        '''
+        if self._resultCache is None or deltaFilePath is not None:
+            return None
+        try:
+            signature = module.survey_signature(configItem)
+        except AttributeError:
+            # Custom csmodules may not support result caching
+            return None
+        if signature is None:
+            return None
+        if self._currentFileHash is None:
+            try:
+                self._currentFileHash = resultcache.file_content_hash(
+                        self._currentFilePath, fileStats)
+            except EnvironmentError:
+                return None
+        # Extension is included since it can decide whether a file is surveyed
+        _root, fileExt = os.path.splitext(self._currentFilePath)
+        return self._resultCache.make_key(self._currentFileHash, fileExt.lower() + signature)
+
+    def _get_line_class_keys(self, configItems, deltaFilePath, fileStats):
+        '''
+        Returns the key for each config entry's classified lines, for entries
+        whose modules share a line_class_signature, or None for entries that
+        read the file themselves
+        '''
+        lineClassKeys = [None] * len(configItems)
+        if len(configItems) < 2 or deltaFilePath is not None:
+            return lineClassKeys
+        signatures = []
+        for configItem in configItems:
+            try:
+                signatures.append(configItem.module.line_class_signature())
+            except AttributeError:
+                # Custom csmodules may not support classifying lines
+                signatures.append(None)
+        sharedSignatures = set(signature for signature in signatures if
+                signature is not None and signatures.count(signature) > 1)
+        if not sharedSignatures:
+            return lineClassKeys
+        try:
+            if utils.get_file_size(self._currentFilePath, fileStats) > CLASSIFY_MAX_FILE_BYTES:
+                return lineClassKeys
+        except EnvironmentError:
+            return lineClassKeys
+        return [signature if signature in sharedSignatures else None for
+                signature in signatures]
+
+    def _get_file_lines(self, module, lineClassKey, deltaFilePath, fileStats):
+        '''
+        Returns the file iterator, or lines classified once for all entries
+        with the same lineClassKey. If lines can't be classified, each entry
+        surveys the file as usual, which reports any error with the line.
+        '''
+        if lineClassKey in self._currentClassifiedLines:
+            return self._currentClassifiedLines[lineClassKey]
+        self._open_file(module, deltaFilePath, fileStats)
+        if lineClassKey is None:
+            return self._currentFileIterator
+        try:
+            classifiedLines = module.classify_lines(self._currentFileIterator)
+        except Exception as e:
+            log.file(1, "Lines not classified: {} -> {}".format(self._currentFilePath, str(e)))
+            self._open_file(module, deltaFilePath, fileStats)
+            return self._currentFileIterator
+        self._currentClassifiedLines[lineClassKey] = classifiedLines
+        return classifiedLines
+
+    def _open_file(self, module, deltaFilePath, fileStats):
         '''
         Open can be expensive operation, so for the nominal case cache the
         current file iterator for use with multiple config entries.
         '''
         self._currentFileIterator = module.open_file(self._currentFilePath,
-                                     deltaFilePath, self._currentFileIterator)
+                                     deltaFilePath, self._currentFileIterator,
+                                     fileStats=fileStats)
 
     def _close_current_file(self):
         '''
@@ -255,20 +561,24 @@ class Worker( Process ):
             except AttributeError:
                 pass
             self._currentFileIterator = None
+        self._currentFileHash = None
+        self._currentClassifiedLines = {}
 
     #-------------------------------------------------------------------------
 
     def _file_complete(self):
         '''
-        Cache the output from the measurement callbacks for current file
+        Cache the output from the measurement callbacks for current file,
+        along with the time taken to measure it
+        Files without output are included so the Job gets their time
         '''
         if self._currentFileOutput or self._currentFileErrors:
-            self._currentOutput.append(
-                    ( self._currentFilePath, self._currentFileOutput, 
-                        self._currentFileErrors ) )
             log.file(3, "Caching results: {}".format(self._currentFilePath))
         else:
             log.file(3, "No measures for: {}".format(self._currentFilePath))
+        self._currentOutput.append(
+                ( self._currentFilePath, self._currentFileOutput, 
+                    self._currentFileErrors, time.time() - self._currentFileStart ) )
         self._currentFileOutput = []
         self._currentFileErrors = []
 
@@ -277,13 +587,154 @@ class Worker( Process ):
         Send any cached results back to main process's out thread
         This is a set of results for config measure of every file
         in the last work package
+        The output queue is bounded, so wait while it is full unless
+        the Job is stopping us
+        If the results are written to our result ring, only their slot in
+        the ring is put in the queue
+        '''
+        outputItem = self._currentOutput
+        if self._resultRing is not None:
+            ringSlot = self._resultRing.write(self._currentOutput)
+            if ringSlot is not None:
+                outputItem = ringSlot
+        while True:
+            try:
+                self._outputQueue.put(outputItem, True, OUT_PUT_TIMEOUT)
+                log.cc(3, "OUT - PUT {} items".format(len(self._currentOutput)))
+                break
+            except Full:
+                log.cc(3, "OUT - FULL")
+                if not self._check_for_stop():
+                    break
+        self._currentOutput = []
+
+
+
+
+class Worker( WorkerMixin, Process ):
+    '''
+    The worker class executes as separate processes spawned by the Job
+    '''
+    def __init__(self, inputQueue, outputQueue, errorQueue, stopEvent, configQueue,
+                    context, num, jobName=WORKER_PROC_BASENAME):
+        '''
+        Init is called in the parent process
+        '''
+        Process.__init__(self, name=jobName + str(num))
+        WorkerMixin.__init__(self, inputQueue, outputQueue, errorQueue,
+                stopEvent, configQueue, context)
+        log.cc(2, "Initialized new process: {}".format(self.name))
+
+    def run(self):
+        '''
+        Process entry point - set up debug/profile context
         '''
         try:
-            self._outputQueue.put(self._currentOutput, True, OUT_PUT_TIMEOUT)
-            log.cc(3, "OUT - PUT {} items".format(len(self._currentOutput)))
-        except Full:
-            raise utils.JobException("FATAL EXCEPTION - Out Queue full, can't put")
+            log.set_context(self._dbgContext)
+            self._run_profiled()
+        except Exception as e:
+            self._report_exception(e)
+        except KeyboardInterrupt:
+            log.cc(1, "Ctrl-c occurred in job worker loop")
+            self._outputQueue.cancel_join_thread()
         finally:
-            self._currentOutput = []
+            log.cc(1, "TERMINATING")
+            self._close_result_cache()
+            # Orderly shutdown, clean up queues  
+            # Input queue may still have work if we are stopping early, so
+            # cancel_join_thread (don't wait for it to clear)
+            self._inputQueue.close()
+            self._inputQueue.cancel_join_thread()
+            # The Job waits for the last package we posted (e.g., when we stop
+            # for break on error), so flush the output queue unless a hard stop
+            self._outputQueue.close()
+            self._outputQueue.join_thread()
+            self._configQueue.close()
+            self._configQueue.cancel_join_thread()
+            # Join error queue to make sure errors are flushed
+            self._errorQueue.close()
+            self._errorQueue.join_thread()
+            log.cc(2, "TERMINATED")
 
 
+class ThreadWorker( WorkerMixin, threading.Thread ):
+    '''
+    Worker that runs as a thread in the Job's process, with thread queues
+    Python builds without the GIL can measure files on threads in parallel,
+    without pickling config entries and output between processes.
+    '''
+    def __init__(self, inputQueue, outputQueue, errorQueue, stopEvent, configQueue,
+                    context, num, jobName=WORKER_PROC_BASENAME):
+        threading.Thread.__init__(self, name=jobName + str(num), daemon=True)
+        WorkerMixin.__init__(self, inputQueue, outputQueue, errorQueue,
+                stopEvent, configQueue, context)
+        # The profiler only profiles one thread at a time
+        self._profileName = None
+        log.cc(2, "Initialized new thread: {}".format(self.name))
+
+    def run(self):
+        try:
+            self._run_profiled()
+        except Exception as e:
+            self._report_exception(e)
+        finally:
+            log.cc(1, "TERMINATING")
+            self._close_result_cache()
+
+    def _copy_config_item(self, configItem):
+        '''
+        csmodules hold state for the file being measured, and the result
+        cache holds a database connection, so each thread makes its own
+        copy of what it receives, as a worker process would
+        '''
+        return pickle.loads(pickle.dumps(configItem, pickle.HIGHEST_PROTOCOL))
+
+
+class InlineWorker( WorkerMixin ):
+    '''
+    Worker that measures packages on the Job's main thread as they are
+    placed in the input queue, which avoids starting workers for small jobs
+    Provides the parts of the Process interface the Job uses.
+    '''
+    def __init__(self, inputQueue, outputQueue, errorQueue, stopEvent, configQueue,
+                    context, num, jobName=WORKER_PROC_BASENAME):
+        WorkerMixin.__init__(self, inputQueue, outputQueue, errorQueue,
+                stopEvent, configQueue, context)
+        self.name = jobName + str(num)
+        self._started = False
+        # Measuring is included in the profile of the main thread
+        self._profileName = None
+
+    def start(self):
+        self._started = True
+
+    def is_alive(self):
+        return self._started and self._continueProcessing
+
+    def join(self, timeout=None):
+        pass
+
+    def measure_queued(self):
+        '''
+        Measure packages placed in the input queue, or finish on the exit
+        sentinel. Exceptions are reported as a worker process would, and the
+        package is lost, but later packages are still measured (as other
+        worker processes would) unless breaking on errors.
+        '''
+        while self.is_alive() and self._check_for_stop():
+            try:
+                taskItem = self._inputQueue.get_nowait()
+            except Empty:
+                break
+            if taskItem is WORKER_EXIT:
+                log.cc(2, "GOT exit sentinel")
+                self._continueProcessing = False
+                break
+            try:
+                self._measure_package(taskItem)
+            except Exception as e:
+                self._report_exception(e)
+                self._currentOutput = []
+                self._continueProcessing = not self._breakOnError
+        if not self._continueProcessing:
+            self._close_result_cache()
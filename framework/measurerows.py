@@ -0,0 +1,148 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    MeasureRow
+    Compact encoding of measures and analysis results sent from workers
+
+    Every measures dict repeats the same measure names ("file.nbnc",
+    "dir1".."dir8", etc.), and many of the same values (directory names,
+    tags, ranks). Packages written to result rings (see resultring.py)
+    are encoded with:
+
+      - A schema table of the column names used in the package, so each
+        set of measures from a config entry's module sends its names once
+      - Rows as a schema ID and a tuple of values
+      - A string dictionary for the package, so equal string values are
+        one object, which marshal sends once and reuses
+
+    In the main process, rows are decoded to MeasureRows, which hold their
+    schema and values tuple instead of a dict. They can be used as a dict,
+    and are converted to one if changed (e.g., by dupe filtering), while
+    the Delimited writer places their values by the schema's columns.
+'''
+
+from collections.abc import MutableMapping, ItemsView
+
+
+def encode_package(filesOutput):
+    '''
+    Called in the worker process
+    Returns filesOutput with measures and analysis dicts encoded as rows
+    '''
+    schemaIds = {}
+    strings = {}
+
+    def encode_row(measures):
+        columns = tuple(measures)
+        schemaId = schemaIds.get(columns)
+        if schemaId is None:
+            schemaId = len(schemaIds)
+            schemaIds[columns] = schemaId
+        return (schemaId, tuple(
+                strings.setdefault(value, value) if type(value) is str else value
+                    for value in measures.values()))
+
+    encodedFiles = [
+            (filePath,
+                [(encode_row(measures), [encode_row(result) for result in analysisResults])
+                    for measures, analysisResults in outputList],
+                errorList, measureTime)
+            for filePath, outputList, errorList, measureTime in filesOutput]
+    return (list(schemaIds), encodedFiles)
+
+
+def decode_package(encodedPackage):
+    '''
+    Called in the output thread
+    Returns the package's output with MeasureRows for measures and analysis
+    '''
+    schemaColumns, encodedFiles = encodedPackage
+    schemas = [RowSchema(columns) for columns in schemaColumns]
+    return [
+            (filePath,
+                [(MeasureRow(schemas[schemaId], values),
+                        [MeasureRow(schemas[resultId], resultValues) for
+                            resultId, resultValues in analysisResults])
+                    for (schemaId, values), analysisResults in outputList],
+                errorList, measureTime)
+            for filePath, outputList, errorList, measureTime in encodedFiles]
+
+
+class RowSchema( object ):
+    '''
+    Column names of a set of rows, and the position of each name
+    '''
+    __slots__ = ('columns', 'positions')
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.positions = dict((name, pos) for pos, name in enumerate(self.columns))
+
+    def __reduce__(self):
+        return (RowSchema, (self.columns,))
+
+
+class MeasureRow( MutableMapping ):
+    '''
+    Measures or an analysis result as a schema and tuple of values
+    Changes convert the row to a dict, after which it is no longer compact
+    '''
+    __slots__ = ('schema', 'values', '_items')
+
+    def __init__(self, schema, values):
+        self.schema = schema
+        self.values = values
+        self._items = None
+
+    def is_compact(self):
+        return self._items is None
+
+    def __getitem__(self, name):
+        if self._items is not None:
+            return self._items[name]
+        return self.values[self.schema.positions[name]]
+
+    def __contains__(self, name):
+        if self._items is not None:
+            return name in self._items
+        return name in self.schema.positions
+
+    def __iter__(self):
+        if self._items is not None:
+            return iter(self._items)
+        return iter(self.schema.columns)
+
+    def __len__(self):
+        if self._items is not None:
+            return len(self._items)
+        return len(self.values)
+
+    def items(self):
+        return RowItems(self)
+
+    def __setitem__(self, name, value):
+        self._as_dict()[name] = value
+
+    def __delitem__(self, name):
+        del self._as_dict()[name]
+
+    def clear(self):
+        self._items = {}
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def _as_dict(self):
+        if self._items is None:
+            self._items = dict(zip(self.schema.columns, self.values))
+        return self._items
+
+
+class RowItems( ItemsView ):
+    '''
+    Iterates compact rows without a lookup for each name
+    '''
+    def __iter__(self):
+        row = self._mapping
+        if row.is_compact():
+            return zip(row.schema.columns, row.values)
+        return iter(row._items.items())
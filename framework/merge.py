@@ -0,0 +1,154 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Merging output from sharded jobs
+
+    A job run with "-shard i/n" measures only the files whose path hash
+    falls in its shard (see folderwalk.py), so a large job can be run on
+    several machines. The merge combines the delimited output files from
+    each shard into one set of output files:
+
+      - Files with the same name from each shard are merged together,
+        so output redirected by config "OUT:" tags is kept separate
+      - Columns are reconciled by writing the rows through writer.Delimited,
+        which adds columns that only some shards have, as it does when new
+        measures show up partway through a job
+      - Summary totals of key measures are recalculated from the rows
+
+    Rows are written shard by shard, so they are not in the order of an
+    unsharded job.
+'''
+
+import os
+import csv
+from numbers import Number
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from . import cmdlineapp
+from . import writer
+from . import utils
+from .uistrings import *
+
+
+# Delimiters used by surveyor output, found from the header row
+DELIMITERS = ('\t', '\xB6', ',')
+
+# Rows for the measures from one config entry for one file are written
+# together, with a row for each analysis result. These columns identify
+# the file, and the measures are totaled once for the rows that share them
+FILE_KEY_COLUMNS = ('fileAbsPath', 'file.fullName', 'fileName')
+FILE_KEY_PREFIX = 'dir'
+
+# Key measures totaled by surveyor.py, except those from analysis results
+SUMMARY_MEASURES = (cmdlineapp.SurveyorCmdLine.SummaryToInclude -
+        set(['routine.complexity']))
+
+
+def shard_files(shardPaths):
+    '''
+    Group shard output files by file name, in the order given
+    Folders are searched for output files from the shard
+    '''
+    filesByName = {}
+    for shardPath in shardPaths:
+        if os.path.isdir(shardPath):
+            filePaths = [os.path.join(shardPath, fileName) for
+                    fileName in sorted(os.listdir(shardPath)) if
+                    os.path.splitext(fileName)[1].lower() == '.csv']
+        elif os.path.isfile(shardPath):
+            filePaths = [shardPath]
+        else:
+            raise utils.InputException(STR_ErrorBadPath.format(shardPath))
+        for filePath in filePaths:
+            filesByName.setdefault(os.path.basename(filePath), []).append(filePath)
+    return filesByName
+
+
+class ShardMerger( object ):
+    '''
+    Merges shard output files into outDir, keeping totals of the rows
+    and key measures for display
+    '''
+    def __init__(self, outDir, status_callback):
+        self._outDir = outDir
+        self._status_callback = status_callback
+        self.numShardFiles = 0
+        self.numMeasureSets = 0
+        self.numRows = 0
+        self.totals = {}
+
+    def merge(self, shardPaths):
+        filesByName = shard_files(shardPaths)
+        if not filesByName:
+            raise utils.InputException(STR_ErrorMergeNoFiles)
+        for fileName, filePaths in sorted(filesByName.items()):
+            outPath = os.path.abspath(os.path.join(self._outDir, fileName))
+            if outPath in [os.path.abspath(filePath) for filePath in filePaths]:
+                raise utils.InputException(STR_ErrorMergeOverwrite.format(outPath))
+            self._merge_files(fileName, filePaths)
+
+    def _merge_files(self, fileName, filePaths):
+        '''
+        The first shard's column order is kept, and columns from other
+        shards are added at the end
+        '''
+        outWriter = None
+        try:
+            for filePath in filePaths:
+                log.file(1, "Merging: {}".format(filePath))
+                with open(filePath, 'r', encoding='utf-8', newline='') as shardFile:
+                    delimiter = self._find_delimiter(shardFile.readline())
+                    shardFile.seek(0)
+                    reader = csv.reader(shardFile, delimiter=delimiter)
+                    colNames = next(reader, None)
+                    if colNames is None:
+                        continue
+                    if outWriter is None:
+                        outWriter = writer.Delimited(delimiter, self._status_callback,
+                                self._outDir, fileName, True, colNames)
+                    prevMeasuresKey = None
+                    for rowValues in reader:
+                        row = dict(zip(colNames, rowValues))
+                        outWriter.write_items(row, [])
+                        measuresKey = self._measures_key(row)
+                        if measuresKey != prevMeasuresKey:
+                            self._add_to_totals(row)
+                            self.numMeasureSets += 1
+                            prevMeasuresKey = measuresKey
+                        self.numRows += 1
+                self.numShardFiles += 1
+        finally:
+            if outWriter is not None:
+                outWriter.close_files()
+
+    @staticmethod
+    def _find_delimiter(headerLine):
+        for delimiter in DELIMITERS:
+            if delimiter in headerLine:
+                return delimiter
+        return DELIMITERS[-1]
+
+    @staticmethod
+    def _measures_key(row):
+        return tuple((name, value) for name, value in row.items() if
+                name in FILE_KEY_COLUMNS or name in SUMMARY_MEASURES or
+                name.startswith(FILE_KEY_PREFIX))
+
+    def _add_to_totals(self, row):
+        '''
+        As with surveyor.py, numbers are added and other values are counted
+        '''
+        for measureName, value in row.items():
+            if value and measureName in SUMMARY_MEASURES:
+                increment = self._number(value)
+                if not isinstance(increment, Number):
+                    increment = 1
+                self.totals[measureName] = self.totals.get(measureName, 0) + increment
+
+    @staticmethod
+    def _number(value):
+        for numType in (int, float):
+            try:
+                return numType(value)
+            except ValueError:
+                pass
+        return value
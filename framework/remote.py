@@ -0,0 +1,456 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Remote workers
+
+    Spreads a job across machines: the Job runs as a coordinator, and
+    worker agents on other machines connect to it over TCP. Each agent runs
+    the jobworker measure loop on work packages sent by the coordinator,
+    so the files to measure must be available to agents at the same paths
+    (on a shared or replicated file system).
+
+    In the Job, each remote worker is an AgentLink thread that stands in for
+    a worker process: it takes packages from the task queue, sends them to
+    the agent it is connected to, and puts the agent's output and errors in
+    the output and error queues. A link that loses its agent puts the package
+    the agent was measuring back in the task queue for another agent, and
+    waits for a new agent to connect.
+
+    Agents connect to the coordinator, and keep trying to reconnect if the
+    coordinator is not running or the connection is lost, so they can be
+    left running between jobs. Messages are pickled (config entries and
+    output are sent as they are to worker processes), so connections are
+    authenticated with a key shared by the coordinator and agents.
+
+        coordinator -> agent:  ('CONFIG', [(id, ConfigEntry), ...])
+                               ('JOB', JobSettings)
+                               ('PACKAGE', (jobId, workItems))
+                               ('EXIT', None)
+        agent -> coordinator:  ('OUTPUT', [(filePath, output, errors, time), ...])
+                               ('EXCEPTION', exception)
+
+    Without an address, the coordinator listens on localhost and starts
+    its agents as local processes, which is used to test remote jobs.
+'''
+
+import os
+import sys
+import time
+import socket
+import threading
+from multiprocessing import Process
+from multiprocessing import connection as mpconnection
+from queue import Queue, Empty, Full
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from . import jobworker
+from . import configregistry
+from . import uistrings
+from . import utils
+
+
+AUTHKEY_ENV_VAR = 'SURVEYOR_AUTHKEY'
+AUTHKEY_TEST_BYTES = 32
+
+LOCAL_HOST = '127.0.0.1'
+LINK_BASENAME = "Link"
+AGENT_PROC_BASENAME = "Agent"
+
+# Seconds to wait at various points
+# Links and the accept loop wake every LINK_POLL_TIMEOUT to check for stopping
+LINK_POLL_TIMEOUT = 0.4
+QUEUE_FULL_TIMEOUT = 0.4
+AGENT_RECONNECT_SECONDS = 2.0
+AGENT_EXIT_TIMEOUT = 3.0
+# Agents that don't finish authenticating in time are dropped
+AGENT_HANDSHAKE_TIMEOUT = 10.0
+
+# Messages between the coordinator and agents
+MSG_CONFIG = 'CONFIG'
+MSG_JOB = 'JOB'
+MSG_PACKAGE = 'PACKAGE'
+MSG_EXIT = 'EXIT'
+MSG_OUTPUT = 'OUTPUT'
+
+
+def parse_address(addressStr):
+    '''
+    Returns (host, port) for a 'host:port' string; the host may be empty
+    for the coordinator to listen on all interfaces
+    '''
+    host, _sep, port = addressStr.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        port = -1
+    if not _sep or not 0 < port < 65536:
+        raise utils.InputException(uistrings.STR_ErrorRemoteAddress.format(addressStr))
+    return host, port
+
+def auth_key():
+    '''
+    The key shared by a coordinator and its agents, from the environment
+    '''
+    authKey = os.environ.get(AUTHKEY_ENV_VAR)
+    if not authKey:
+        raise utils.InputException(uistrings.STR_ErrorRemoteAuthKey.format(AUTHKEY_ENV_VAR))
+    return authKey.encode('utf-8')
+
+
+class Coordinator( object ):
+    '''
+    Accepts connections from agents for the Job's AgentLinks
+    Connections are authenticated by the link that takes them, so a slow
+    or bad client does not hold up other agents.
+    '''
+    def __init__(self, address, context):
+        self._context = context
+        self._localAgents = None
+        if address is None:
+            self._authKey = os.urandom(AUTHKEY_TEST_BYTES)
+            self._localAgents = []
+            address = (LOCAL_HOST, 0)
+        else:
+            self._authKey = auth_key()
+        try:
+            self._serverSocket = socket.create_server(address)
+        except OSError as e:
+            raise utils.JobException(uistrings.STR_ErrorRemoteListen.format(address, str(e)))
+        self._serverSocket.settimeout(LINK_POLL_TIMEOUT)
+        self.address = self._serverSocket.getsockname()[:2]
+        self._connections = Queue()
+        self._closed = threading.Event()
+        self._acceptThread = threading.Thread(
+                target=self._accept, name="AgentAccept", daemon=True)
+        self._acceptThread.start()
+        log.msg(1, "Coordinator listening on: {}".format(self.address))
+
+    def next_connection(self, stopEvent):
+        '''
+        Wait for an authenticated connection from an agent
+        Returns None if stopEvent is set first
+        '''
+        while not stopEvent.is_set():
+            try:
+                agentSocket = self._connections.get(True, LINK_POLL_TIMEOUT)
+            except Empty:
+                continue
+            connection = self._authenticate(agentSocket)
+            if connection is not None:
+                return connection
+        return None
+
+    def _authenticate(self, agentSocket):
+        '''
+        Returns the connection if the agent authenticates within
+        AGENT_HANDSHAKE_TIMEOUT, or None. A client that stops answering is
+        shut down by a timer, which ends the blocked challenge read.
+        '''
+        agentSocket.setblocking(True)
+        watchSocket = agentSocket.dup()
+        connection = mpconnection.Connection(agentSocket.detach())
+        timedOut = threading.Event()
+        def timeout():
+            timedOut.set()
+            try:
+                watchSocket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        timer = threading.Timer(AGENT_HANDSHAKE_TIMEOUT, timeout)
+        timer.start()
+        authenticated = False
+        try:
+            mpconnection.deliver_challenge(connection, self._authKey)
+            mpconnection.answer_challenge(connection, self._authKey)
+            authenticated = True
+        except (mpconnection.AuthenticationError, EOFError, OSError) as e:
+            log.msg(1, "Agent connection refused: {}".format(str(e)))
+        finally:
+            timer.cancel()
+            timer.join()
+            watchSocket.close()
+        # The timer may have shut down the connection just as it succeeded
+        if not authenticated or timedOut.is_set():
+            if timedOut.is_set():
+                log.msg(1, "Agent authentication timed out")
+            connection.close()
+            return None
+        return connection
+
+    def link_started(self):
+        '''
+        Without an address to listen on, an agent process is started on
+        this machine for each link
+        '''
+        if self._localAgents is not None:
+            agent = AgentWorker(self.address, self._authKey, self._context,
+                    len(self._localAgents) + 1, reconnect=False)
+            agent.start()
+            self._localAgents.append(agent)
+
+    def close(self):
+        self._closed.set()
+        self._acceptThread.join(LINK_POLL_TIMEOUT * 2)
+        self._serverSocket.close()
+        try:
+            while True:
+                self._connections.get_nowait().close()
+        except Empty:
+            pass
+        for agent in self._localAgents or []:
+            agent.join(AGENT_EXIT_TIMEOUT)
+            if agent.is_alive():
+                agent.terminate()
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                agentSocket, agentAddress = self._serverSocket.accept()
+            except socket.timeout:
+                continue
+            except OSError as e:
+                log.msg(1, "Coordinator stopped accepting: {}".format(str(e)))
+                break
+            log.cc(1, "Agent connected from: {}".format(agentAddress))
+            self._connections.put(agentSocket)
+
+
+class AgentLink( threading.Thread ):
+    '''
+    Stands in for a worker in the Job, sending packages to a remote agent
+    Takes the same queues as a worker; config entries and job settings from
+    the config queue are kept, so they can be sent to a new agent if the
+    link's agent is lost.
+    '''
+    def __init__(self, inputQueue, outputQueue, errorQueue, stopEvent, configQueue,
+                    context, num, coordinator):
+        threading.Thread.__init__(self, name=LINK_BASENAME + str(num), daemon=True)
+        self._inputQueue = inputQueue
+        self._outputQueue = outputQueue
+        self._errorQueue = errorQueue
+        self._stopEvent = stopEvent
+        self._configQueue = configQueue
+        self._coordinator = coordinator
+        self._configEntries = []
+        self._jobSettings = None
+        self._currentPackage = None
+
+    def start(self):
+        threading.Thread.start(self)
+        self._coordinator.link_started()
+
+    def run(self):
+        try:
+            while self._serve_next_agent():
+                pass
+        except Exception as e:
+            log.msg(1, "EXCEPTION, stopping link: " + str(e))
+            self._errorQueue.put_nowait(('EXCEPTION', e))
+        finally:
+            log.cc(1, "TERMINATING")
+
+    def _serve_next_agent(self):
+        '''
+        Returns False when the link is done, or True to wait for another
+        agent after losing one
+        '''
+        connection = self._coordinator.next_connection(self._stopEvent)
+        if connection is None:
+            return False
+        log.cc(1, "{} connected to agent".format(self.name))
+        try:
+            self._serve_agent(connection)
+            return False
+        except (EOFError, OSError) as e:
+            log.msg(1, "{} lost agent: {}".format(self.name, repr(e)))
+            self._redispatch()
+            return True
+        finally:
+            connection.close()
+
+    def _serve_agent(self, connection):
+        '''
+        Send the agent one package at a time until the Job sends our exit
+        sentinel or stops us. A new agent first gets everything sent to
+        the link's prior agents.
+        '''
+        self._read_config_queue()
+        if self._configEntries:
+            connection.send((MSG_CONFIG, self._configEntries))
+        if self._jobSettings is not None:
+            connection.send((MSG_JOB, self._jobSettings))
+
+        while not self._stopEvent.is_set():
+            if self._currentPackage is None:
+                try:
+                    taskItem = self._inputQueue.get(True, LINK_POLL_TIMEOUT)
+                except Empty:
+                    continue
+                if taskItem is jobworker.WORKER_EXIT:
+                    log.cc(2, "GOT exit sentinel")
+                    connection.send((MSG_EXIT, None))
+                    return
+                # The Job puts config for the package in our queue first
+                for message in self._read_config_queue():
+                    connection.send(message)
+                self._currentPackage = taskItem
+                connection.send((MSG_PACKAGE, taskItem))
+            elif connection.poll(LINK_POLL_TIMEOUT):
+                self._receive(connection.recv())
+
+    def _read_config_queue(self):
+        '''
+        Returns messages for the agent from anything new in our config queue
+        '''
+        messages = []
+        try:
+            while True:
+                configItem = self._configQueue.get_nowait()
+                if isinstance(configItem, jobworker.JobSettings):
+                    # The result cache is local to this machine
+                    configItem = jobworker.JobSettings(configItem.jobId,
+                            configItem.folder, configItem.breakOnError,
+                            fileTimeBudget=configItem.fileTimeBudget)
+                    self._jobSettings = configItem
+                    messages.append((MSG_JOB, configItem))
+                else:
+                    self._configEntries.extend(configItem)
+                    messages.append((MSG_CONFIG, configItem))
+        except Empty:
+            pass
+        return messages
+
+    def _receive(self, message):
+        messageType, payload = message
+        if MSG_OUTPUT == messageType:
+            log.cc(3, "{} received {} items".format(self.name, len(payload)))
+            self._currentPackage = None
+            self._put_output(payload)
+        else:
+            # An exception stops the agent's package, as it would for a worker
+            if 'EXCEPTION' == messageType:
+                self._currentPackage = None
+            self._errorQueue.put_nowait(message)
+
+    def _put_output(self, output):
+        while not self._stopEvent.is_set():
+            try:
+                self._outputQueue.put(output, True, QUEUE_FULL_TIMEOUT)
+                return
+            except Full:
+                log.cc(3, "OUT - FULL")
+
+    def _redispatch(self):
+        '''
+        Put the package a lost agent was measuring back in the task queue
+        '''
+        if self._currentPackage is None:
+            return
+        log.cc(1, "{} redispatching package: {} files".format(
+                self.name, len(self._currentPackage[1])))
+        while not self._stopEvent.is_set():
+            try:
+                self._inputQueue.put(self._currentPackage, True, QUEUE_FULL_TIMEOUT)
+                break
+            except Full:
+                log.cc(3, "Task queue full")
+        self._currentPackage = None
+
+
+class AgentWorker( jobworker.WorkerMixin, Process ):
+    '''
+    Worker process that measures packages from a coordinator
+    The worker's queues are replaced by the connection, and each connection
+    starts with a new config registry, since config IDs belong to the
+    coordinator's job.
+    '''
+    def __init__(self, address, authKey, context, num, reconnect=True):
+        Process.__init__(self, name=AGENT_PROC_BASENAME + str(num))
+        self._channel = self.Channel()
+        jobworker.WorkerMixin.__init__(self, self._channel, self._channel, self._channel,
+                None, None, context)
+        self._address = address
+        self._authKey = authKey
+        self._reconnect = reconnect
+
+    def run(self):
+        try:
+            log.set_context(self._dbgContext)
+            self._stopEvent = threading.Event()
+            while True:
+                connection = self._connect()
+                if connection is None:
+                    break
+                self._serve_coordinator(connection)
+                if not self._reconnect:
+                    break
+        except mpconnection.AuthenticationError as e:
+            # Retrying with the wrong key won't help
+            sys.stdout.write(uistrings.STR_ErrorAgentAuth.format(self._address, str(e)))
+        except KeyboardInterrupt:
+            log.cc(1, "Ctrl-c occurred in agent")
+        finally:
+            log.cc(1, "TERMINATING")
+
+    def _connect(self):
+        '''
+        Returns a connection to the coordinator, trying until one is made
+        if we reconnect, or None
+        '''
+        while True:
+            try:
+                return mpconnection.Client(self._address, authkey=self._authKey)
+            except (EOFError, OSError) as e:
+                log.cc(2, "Agent connect failed: {}".format(str(e)))
+                if not self._reconnect:
+                    return None
+            time.sleep(AGENT_RECONNECT_SECONDS)
+
+    def _serve_coordinator(self, connection):
+        log.cc(1, "Agent connected to: {}".format(self._address))
+        self._configQueue = Queue()
+        self._configRegistry = configregistry.ConfigRegistry()
+        self._channel.reset(connection, self._configQueue)
+        self._jobId = None
+        self._currentOutput = []
+        self._continueProcessing = True
+        try:
+            self._run_profiled()
+        except (EOFError, OSError) as e:
+            log.msg(1, "Agent lost coordinator: {}".format(repr(e)))
+        except Exception as e:
+            try:
+                self._report_exception(e)
+            except (EOFError, OSError):
+                pass
+        finally:
+            self._close_result_cache()
+            connection.close()
+
+    class Channel( object ):
+        '''
+        Stands in for the worker's input, output, and error queues
+        Config entries and job settings received while waiting for a
+        package are placed in the worker's config queue.
+        '''
+        def __init__(self):
+            self._connection = None
+            self._configQueue = None
+
+        def reset(self, connection, configQueue):
+            self._connection = connection
+            self._configQueue = configQueue
+
+        def get(self):
+            while True:
+                messageType, payload = self._connection.recv()
+                if MSG_PACKAGE == messageType:
+                    return payload
+                elif MSG_EXIT == messageType:
+                    return jobworker.WORKER_EXIT
+                self._configQueue.put_nowait(payload)
+
+        def put(self, output, block=True, timeout=None):
+            self._connection.send((MSG_OUTPUT, output))
+
+        def put_nowait(self, error):
+            self._connection.send(error)
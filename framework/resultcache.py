@@ -0,0 +1,166 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    ResultCache
+    Persistent cache of measurement results across job runs
+
+    Results from csmodule surveys are stored by a key made from a hash of
+    the file content and the config entry signature (verb, module, options,
+    params, and csmodule version), so files that have not changed since a
+    previous run do not need to be measured again.
+
+    The cache is a SQLite database, which allows all jobworker processes to
+    read and write it concurrently. Cache problems are never fatal to a job;
+    they are traced and treated as cache misses.
+'''
+
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from . import archive
+
+
+CACHE_FILE_NAME = 'surveyor.cache'
+CACHE_DB_TIMEOUT = 30.0
+DEFAULT_CACHE_MAX_MB = 1024
+
+# The total size of results is checked every EVICT_CHECK_PUTS puts, and if
+# over the max, least recently used results are removed in batches until
+# under EVICT_TARGET of the max
+EVICT_CHECK_PUTS = 256
+EVICT_BATCH_SIZE = 256
+EVICT_TARGET = 0.8
+
+FILE_READ_CHUNK = 65536
+
+
+def file_content_hash(filePath, fileStats=None):
+    '''
+    Returns hex digest of the file's contents
+    '''
+    contentHash = hashlib.sha1()
+    with archive.open_binary(filePath, fileStats) as fileToHash:
+        while True:
+            chunk = fileToHash.read(FILE_READ_CHUNK)
+            if not chunk:
+                break
+            contentHash.update(chunk)
+    return contentHash.hexdigest()
+
+
+class ResultCache( object ):
+    '''
+    Created by the Job and passed to each worker, which opens its own
+    connection to the cache database once in the worker process
+    '''
+    def __init__(self, cacheFolder, maxMb=DEFAULT_CACHE_MAX_MB):
+        self._cachePath = os.path.join(cacheFolder, CACHE_FILE_NAME)
+        self._maxBytes = maxMb * 1024 * 1024
+        self._db = None
+        self._putsSinceEvict = 0
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        '''
+        Called in the process that will use the cache
+        '''
+        try:
+            folder = os.path.dirname(self._cachePath)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder, exist_ok=True)
+            self._db = sqlite3.connect(self._cachePath,
+                            timeout=CACHE_DB_TIMEOUT, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY, results BLOB, bytes INTEGER, used REAL)''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+            log.cc(1, "Opened result cache: {}".format(self._cachePath))
+        except (sqlite3.Error, EnvironmentError) as e:
+            log.msg(1, "Result cache not available: {} -- {}".format(self._cachePath, str(e)))
+            self._close_db()
+
+    def close(self):
+        if self._db is not None:
+            log.cc(1, "Result cache hits: {}  misses: {}".format(self.hits, self.misses))
+            self._evict()
+            self._close_db()
+
+    def make_key(self, contentHash, signature):
+        return hashlib.sha1((contentHash + signature).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        '''
+        Returns the cached results for the key, or None
+        '''
+        if self._db is None:
+            return None
+        results = None
+        try:
+            row = self._db.execute(
+                    'SELECT results FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                results = pickle.loads(row[0])
+                self._db.execute('UPDATE results SET used = ? WHERE key = ?',
+                        (time.time(), key))
+        except Exception as e:
+            # Truncated or stale rows can fail to unpickle with most any error
+            log.msg(1, "Result cache read failed: {}".format(str(e)))
+            results = None
+        if results is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        log.file(3, "Result cache {}: {}".format('HIT' if results is not None else 'MISS', key))
+        return results
+
+    def put(self, key, results):
+        if self._db is None:
+            return
+        try:
+            resultsBlob = pickle.dumps(results, pickle.HIGHEST_PROTOCOL)
+            self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                    (key, resultsBlob, len(resultsBlob), time.time()))
+        except (sqlite3.Error, pickle.PicklingError) as e:
+            log.msg(1, "Result cache write failed: {}".format(str(e)))
+            return
+        self._putsSinceEvict += 1
+        if self._putsSinceEvict >= EVICT_CHECK_PUTS:
+            self._evict()
+
+    #-------------------------------------------------------------------------
+
+    def _evict(self):
+        '''
+        Remove least recently used results until the cache is under the target size
+        '''
+        self._putsSinceEvict = 0
+        try:
+            totalBytes = self._db.execute('SELECT SUM(bytes) FROM results').fetchone()[0]
+            if totalBytes is None or totalBytes <= self._maxBytes:
+                return
+            targetBytes = self._maxBytes * EVICT_TARGET
+            while totalBytes > targetBytes:
+                oldest = self._db.execute(
+                        'SELECT key, bytes FROM results ORDER BY used LIMIT ?',
+                        (EVICT_BATCH_SIZE,)).fetchall()
+                if not oldest:
+                    break
+                self._db.executemany('DELETE FROM results WHERE key = ?',
+                        [(key,) for key, _bytes in oldest])
+                totalBytes -= sum([resultBytes for _key, resultBytes in oldest])
+            log.cc(1, "Result cache evicted to {} bytes".format(totalBytes))
+        except sqlite3.Error as e:
+            log.msg(1, "Result cache eviction failed: {}".format(str(e)))
+
+    def _close_db(self):
+        if self._db is not None:
+            try:
+                self._db.close()
+            except sqlite3.Error:
+                pass
+            self._db = None
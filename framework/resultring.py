@@ -0,0 +1,173 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    ResultRing
+    Shared memory ring buffers for results from worker processes
+
+    Search and routines jobs can send millions of measure rows from workers,
+    and pickling them through the output queue's pipe, then unpickling them
+    in the main process, becomes the bottleneck. Each worker process has a
+    ring of shared memory that it writes its result packages to, encoded
+    with marshal, which is compact and is decoded without the per-object
+    work of unpickling. Only a small RingSlot giving where the package is
+    in the ring is placed in the output queue, which keeps the packages
+    in order with other items in the queue.
+
+    Each ring has one writer (its worker) and one reader (the output
+    thread), which reads packages in the order they were written. The
+    worker keeps its own count of bytes written, and the reader stores its
+    count of bytes released in the ring's header, so there is no locking.
+
+    If a package can't be encoded with marshal, or there isn't room for it
+    in the ring, the worker sends it through the output queue as before.
+
+    Rings are sized to share the free space in shared memory between the
+    workers, since writing past what is available can kill the worker
+    instead of raising an error. If that leaves too little for each ring,
+    or the rings can't be created, all results use the output queue.
+
+    Packages in the ring are encoded as compact rows (see measurerows.py).
+'''
+
+import os
+import struct
+import marshal
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from . import measurerows
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+# Largest ring size for each worker; memory is only committed as the ring
+# is used, so rings only use part of the free shared memory space
+RING_BYTES = 16 * 1024 * 1024
+RING_MIN_BYTES = 256 * 1024
+RING_SHARE_OF_FREE = 0.5
+SHARED_MEMORY_FOLDER = '/dev/shm'
+
+# The header holds the count of bytes the reader has released
+RING_HEADER_FORMAT = '<Q'
+RING_HEADER_BYTES = struct.calcsize(RING_HEADER_FORMAT)
+
+
+def create_rings(numRings, ringBytes=RING_BYTES):
+    '''
+    Returns a ring for each worker, or no rings if shared memory is not
+    available, in which case results are sent through the output queue
+    '''
+    if shared_memory is None or numRings < 1:
+        return []
+    ringBytes = _fit_ring_bytes(numRings, ringBytes)
+    if ringBytes < RING_MIN_BYTES:
+        log.msg(1, "Not enough shared memory for results, using output queue")
+        return []
+    rings = []
+    try:
+        for ringNum in range(numRings):
+            rings.append(ResultRing(ringNum, ringBytes))
+    except EnvironmentError as e:
+        log.msg(1, "Shared memory not available for results: {}".format(str(e)))
+        for ring in rings:
+            ring.unlink()
+        return []
+    log.cc(2, "Result rings: {} x {} bytes".format(numRings, ringBytes))
+    return rings
+
+def _fit_ring_bytes(numRings, ringBytes):
+    '''
+    Reduce ringBytes so the rings fit in their share of the free space
+    in shared memory, where that can be checked
+    '''
+    try:
+        stats = os.statvfs(SHARED_MEMORY_FOLDER)
+    except (AttributeError, EnvironmentError):
+        return ringBytes
+    freeBytes = stats.f_bavail * stats.f_frsize
+    ringShare = int(freeBytes * RING_SHARE_OF_FREE) // numRings - RING_HEADER_BYTES
+    return min(ringBytes, ringShare)
+
+
+class RingSlot( object ):
+    '''
+    Placed in the output queue for a package written to a ring; start is
+    the count of bytes written to the ring before the package
+    '''
+    def __init__(self, ringNum, start, length):
+        self.ringNum = ringNum
+        self.start = start
+        self.length = length
+
+
+class ResultRing( object ):
+    '''
+    Created in the Job's process and inherited by (or pickled by name to)
+    the worker process that writes to it
+    '''
+    def __init__(self, ringNum, ringBytes=RING_BYTES):
+        self.ringNum = ringNum
+        self._ringBytes = ringBytes
+        self._memory = shared_memory.SharedMemory(
+                create=True, size=RING_HEADER_BYTES + ringBytes)
+        struct.pack_into(RING_HEADER_FORMAT, self._memory.buf, 0, 0)
+        self._written = 0
+
+    def write(self, package):
+        '''
+        Called in the worker process
+        Returns the RingSlot for the package, or None if it needs to be
+        sent through the output queue
+        '''
+        try:
+            data = marshal.dumps(measurerows.encode_package(package))
+        except ValueError as e:
+            log.cc(2, "Result package not sent through ring: {}".format(str(e)))
+            return None
+        length = len(data)
+        if length > self._ringBytes - (self._written - self._released()):
+            log.cc(3, "Result ring full")
+            return None
+        self._copy_in(self._written % self._ringBytes, memoryview(data))
+        ringSlot = RingSlot(self.ringNum, self._written, length)
+        self._written += length
+        return ringSlot
+
+    def read(self, ringSlot):
+        '''
+        Called in the output thread, for slots in the order they were written
+        Returns the package and releases its space in the ring
+        '''
+        start = RING_HEADER_BYTES + ringSlot.start % self._ringBytes
+        end = start + ringSlot.length
+        ringEnd = RING_HEADER_BYTES + self._ringBytes
+        if end <= ringEnd:
+            encodedPackage = marshal.loads(self._memory.buf[start:end])
+        else:
+            encodedPackage = marshal.loads(bytes(self._memory.buf[start:ringEnd]) +
+                    bytes(self._memory.buf[RING_HEADER_BYTES:end - self._ringBytes]))
+        struct.pack_into(RING_HEADER_FORMAT, self._memory.buf, 0,
+                ringSlot.start + ringSlot.length)
+        return measurerows.decode_package(encodedPackage)
+
+    def unlink(self):
+        '''
+        Called by the Job's process when workers are done with the ring;
+        the memory is freed once every process has let go of it
+        '''
+        try:
+            self._memory.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _released(self):
+        return struct.unpack_from(RING_HEADER_FORMAT, self._memory.buf, 0)[0]
+
+    def _copy_in(self, offset, data):
+        start = RING_HEADER_BYTES + offset
+        firstBytes = min(len(data), self._ringBytes - offset)
+        self._memory.buf[start:start + firstBytes] = data[:firstBytes]
+        if firstBytes < len(data):
+            self._memory.buf[RING_HEADER_BYTES:
+                    RING_HEADER_BYTES + len(data) - firstBytes] = data[firstBytes:]
@@ -36,6 +36,22 @@ STR_ErrorOpeningOutput = """
     Cannot open output file: {}
       {}
 """
+STR_ErrorResumeOutput = """
+    Output file is shorter than when the job was checkpointed: {}
+"""
+STR_ErrorCheckpointOutput = """
+    Checkpoints need delimited measurement output written to files.
+"""
+STR_ErrorNoCheckpoint = """
+    There is no checkpoint to resume: {}
+"""
+STR_ErrorCheckpointJob = """
+    The checkpoint is for a job with different options or folder: {}
+    Run with the same options, from the same folder, to resume it.
+"""
+STR_ErrorOutProcess = """
+    The output process can't be used with checkpoints or -keepInventory.
+"""
 STR_ErrorMeasuringFile = """
     Error measururing: {}
        {}
@@ -46,6 +62,12 @@ STR_ErrorOpeningMeasureFile_Except = """
 STR_ErrorOpeningMeasureFile_Access = """
     Exclusive lock or lack permissions: {}
 """
+STR_ErrorMeasureTimeBudget = """
+    Stopped measuring after {1:n} CPU seconds: {0}
+       {2}
+"""
+STR_ErrorMeasureTimeBudgetRegex = "While matching: {}"
+STR_ErrorMeasureTimeBudgetEntry = "While measuring with: {}"
 STR_ExceptionMeasureFile = """
     Exception measuring: {}
     {}"""
@@ -125,6 +147,12 @@ STR_UpdatePathDetailed = " ({0:0.3f}) {1:60}\n"
 STR_CompressedFile = " Compressed file: {0:58}\n\n"
 STR_LongProcessingFile = " Long processing ({0:0.1f}): {1:50}\n\n"
 
+STR_OutProcessNotUsed = "Output process needs forked worker processes; using an output thread"
+STR_OutProcessNotUsedDaemon = "Output process isn't forked by the survey daemon; using an output thread"
+STR_Resuming = "Resuming from checkpoint, {:n} files already measured"
+STR_CheckpointResume = """
+ Resume the job from its last checkpoint with --resume
+"""
 STR_UserInterrupt = """
 
  ===  Measurement aborted by user  ===
@@ -135,6 +163,60 @@ STR_Error = """
  ===  Error occurred, measurement aborted  ===
 
 """
+STR_DaemonListening = "Surveyor daemon with {} workers, listening on: {}\n"
+STR_DaemonStopped = "Surveyor daemon stopped\n"
+STR_ErrorDaemonNoSockets = """
+    The survey daemon requires Unix domain sockets, which are not
+    available on this platform.
+"""
+STR_ErrorDaemonConnect = """
+    Unable to connect to the survey daemon at: {0}
+    {1}
+
+    Start the daemon with surveyord.py, or run surveyor.py directly.
+"""
+STR_ErrorDaemonRunning = """
+    A survey daemon is already running at: {0}
+"""
+STR_ErrorDaemonSocketFolder = """
+    The survey daemon's socket folder must be a folder owned by, and only
+    accessible to, the current user: {0}
+"""
+STR_ErrorDaemonDisconnect = """
+    The survey daemon closed the connection before the job finished.
+"""
+STR_AgentConnecting = "Surveyor agent with {} workers, connecting to: {}\n"
+STR_AgentStopped = "Surveyor agent stopped\n"
+STR_ErrorRemoteAddress = """
+    Remote address must be host:port, with a port from 1 to 65535: {0}
+"""
+STR_ErrorRemoteListen = """
+    Unable to listen for remote agents at: {0}
+    {1}
+"""
+STR_ErrorAgentAuth = """
+    The coordinator at {0} did not accept this agent's key: {1}
+"""
+STR_ErrorJobFolder = """
+    Unable to measure in the job's folder on this machine: {0}
+    {1}
+"""
+STR_ErrorRemoteAuthKey = """
+    Remote workers need a key shared by the coordinator and its agents.
+    Set it in the {0} environment variable.
+"""
+STR_ErrorMergeNoFiles = """
+    No shard output files were found to merge.
+"""
+STR_ErrorMergeOverwrite = """
+    The merged output would overwrite a shard output file: {0}
+    Merge into a different folder.
+"""
+STR_SummaryMerged = """
+ Merged {0:n} shard files
+ Measure sets: {1:n}
+ Measure rows: {2:n}
+"""
 STR_ErrorList = """
 
  ===  MEASUREMENTS ABORTED FOR {} FILES  (first {} displayed below)  ===
@@ -194,6 +276,7 @@ STR_HelpText_Intro = (
  """)
 
 CMDARG_LEADS = '-'
+CMDARG_LONG_LEADS = '--'
 CMDLINE_SEPARATOR = ';'
 CMDARG_HELP = 'h?'
 
@@ -206,6 +289,9 @@ CMDARG_DUPE_PROCESSING = 'e'
 CMDARG_OUTPUT_FILTER = 'f'
 CMDARG_AGGREGATES = 'g'
 CMDARG_INCLUDE_ONLY = 'i'
+CMDARG_ARCHIVES = 'j'
+CMDARG_INCREMENTAL = 'k'
+CMDARG_WALK_THREADS = 'l'
 CMDARG_METADATA = 'm'
 CMDARG_RECURSION = 'n'
 CMDARG_OUTPUT_FILE = 'o'
@@ -214,11 +300,18 @@ CMDARG_QUIET = 'q'
 CMDARG_OUTPUT_TYPE = 'r'
 CMDARG_SKIP = 's'
 CMDARG_SUMMARY_ONLY = 't'
+CMDARG_RESULT_CACHE = 'u'
 CMDARG_DETAILED = 'v'
 CMDARG_NUM_WORKERS = 'w'
+CMDARG_GIT_INDEX = 'x'
 CMDARG_PROFILE = 'y'
 CMDARG_DEBUG = 'z'
 
+# Long options, used when there is no option letter for a command
+CMDARG_LONG_CHECKPOINT = 'checkpoint'
+CMDARG_LONG_RESUME = 'resume'
+CMDARG_LONG_OUT_PROCESS = 'outprocess'
+
 STR_HelpText_Usage = """
  Usage:
 
@@ -234,6 +327,8 @@ STR_HelpText_Options = """
     -s<mode> <filt>   Skip files due to size, name, or locaiton (+)
     -inclPath <filt>  Include only files in paths that match filter (+)
     -nonRecursive     Only scan <pathToMeasure>, do not scan sub-folders
+    -xGitIndex        Only scan files tracked in the git index of <pathToMeasure>
+    -jArchives        Measure files in zip, tar, and gzip archives as folders
 
     -exDupe [thresh]  Exclude duplicate files from measure totals (+)
     -m <metadata>     Modify metadata output (e.g., folder reporting depth) (+)
@@ -246,8 +341,19 @@ STR_HelpText_Options = """
     -progress [len]   Per-file progress on console, max width of [len]
     -verbose [len]    Additional summary information on console, up to [len]
     -z[level][modes]  Debug tracing to console (+)
-    -workers <num>    Use <num> worker processes (default is NumCores-1)
+    -workers [num][:type]  Use [num] workers (default is NumCores-1) run as
+                      [type] processes, threads, inline, or auto (default),
+                      e.g., "-w 4:threads" or "-w :inline"
+                      For remote [host:port], agents connect to measure
+                      packages; without an address, local test agents are used
+    -listThreads <num> List folders ahead of measuring with <num> threads
+    -useCache <path> [MB]  Reuse results for unchanged files, cached in <path>
+    -keepInventory <path>  Only measure files changed since the last run
     -breakOnError     Stop scanning if file error is encountered
+    --checkpoint [secs]  Save progress every [secs], so the job can be resumed
+    --resume          Continue a checkpointed job, appending to its output
+    --outProcess      Write output from its own process, leaving the main
+                      process to walk folders and schedule worker processes
     -quiet            Don't update console status, useful for piping output
 
     -? [name]         Additional help on [name] for items above ending in (+)
@@ -369,12 +475,24 @@ STR_HelpText_Scan_All = """
 CMDARG_SKIP_DIR = 'd'
 CMDARG_SKIP_FILE = 'f'
 CMDARG_SKIP_SIZE = 's'
+CMDARG_SKIP_IGNORE_FILES = 'i'
+CMDARG_SKIP_SHARD = 'h'
+CMDARG_SKIP_TIME = 't'
 STR_HelpText_Skip = """
  Skip folders and/or files that match the given criteria:
 
     -sd <folders>   Skip folders that match <folders>
     -sf <files>     Skip files that match filters in <files>
     -ssize [bytes]  Do not measure files larger than [bytes]
+    -stime <secs>   Stop measuring a file after <secs> of CPU time and report
+                    it as an error; config entries can set their own limit
+                    with OPT:TIME_BUDGET:<secs>
+    -signore        Skip folders and files matched by rules in .gitignore
+                    and .surveyorignore files, loaded as folders are walked
+    -shard <i/n>    Only measure shard <i> of <n>, selected by a hash of each
+                    file's path under <pathToMeasure>; run each shard on a
+                    different machine and combine the output with
+                    surveyormerge.py
 
     Run with the -z2f debug option to see which files are being skipped.
     See framework\\filetype.py for details on the file detection logic.
@@ -610,6 +728,9 @@ STR_ErrorParsingEnd = """
 STR_ErrorParsingValidValue = """
     {0} is not a valid value for {1}
 """
+STR_ErrorParsingShard = """
+    Expecting a shard as <i/n>, with <i> from 1 to <n>: {0}
+"""
 STR_ErrorParsingInt = """
     Expecting integer value folowing: {0}
 """
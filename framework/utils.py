@@ -35,6 +35,17 @@ class CsModuleException(SurveyorException):
 class FileMeasureError(SurveyorException):
     pass
 
+class MeasureTimeExceeded(BaseException):
+    '''
+    Raised when measuring a file runs past its time budget
+    Not derived from Exception, so csmodule handlers for errors in a
+    line don't catch it and carry on measuring
+    '''
+    def __init__(self, budget, pattern=None):
+        super(MeasureTimeExceeded, self).__init__(budget, pattern)
+        self.budget = budget
+        self.pattern = pattern
+
 class AbstractMethod(SurveyorException):
     def __init__(self, obj):
         self.methodName = sys._getframe(1).f_code.co_name
@@ -43,18 +54,6 @@ class AbstractMethod(SurveyorException):
         return "Abstract method called: {}.{}()".format(
             self.className, self.methodName)
 
-#-----------------------------------------------------------------------------
-# Job processing utils
-
-from queue import Full
-
-def put_commands( queue, commands, timeout ):
-    for target, command, payload in commands:
-        try:
-            queue.put((target, command, payload), True, timeout)
-        except Full:
-            raise JobException("FATAL EXCEPTION - Control Queue full, can't put")
-
 #-----------------------------------------------------------------------------
 #  Timing Utils
 
@@ -211,14 +210,29 @@ def match_ranking_label(rankingMap, value):
 #-----------------------------------------------------------------------------
 #  File utils
 
-def get_file_mod_time_str(filePath, dateFormat):
-    # Content modification time, which st_mtime should give across all OS
-    fileStats = os.stat(filePath)
-    return time.strftime(dateFormat, time.localtime(fileStats.st_mtime))
+# File stats are captured once during the folder walk and travel with work
+# items as (size, mtime, inode, archivePath) tuples, so workers don't stat
+# files again; archivePath is only set for files in archives
+FILE_STAT_SIZE = 0
+FILE_STAT_MTIME = 1
+FILE_STAT_INODE = 2
+FILE_STAT_ARCHIVE = 3
 
-def get_file_size(filePath):
-    fileStats = os.stat(filePath)
-    return int(fileStats.st_size)
+def get_file_stats(filePath, dirEntry=None, archivePath=None):
+    # DirEntry caches its stat, which is free for some OS folder listings
+    fileStats = os.stat(filePath) if dirEntry is None else dirEntry.stat()
+    return (int(fileStats.st_size), fileStats.st_mtime, fileStats.st_ino, archivePath)
+
+def get_file_mod_time_str(filePath, dateFormat, fileStats=None):
+    # Content modification time, which st_mtime should give across all OS
+    if fileStats is None:
+        fileStats = get_file_stats(filePath)
+    return time.strftime(dateFormat, time.localtime(fileStats[FILE_STAT_MTIME]))
+
+def get_file_size(filePath, fileStats=None):
+    if fileStats is None:
+        fileStats = get_file_stats(filePath)
+    return fileStats[FILE_STAT_SIZE]
 
 class SurveyorPathParser( object ):
     '''
@@ -16,6 +16,7 @@ from xml.dom import minidom
 
 from code_surveyor.framework import log  # No relative path to share module globals
 from . import configentry
+from . import measurerows
 from . import uistrings
 from . import utils
 
@@ -91,6 +92,19 @@ class MeasureWriter( object ):
     def _fixup_column_headers(self, filename):
         pass
 
+    def checkpoint_state(self):
+        '''
+        Returns what is needed to resume writing output files after a
+        checkpoint (see checkpoint.py)
+        '''
+        raise utils.OutputException(uistrings.STR_ErrorCheckpointOutput)
+
+    def resume_state(self, state):
+        raise utils.OutputException(uistrings.STR_ErrorCheckpointOutput)
+
+    def suspend_files(self):
+        raise utils.OutputException(uistrings.STR_ErrorCheckpointOutput)
+
     #-------------------------------------------------------------------------
 
     def _close(self, fileName, openFile):
@@ -177,10 +191,15 @@ class Delimited( MeasureWriter ):
         # Stash any item Names to place in a particular column order
         self._itemColOrder = itemColOrder
 
+        # For compact rows (see measurerows.py), the column positions for each
+        # schema's names are looked up once per output file
+        self._colSchemaPositions = {}
+
         # Spcecial case console output
         if self.using_console():
             self._colMeasureTracker[self._defFileName] = {}
             self._colMeasureIsDirty[self._defFileName] = False
+            self._colSchemaPositions[self._defFileName] = {}
 
     def write_items(self, measures, analysisResults):
         '''
@@ -192,6 +211,10 @@ class Delimited( MeasureWriter ):
         '''
         outputFile, fileName, isNewFile = self._get_output_file(measures)
 
+        if not isNewFile and self._compact_rows(measures, analysisResults):
+            self._write_compact_rows(outputFile, fileName, measures, analysisResults)
+            return
+
         # If analysis results, create a measurement row for each analysis item 
         # that includes both the measures and the analysis
         outputRows = []
@@ -215,17 +238,37 @@ class Delimited( MeasureWriter ):
         for row in outputRows:
             outputFile.writerow(self._col_output_list(row, fileName))
 
+    @staticmethod
+    def _compact_rows(measures, analysisResults):
+        return (isinstance(measures, measurerows.MeasureRow) and measures.is_compact() and
+                all(isinstance(result, measurerows.MeasureRow) and result.is_compact()
+                        for result in analysisResults))
+
+    def _write_compact_rows(self, outputFile, fileName, measures, analysisResults):
+        '''
+        Write the same rows as for dicts, placing values by the positions of
+        each row's schema columns instead of building a dict for each row
+        Analysis values replace measure values with the same name, as they
+        do when the dicts are combined.
+        '''
+        measureValues = self._col_place_values([], measures, fileName)
+        if not analysisResults:
+            outputFile.writerow(measureValues)
+        for result in analysisResults:
+            outputFile.writerow(self._col_place_values(list(measureValues), result, fileName))
+
     def _get_output_file(self, measures):
         outputFile, fileName, isNew = MeasureWriter._get_output_file(self, measures)
         if isNew:
             self._colMeasureTracker[fileName] = {}
             self._colMeasureIsDirty[fileName] = False
+            self._colSchemaPositions[fileName] = {}
         return outputFile, fileName, isNew
 
-    def _open_file(self, fileName):
+    def _open_file(self, fileName, mode='w'):
         MeasureWriter._open_file(self, fileName)
         filePath = os.path.join(self._outDir, fileName)
-        self._rawFiles[fileName] = open(filePath, 'w', encoding='utf-8', newline='')
+        self._rawFiles[fileName] = open(filePath, mode, encoding='utf-8', newline='')
         outWriter = csv.writer( self._rawFiles[fileName], delimiter=self._delimiter, 
                                 quoting=csv.QUOTE_NONNUMERIC)
         log.file(2, "Opened Delimited Output File: {}".format(filePath))
@@ -236,6 +279,48 @@ class Delimited( MeasureWriter ):
         if self._colMeasureIsDirty[fileName]:
             self._fixup_column_headers(fileName)
 
+    def checkpoint_state(self):
+        '''
+        Flush output files, and return the size and column state of each
+        '''
+        state = {}
+        for fileName, rawFile in self._rawFiles.items():
+            if rawFile.closed:
+                continue
+            rawFile.flush()
+            state[fileName] = (os.fstat(rawFile.fileno()).st_size,
+                    dict(self._colMeasureTracker[fileName]),
+                    self._colMeasureIsDirty[fileName])
+        return state
+
+    def resume_state(self, state):
+        '''
+        Reopen output files from a checkpoint to append to them, dropping
+        anything written after the checkpoint
+        '''
+        for fileName, (fileSize, colTracker, colIsDirty) in state.items():
+            filePath = os.path.join(self._outDir, fileName)
+            try:
+                if os.path.getsize(filePath) < fileSize:
+                    raise utils.OutputException(uistrings.STR_ErrorResumeOutput.format(filePath))
+                os.truncate(filePath, fileSize)
+                self._outputFiles[fileName] = self._open_file(fileName, 'a')
+            except EnvironmentError as e:
+                raise utils.OutputException(uistrings.STR_ErrorOpeningOutput.format(fileName, str(e)))
+            self._colMeasureTracker[fileName] = colTracker
+            self._colMeasureIsDirty[fileName] = colIsDirty
+            self._colSchemaPositions[fileName] = {}
+
+    def suspend_files(self):
+        '''
+        Close output files to be resumed from a checkpoint; fixing column
+        headers is left to the resumed job, since rewriting the files
+        would move the rows from where the checkpoint has them
+        '''
+        for fileName in list(self._outputFiles.keys()):
+            self._rawFiles[fileName].close()
+            del self._outputFiles[fileName]
+
     #-----------------------------------------------------------------------------
     #  Column methods
 
@@ -300,6 +385,28 @@ class Delimited( MeasureWriter ):
                 outputValues.append('')
         return outputValues
 
+    def _col_place_values(self, outputValues, row, outFilename):
+        '''
+        Place a compact row's values in outputValues by the positions of its
+        schema's columns, padded to all columns created for outFilename
+        New columns in the schema are added at the end, as _col_output_list does
+        '''
+        outputFileCols = self._colMeasureTracker[outFilename]
+        schemaPositions = self._colSchemaPositions[outFilename]
+        positions = schemaPositions.get(row.schema.columns)
+        if positions is None:
+            for itemName in row.schema.columns:
+                if itemName not in outputFileCols:
+                    outputFileCols[itemName] = len(outputFileCols)
+                    self._colMeasureIsDirty[outFilename] = True
+            positions = tuple(outputFileCols[itemName] for itemName in row.schema.columns)
+            schemaPositions[row.schema.columns] = positions
+
+        outputValues.extend([''] * (len(outputFileCols) - len(outputValues)))
+        for listPos, itemValue in zip(positions, row.values):
+            outputValues[listPos] = utils.safe_string(itemValue)
+        return outputValues
+
     def _col_create_names_from_keys(self, filename):
         '''
         The dictionary of columns is keyed on names and has the
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Code Surveyor remote agent
+    Measures work packages for a surveyor.py job run with remote workers,
+    reconnecting between jobs (see framework/remote.py)
+
+        surveyoragent.py host:port [-w numWorkers]
+
+    The key shared with the coordinator is set with SURVEYOR_AUTHKEY.
+'''
+
+import os
+import sys
+import signal
+import argparse
+import traceback
+import multiprocessing
+
+SUCCESS = 0
+FAILURE = 1
+
+#  Run agent workers until interrupted, returning result to the shell
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+
+    result = FAILURE
+    try:
+        sys.path.append( os.path.abspath( os.path.dirname(__file__) ) )
+
+        from framework import remote
+        from framework import job
+        from framework import utils
+        from framework.uistrings import STR_AgentConnecting, STR_AgentStopped
+        from code_surveyor.framework import log
+
+        parser = argparse.ArgumentParser(description="Code Surveyor remote agent")
+        parser.add_argument('address')
+        parser.add_argument('-w', dest='numWorkers', type=int,
+                default=job.DEFAULT_NUM_WORKERS)
+        options = parser.parse_args()
+
+        try:
+            address = remote.parse_address(options.address)
+            authKey = remote.auth_key()
+        except utils.SurveyorException as e:
+            print(str(e))
+            sys.exit(result)
+
+        context = (log.get_context(), None)
+        agents = [ remote.AgentWorker(address, authKey, context, num + 1)
+                    for num in range(max(1, options.numWorkers)) ]
+        sys.stdout.write(STR_AgentConnecting.format(len(agents), options.address))
+        # Stop cleanly when killed, as well as with ctrl-c
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            for agent in agents:
+                agent.start()
+            for agent in agents:
+                agent.join()
+        except KeyboardInterrupt:
+            sys.stdout.write(STR_AgentStopped)
+            result = SUCCESS
+
+    except SystemExit:
+        raise
+    except:
+        print("\nA system error occurred while running the Surveyor agent:\n")
+        traceback.print_exc()
+    finally:
+        for child in multiprocessing.active_children():
+            child.terminate()
+        sys.exit(result)
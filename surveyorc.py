@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Code Surveyor daemon client
+    Takes the same arguments as surveyor.py, and runs the job in the
+    daemon started with surveyord.py (see framework/daemon.py)
+    The daemon's socket can be set with the SURVEYOR_SOCKET variable.
+'''
+
+import os
+import sys
+import traceback
+import shutil
+
+SUCCESS = 0
+FAILURE = 1
+
+#  Run the job in the daemon and return status to the shell
+if __name__ == '__main__':
+
+    printWidth = None
+    try:
+        columns, _rows = shutil.get_terminal_size(fallback=(80, 24))
+        printWidth = columns - 1
+    except Exception:
+        pass
+
+    result = FAILURE
+    try:
+        sys.path.append( os.path.abspath( os.path.dirname(__file__) ) )
+
+        from framework import daemon
+        from framework import utils
+
+        try:
+            if daemon.run_client(daemon.default_socket_path(),
+                    sys.argv[1:], sys.stdout, printWidth):
+                result = SUCCESS
+        except utils.SurveyorException as e:
+            print(str(e))
+
+    except KeyboardInterrupt:
+        pass
+    except:
+        print("\nA system error occurred while running Surveyor:\n")
+        traceback.print_exc()
+    finally:
+        sys.exit(result)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Code Surveyor daemon
+    Keeps config files, csmodules, and workers warm between jobs, which
+    are sent with surveyorc.py (see framework/daemon.py)
+
+        surveyord.py [-w numWorkers] [-s socketPath]
+'''
+
+import os
+import sys
+import signal
+import argparse
+import traceback
+import multiprocessing
+
+SUCCESS = 0
+FAILURE = 1
+
+#  Run the daemon until interrupted, returning result to the shell
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+
+    result = FAILURE
+    try:
+        sys.path.append( os.path.abspath( os.path.dirname(__file__) ) )
+
+        from framework import daemon
+        from framework import job
+        from framework import utils
+        from framework.uistrings import STR_DaemonListening, STR_DaemonStopped
+
+        parser = argparse.ArgumentParser(description="Code Surveyor daemon")
+        parser.add_argument('-w', dest='numWorkers', type=int,
+                default=job.DEFAULT_NUM_WORKERS)
+        parser.add_argument('-s', dest='socketPath',
+                default=daemon.default_socket_path())
+        options = parser.parse_args()
+
+        surveyorDaemon = daemon.SurveyorDaemon(
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'surveyor.py'),
+                options.socketPath, max(1, options.numWorkers))
+        sys.stdout.write(STR_DaemonListening.format(options.numWorkers, options.socketPath))
+        # Stop cleanly when killed, as well as with ctrl-c
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            surveyorDaemon.serve()
+        except KeyboardInterrupt:
+            sys.stdout.write(STR_DaemonStopped)
+            result = SUCCESS
+        except utils.SurveyorException as e:
+            print(str(e))
+
+    except SystemExit:
+        raise
+    except:
+        print("\nA system error occurred while running the Surveyor daemon:\n")
+        traceback.print_exc()
+    finally:
+        for child in multiprocessing.active_children():
+            child.terminate()
+        sys.exit(result)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Code Surveyor shard merge
+    Combines the output of jobs run with "-shard i/n" into one set of
+    output files, and displays totals for the merged output
+    (see framework/merge.py)
+
+        surveyormerge.py shardPath [shardPath ...] [-o outFolder]
+
+    Each shardPath is a shard's output file, or a folder with its output.
+'''
+
+import os
+import sys
+import argparse
+import traceback
+
+SUCCESS = 0
+FAILURE = 1
+
+#  Merge the shard output and return status to the shell
+if __name__ == '__main__':
+
+    result = FAILURE
+    try:
+        sys.path.append( os.path.abspath( os.path.dirname(__file__) ) )
+
+        from framework import merge
+        from framework import utils
+        from framework.uistrings import (STR_SummaryMerged, STR_SummaryDetailedTitle,
+                STR_SummaryDetailedMeasureValue, STR_SummaryRunTime)
+
+        parser = argparse.ArgumentParser(description="Code Surveyor shard merge")
+        parser.add_argument('shardPaths', nargs='+')
+        parser.add_argument('-o', dest='outFolder', default=os.curdir)
+        options = parser.parse_args()
+
+        utils.timing_start()
+        try:
+            merger = merge.ShardMerger(options.outFolder,
+                    lambda text: sys.stdout.write(text + '\n'))
+            merger.merge(options.shardPaths)
+        except utils.SurveyorException as e:
+            print(str(e))
+            sys.exit(result)
+
+        sys.stdout.write(STR_SummaryMerged.format(
+                merger.numShardFiles, merger.numMeasureSets, merger.numRows))
+        if merger.totals:
+            sys.stdout.write(STR_SummaryDetailedTitle)
+            for measureName, measureTotal in sorted(merger.totals.items()):
+                sys.stdout.write(STR_SummaryDetailedMeasureValue.format(
+                        measureName, '', measureTotal))
+        sys.stdout.write(STR_SummaryRunTime.format(utils.timing_elapsed()))
+        result = SUCCESS
+
+    except SystemExit:
+        raise
+    except KeyboardInterrupt:
+        pass
+    except:
+        print("\nA system error occurred while merging Surveyor output:\n")
+        traceback.print_exc()
+    finally:
+        sys.exit(result)
@@ -0,0 +1,62 @@
+#---- Code Surveyor, Copyright 2020 Matt Peloquin, MIT License
+'''
+    Tests for command line parsing of worker options (-w)
+
+    Run from the code_surveyor folder:
+        python -m unittest discover tests
+'''
+
+import os
+import sys
+import unittest
+
+# Make sure the folder holding code_surveyor is loaded, as for csmodules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from code_surveyor.framework import log  # No relative path to share module globals
+from code_surveyor.framework import cmdlineapp
+from code_surveyor.framework import cmdlineargs
+from code_surveyor.framework import job
+from code_surveyor.framework import utils
+
+
+def parse_args(*args):
+    '''
+    Returns the job options parsed from the surveyor command line args
+    '''
+    app = cmdlineapp.SurveyorCmdLine()
+    cmdlineargs.SurveyorCmdLineArgs(['surveyor.py'] + list(args), app).parse_args()
+    return app._jobOpt
+
+
+class WorkerOptionsTest( unittest.TestCase ):
+
+    def test_num_workers(self):
+        jobOpt = parse_args('-w', '4')
+        self.assertEqual(jobOpt.numWorkers, 4)
+
+    def test_num_workers_and_type(self):
+        # The path after the option is measured, not taken for a type
+        testFolder = os.path.dirname(os.path.abspath(__file__))
+        jobOpt = parse_args('-w', '4:threads', testFolder)
+        self.assertEqual(jobOpt.numWorkers, 4)
+        self.assertEqual(jobOpt.backend, job.BACKEND_THREADS)
+        self.assertEqual(jobOpt.pathsToMeasure, [testFolder])
+
+    def test_type_only(self):
+        jobOpt = parse_args('-w', ':inline')
+        self.assertEqual(jobOpt.backend, job.BACKEND_INLINE)
+
+    def test_missing_value(self):
+        for args in (['-w'], ['-w', '-q']):
+            with self.assertRaises(utils.InputException):
+                parse_args(*args)
+
+    def test_malformed_value(self):
+        for workers in ('src', '4:', ':', '4:nothreads', '0'):
+            with self.assertRaises(utils.InputException):
+                parse_args('-w', workers)
+
+
+if __name__ == '__main__':
+    unittest.main()